@@ -0,0 +1,307 @@
+"""多进程接入层。
+
+N 个接入进程通过 SO_REUSEPORT 共同监听同一个端口，由内核把新连接分给各进程。
+接入进程负责接受连接、拆帧、解析登录和命令，以及向自己的连接写出消息；
+拍卖状态和出价顺序仍由主进程(序列器进程)里唯一的 AuctionServer 负责。
+两者之间各用一对 Unix 套接字(multiprocessing.Pipe)通信，每次发送一批消息:
+  接入进程 -> 主进程: ('login', 连接号, binary, 用户名, 余额, 最后序号, 令牌) / ('command', 连接号, 命令) / ('closed', 连接号) /
+                    ('throttled', {限流级别: 次数})
+  主进程 -> 接入进程: ('send', 连接号, 数据) / ('synced', 连接号, 订阅) / ('close', 连接号) /
+                    ('broadcast', 拍品编号, 是否当前拍品, 文本, 二进制包, 序号)
+广播只按接入进程各发一次，由接入进程按订阅关系投递给自己的连接，主进程不逐个连接处理。
+限流在接入进程里完成，被丢弃的帧不经过管道；来源地址的连接上限和用户令牌桶按接入进程各算各的。
+"""
+import asyncio
+import collections
+import itertools
+import multiprocessing
+import socket
+import threading
+
+from admission import Admission
+from logs import get_logger, setup_process_logging
+from outbound import AsyncChannel, OutgoingFrames
+import protocol
+
+log = get_logger('acceptor')
+
+
+class AcceptorWorker:
+    """运行在接入进程中"""
+
+    def __init__(self, index, host, port, link, channel_options, admission_options, max_frame):
+        self.index = index
+        self.host = host
+        self.port = port
+        self.link = link
+        self.channel_options = channel_options
+        self.admission = Admission(**admission_options)
+        self.max_frame = max_frame
+        # 限流计数攒到下一次 flush 时一起交给主进程
+        self.throttled = collections.Counter()
+        self.loop = None
+        self.stopping = None
+        self.ids = itertools.count(1)
+        # 连接号 -> {'conn', 'synced', 'lots'}，与主进程里的客户端记录对应
+        self.connections = {}
+        self.pending = []
+
+    def run(self):
+        setup_process_logging(f".acceptor{self.index}")
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = self.loop.create_future()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((self.host, self.port))
+        self.loop.add_reader(self.link.fileno(), self.receive)
+        server = await asyncio.start_server(self.handle_client, sock=sock, backlog=1024)
+        log.info("接入进程正在监听", extra={'host': self.host, 'port': self.port, 'acceptor': self.index})
+        async with server:
+            await self.stopping
+
+    def post(self, message):
+        # 同一轮事件循环里产生的消息合并成一次发送
+        if not self.pending and not self.throttled:
+            self.loop.call_soon(self.flush)
+        self.pending.append(message)
+
+    def flush(self):
+        pending, self.pending = self.pending, []
+        if self.throttled:
+            pending.append(('throttled', dict(self.throttled)))
+            self.throttled.clear()
+        self.link.send(pending)
+
+    def count_throttled(self, scope):
+        if not self.pending and not self.throttled:
+            self.loop.call_soon(self.flush)
+        self.throttled[scope] += 1
+
+    def receive(self):
+        while self.link.poll():
+            messages = self.link.recv()
+            if messages is None:
+                # 主进程要求退出
+                self.loop.remove_reader(self.link.fileno())
+                self.stopping.set_result(None)
+                return
+            for message in messages:
+                self.dispatch(message)
+
+    def dispatch(self, message):
+        kind = message[0]
+        if kind == 'broadcast':
+            _, lot_id, current, text, packet, seq = message
+            frames = OutgoingFrames(text, packet, seq)
+            for client in self.connections.values():
+                if client['synced'] and (lot_id is None or lot_id in client['lots']
+                                         or (not client['lots'] and current)):
+                    frames.send(client['conn'])
+            return
+        client = self.connections.get(message[1])
+        if client is None:
+            return
+        if kind == 'send':
+            client['conn'].send(message[2])
+        elif kind == 'synced':
+            client['lots'] = set(message[2])
+            client['synced'] = True
+        elif kind == 'close':
+            client['conn'].close()
+
+    async def handle_client(self, reader, writer):
+        addr = writer.get_extra_info('peername')
+        if not self.admission.connect(addr[0]):
+            self.count_throttled('address')
+            writer.close()
+            return
+        conn_id = next(self.ids)
+        channel = AsyncChannel(writer, self.loop, **self.channel_options)
+        client = {'conn': channel, 'synced': False, 'lots': set()}
+        self.connections[conn_id] = client
+        decoder = protocol.FrameDecoder(self.max_frame)
+        bucket = self.admission.bucket()
+        codec = None
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for payload in decoder.feed(data):
+                    if codec is None:
+                        codec = protocol.codec_for(payload)
+                        username, balance, last_seq, token = codec.decode_login(payload)
+                        channel.binary = codec.binary
+                        channel.sequenced = last_seq is not None
+                        self.post(('login', conn_id, codec.binary, username, balance, last_seq, token))
+                        continue
+                    scope = self.admission.admit(bucket, username)
+                    if scope is not None:
+                        self.count_throttled(scope)
+                        if bucket.dropped == 1:
+                            OutgoingFrames("请求过于频繁，部分消息已被丢弃。",
+                                           protocol.encode_error('throttled')).send(channel)
+                        continue
+                    command = codec.decode(payload)
+                    # 订阅关系在本进程也记一份，广播时直接过滤
+                    if command[0] == 'SUB':
+                        client['lots'].add(command[1])
+                    elif command[0] == 'UNSUB':
+                        client['lots'].discard(command[1])
+                    self.post(('command', conn_id, command))
+                    if command[0] == 'EXIT':
+                        return
+        except protocol.FrameTooLarge as e:
+            self.count_throttled('frame_size')
+            log.warning("帧长度超过上限，断开连接: %s", e, extra={'addr': str(addr)})
+        except Exception as e:
+            log.warning("处理客户端时发生错误: %s", e, extra={'addr': str(addr)})
+        finally:
+            del self.connections[conn_id]
+            if codec is not None:
+                self.post(('closed', conn_id))
+            channel.close()
+            self.admission.disconnect(addr[0])
+
+
+def acceptor_main(index, host, port, link, channel_options, admission_options, max_frame):
+    AcceptorWorker(index, host, port, link, channel_options, admission_options, max_frame).run()
+
+
+class RemoteChannel:
+    """主进程里代表接入进程中一个连接的对象，对服务器来说与 OutboundChannel 用法相同"""
+
+    def __init__(self, link, conn_id, binary, sequenced):
+        self.link = link
+        self.conn_id = conn_id
+        self.binary = binary
+        self.sequenced = sequenced
+        self.closed = False
+        # 发送队列在接入进程里，这里没有积压可统计
+        self.depth = 0
+        self.dropped = 0
+
+    def send(self, data):
+        if self.closed:
+            return False
+        self.link.post(('send', self.conn_id, data))
+        return True
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.link.post(('close', self.conn_id))
+
+
+class AcceptorLink:
+    """主进程一侧与一个接入进程的连接: 写线程合并待发消息，读线程把登录和命令交给服务器"""
+
+    def __init__(self, index, pipe, process):
+        self.index = index
+        self.pipe = pipe
+        self.process = process
+        # 连接号 -> (用户名, RemoteChannel)
+        self.channels = {}
+        self.queue = collections.deque()
+        self.ready = threading.Condition()
+        self.closing = False
+
+    def post(self, message):
+        with self.ready:
+            self.queue.append(message)
+            self.ready.notify()
+
+    def write(self):
+        while True:
+            with self.ready:
+                while not self.queue:
+                    self.ready.wait()
+                batch = list(self.queue)
+                self.queue.clear()
+            # None 表示让接入进程退出，之前的消息照常发出
+            stop = None in batch
+            if stop:
+                batch = batch[:batch.index(None)]
+            if batch:
+                self.pipe.send(batch)
+            if stop:
+                self.pipe.send(None)
+                return
+
+    def read(self, server):
+        while True:
+            try:
+                messages = self.pipe.recv()
+            except EOFError:
+                if not self.closing:
+                    log.error("接入进程意外退出", extra={'acceptor': self.index})
+                return
+            for message in messages:
+                try:
+                    self.dispatch(server, message)
+                except Exception as e:
+                    log.exception("处理接入进程消息时发生错误: %s", e, extra={'acceptor': self.index})
+
+    def dispatch(self, server, message):
+        kind = message[0]
+        if kind == 'command':
+            entry = self.channels.get(message[1])
+            if entry is not None:
+                server.handle_request(entry[0], entry[1], message[2])
+        elif kind == 'login':
+            _, conn_id, binary, username, balance, last_seq, token = message
+            channel = RemoteChannel(self, conn_id, binary, last_seq is not None)
+            self.channels[conn_id] = (username, channel)
+            server.m_connections.inc()
+            server.m_frames_in.inc()
+            server.register_client(channel, binary, username, balance, last_seq, token)
+        elif kind == 'throttled':
+            for scope, count in message[1].items():
+                server.m_throttled.inc(count, label=scope)
+        elif kind == 'closed':
+            entry = self.channels.pop(message[1], None)
+            if entry is not None:
+                entry[1].closed = True
+                server.remove_client(*entry)
+
+
+class AcceptorPool:
+    """在主进程中启动并管理全部接入进程"""
+
+    def __init__(self, count, host, port, channel_options, admission_options, max_frame):
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            raise OSError("当前系统不支持 SO_REUSEPORT，无法使用多进程接入")
+        self.links = []
+        for index in range(count):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=acceptor_main, daemon=True,
+                                              args=(index, host, port, child_conn, channel_options,
+                                                    admission_options, max_frame))
+            process.start()
+            self.links.append(AcceptorLink(index, parent_conn, process))
+
+    def serve(self, server):
+        for link in self.links:
+            threading.Thread(target=link.write, daemon=True).start()
+            threading.Thread(target=link.read, args=(server,), daemon=True).start()
+        for link in self.links:
+            link.process.join()
+
+    def synced(self, channel, lots):
+        channel.link.post(('synced', channel.conn_id, list(lots)))
+
+    def broadcast(self, lot_id, current, frames):
+        message = ('broadcast', lot_id, current, frames.message, frames.packet, frames.seq)
+        for link in self.links:
+            link.post(message)
+
+    def close(self):
+        for link in self.links:
+            link.closing = True
+            link.post(None)
+        for link in self.links:
+            link.process.join(timeout=1)
@@ -0,0 +1,91 @@
+"""接入限流。
+
+每个连接和每个用户各有一个令牌桶，登录之后的每一帧在解析之前先各取一个令牌，任一个桶空了就直接丢弃该帧，
+不解析也不进入序列器，正常出价者的延迟因此不受刷帧的连接影响。同一来源地址的并发连接数另有上限。
+速率或上限为 0 表示不限制。
+"""
+import threading
+import time
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp', 'dropped')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+        # 连续被丢弃的帧数，只在连接的桶上使用，为 1 时通知客户端
+        self.dropped = 0
+
+    def take(self, now):
+        if not self.rate:
+            return True
+        tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if tokens < 1:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - 1
+        return True
+
+    def full(self, now):
+        return self.tokens + (now - self.stamp) * self.rate >= self.burst
+
+
+class Admission:
+    def __init__(self, conn_rate=50, conn_burst=100, user_rate=100, user_burst=200, max_per_address=0):
+        self.conn_rate = conn_rate
+        self.conn_burst = conn_burst
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_per_address = max_per_address
+        self.users = {}
+        self.addresses = {}
+        # 已经回满的用户桶与新建的桶没有区别，用户数翻倍时清理一次，内存只与活跃用户数有关
+        self.prune_at = 1024
+        self.lock = threading.Lock()
+
+    def connect(self, address):
+        """登记一个来自 address 的连接，超过上限时返回 False，此时不必调用 disconnect"""
+        with self.lock:
+            count = self.addresses.get(address, 0)
+            if self.max_per_address and count >= self.max_per_address:
+                return False
+            self.addresses[address] = count + 1
+            return True
+
+    def disconnect(self, address):
+        with self.lock:
+            count = self.addresses.pop(address, 0) - 1
+            if count > 0:
+                self.addresses[address] = count
+
+    def bucket(self):
+        return TokenBucket(self.conn_rate, self.conn_burst, time.monotonic())
+
+    def admit(self, bucket, username):
+        """允许时返回 None，否则返回被哪一级限流: 'connection' 或 'user'"""
+        now = time.monotonic()
+        if not bucket.take(now):
+            bucket.dropped += 1
+            return 'connection'
+        if self.user_rate:
+            with self.lock:
+                user = self.users.get(username)
+                if user is None:
+                    if len(self.users) >= self.prune_at:
+                        self.prune(now)
+                    user = self.users[username] = TokenBucket(self.user_rate, self.user_burst, now)
+                allowed = user.take(now)
+            if not allowed:
+                bucket.dropped += 1
+                return 'user'
+        bucket.dropped = 0
+        return None
+
+    def prune(self, now):
+        for username in [username for username, user in self.users.items() if user.full(now)]:
+            del self.users[username]
+        self.prune_at = max(1024, 2 * len(self.users))
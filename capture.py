@@ -0,0 +1,92 @@
+"""流量抓包文件。
+
+文件以 MAGIC 开头，之后每条记录为 RECORD 头(类型 时间 连接号 负载长度) + 负载。
+时间为距抓包开始的纳秒数(单调时钟)，连接号按连接建立的先后从 1 开始分配，0 表示与连接无关的记录:
+  META     服务器参数 JSON，只有第一条，回放时按它创建服务器
+  OPEN     新连接，负载为来源地址
+  IN       客户端发来的一帧(不含长度前缀)，从登录帧开始，被限流丢弃的帧也记录
+  OUT      发给客户端的一帧(不含长度前缀)，时间为放入发送队列的时刻
+  CLOSE    连接断开
+  CONTROL  控制操作 JSON，例如 ["start_auction", 大类, 商品]
+  OUTCOME  拍品结果 JSON [拍品编号, 商品, 赢家, 价格, 是否成交]，结算时写一条，
+           停止抓包时为尚未结束的拍品各写一条，是否成交为 null
+调用方只把记录放进队列，打包和写文件在后台线程完成，队列取空时才 flush。
+"""
+import itertools
+import json
+import queue
+import struct
+import threading
+import time
+
+MAGIC = b'AUCTIONCAP1\n'
+RECORD = struct.Struct('>BQII')
+
+META = 0
+OPEN = 1
+IN = 2
+OUT = 3
+CLOSE = 4
+CONTROL = 5
+OUTCOME = 6
+
+
+class CaptureWriter:
+    def __init__(self, path, meta):
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.origin = time.monotonic_ns()
+        self.ids = itertools.count(1)
+        self.queue = queue.SimpleQueue()
+        self.put_json(META, meta)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, kind, conn_id, payload=b''):
+        self.queue.put((kind, time.monotonic_ns() - self.origin, conn_id, payload))
+
+    def put_json(self, kind, value):
+        self.put(kind, 0, json.dumps(value, ensure_ascii=False).encode('utf-8'))
+
+    def open(self, address):
+        """登记新连接，返回分配给它的连接号"""
+        conn_id = next(self.ids)
+        self.put(OPEN, conn_id, str(address).encode('utf-8'))
+        return conn_id
+
+    def run(self):
+        pack = RECORD.pack
+        while True:
+            record = self.queue.get()
+            while True:
+                if record is None:
+                    self.file.close()
+                    return
+                kind, stamp, conn_id, payload = record
+                self.file.write(pack(kind, stamp, conn_id, len(payload)))
+                self.file.write(payload)
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.file.flush()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join(timeout=5)
+
+
+def read_capture(path):
+    """逐条产生 (类型, 纳秒, 连接号, 负载)；服务器被强行终止时末尾可能有半条记录，直接忽略"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"不是抓包文件: {path}")
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            kind, stamp, conn_id, length = RECORD.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield kind, stamp, conn_id, payload
@@ -0,0 +1,275 @@
+"""商品目录索引。
+
+auction_items.json 只在索引缺失或过期时解析一次，生成一个二进制索引文件；之后通过 mmap 按需读取，
+启动时间和常驻内存不随目录大小增长。索引内容:
+  - 商品表: 每个商品编号一条定长记录(名称偏移/长度、小写名称偏移/长度、所属大类)
+  - 大类表: 大类名称及其商品编号列表的位置，用于按大类分页读取
+  - 排序表: 按小写名称排序的商品编号，用于前缀搜索
+  - 名称区和小写名称区: 所有名称的 UTF-8 编码，小写名称区同时用于子串搜索
+商品编号在重建索引时保持不变，新商品追加新编号，删除的商品只留下墓碑记录。
+"""
+from collections.abc import Mapping
+import json
+import mmap
+import os
+import random
+import struct
+import tempfile
+
+MAGIC = b'AUCIDX1\0'
+HEADER = struct.Struct('<8sIIIIIIIII')
+ITEM = struct.Struct('<IHIHI')
+CATEGORY = struct.Struct('<IHII')
+U32 = struct.Struct('<I')
+REMOVED = 0xFFFFFFFF
+
+
+def build_index(json_path, index_path):
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    # 沿用旧索引中的编号，保证同一商品的编号不变
+    entries = []
+    if os.path.exists(index_path):
+        try:
+            with Catalog(index_path) as old:
+                entries = [old.entry(item_id) for item_id in range(old.item_count)]
+        except (ValueError, OSError, struct.error):
+            entries = []
+    ids = {entry: item_id for item_id, entry in enumerate(entries) if entry[0] is not None}
+
+    categories = list(data)
+    category_ids = {name: index for index, name in enumerate(categories)}
+    category_lists = {name: [] for name in categories}
+    live = [None] * len(entries)
+    for category, names in data.items():
+        for name in names:
+            item_id = ids.get((category, name))
+            if item_id is None:
+                item_id = len(entries)
+                entries.append((category, name))
+                live.append(None)
+                ids[(category, name)] = item_id
+            live[item_id] = category
+            category_lists[category].append(item_id)
+
+    names_blob = bytearray()
+    folds_blob = bytearray()
+    item_records = []
+    folded = []
+    for item_id, (category, name) in enumerate(entries):
+        name_bytes = (name or '').encode('utf-8')
+        fold_bytes = (name or '').casefold().encode('utf-8')
+        category_id = category_ids[live[item_id]] if live[item_id] is not None else REMOVED
+        item_records.append(ITEM.pack(len(names_blob), len(name_bytes), len(folds_blob), len(fold_bytes), category_id))
+        names_blob += name_bytes
+        folds_blob += fold_bytes
+        if category_id != REMOVED:
+            folded.append((fold_bytes, item_id))
+    sorted_ids = [item_id for _, item_id in sorted(folded)]
+
+    lists = []
+    category_records = []
+    for name in categories:
+        name_bytes = name.encode('utf-8')
+        category_records.append(CATEGORY.pack(len(names_blob), len(name_bytes), len(lists), len(category_lists[name])))
+        names_blob += name_bytes
+        lists.extend(category_lists[name])
+
+    items_off = HEADER.size
+    categories_off = items_off + ITEM.size * len(item_records)
+    lists_off = categories_off + CATEGORY.size * len(category_records)
+    sorted_off = lists_off + U32.size * len(lists)
+    names_off = sorted_off + U32.size * len(sorted_ids)
+    folds_off = names_off + len(names_blob)
+    header = HEADER.pack(MAGIC, len(item_records), len(category_records), items_off, categories_off,
+                         lists_off, sorted_off, names_off, folds_off, len(folds_blob))
+
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(b''.join(item_records))
+        f.write(b''.join(category_records))
+        f.write(struct.pack(f'<{len(lists)}I', *lists))
+        f.write(struct.pack(f'<{len(sorted_ids)}I', *sorted_ids))
+        f.write(names_blob)
+        f.write(folds_blob)
+    os.replace(tmp_path, index_path)
+
+
+def open_catalog(json_path, index_path=None):
+    """打开目录索引，索引不存在或比 JSON 旧时先重建"""
+    candidates = [index_path] if index_path else [json_path + '.idx',
+                                                   os.path.join(tempfile.gettempdir(), os.path.basename(json_path) + '.idx')]
+    for path in candidates:
+        try:
+            if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(json_path):
+                build_index(json_path, path)
+            return Catalog(path)
+        except OSError:
+            # 打包后的程序目录可能不可写，改用临时目录
+            continue
+    raise OSError(f"无法为 {json_path} 建立索引")
+
+
+class Catalog(Mapping):
+    """基于 mmap 的只读商品目录，按大类名称索引时返回该大类的商品名列表"""
+
+    def __init__(self, index_path):
+        self.file = open(index_path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.item_count, self.category_count, self.items_off, self.categories_off,
+         self.lists_off, self.sorted_off, self.names_off, self.folds_off, self.folds_size) = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError(f"不是商品目录索引: {index_path}")
+        self.category_table = None
+        self.category_cache = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def load_categories(self):
+        if self.category_table is None:
+            table = {}
+            for index in range(self.category_count):
+                name_off, name_len, list_off, count = CATEGORY.unpack_from(self.data, self.categories_off + index * CATEGORY.size)
+                start = self.names_off + name_off
+                table[self.data[start:start + name_len].decode('utf-8')] = (index, list_off, count)
+            self.category_table = table
+        return self.category_table
+
+    def categories(self):
+        return list(self.load_categories())
+
+    def record(self, item_id):
+        return ITEM.unpack_from(self.data, self.items_off + item_id * ITEM.size)
+
+    def name(self, item_id):
+        name_off, name_len, _, _, _ = self.record(item_id)
+        start = self.names_off + name_off
+        return self.data[start:start + name_len].decode('utf-8')
+
+    def folded(self, item_id):
+        _, _, fold_off, fold_len, _ = self.record(item_id)
+        start = self.folds_off + fold_off
+        return self.data[start:start + fold_len]
+
+    def category_name(self, category_id):
+        if category_id == REMOVED:
+            return None
+        name_off, name_len, _, _ = CATEGORY.unpack_from(self.data, self.categories_off + category_id * CATEGORY.size)
+        start = self.names_off + name_off
+        return self.data[start:start + name_len].decode('utf-8')
+
+    def entry(self, item_id):
+        """返回 (大类, 商品名)，已删除的商品大类为 None"""
+        return self.category_name(self.record(item_id)[4]), self.name(item_id)
+
+    def item_ids(self, category, start=0, limit=None):
+        _, list_off, count = self.load_categories()[category]
+        end = count if limit is None else min(count, start + limit)
+        if start >= end:
+            return []
+        return list(struct.unpack_from(f'<{end - start}I', self.data, self.lists_off + (list_off + start) * U32.size))
+
+    def items(self, category, start=0, limit=None):
+        return [self.name(item_id) for item_id in self.item_ids(category, start, limit)]
+
+    def random_item(self):
+        while True:
+            category, name = self.entry(random.randrange(self.item_count))
+            if category is not None:
+                return category, name
+
+    def sorted_id(self, index):
+        return U32.unpack_from(self.data, self.sorted_off + index * U32.size)[0]
+
+    def prefix_search(self, needle):
+        sorted_count = (self.names_off - self.sorted_off) // U32.size
+        low, high = 0, sorted_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.folded(self.sorted_id(middle)) < needle:
+                low = middle + 1
+            else:
+                high = middle
+        while low < sorted_count:
+            item_id = self.sorted_id(low)
+            if not self.folded(item_id).startswith(needle):
+                break
+            yield item_id
+            low += 1
+
+    def item_at_fold_offset(self, offset):
+        # 小写名称按商品编号顺序存放，二分查找偏移所在的商品
+        low, high = 0, self.item_count - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.record(middle)[2] <= offset:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def substring_search(self, needle):
+        end = self.folds_off + self.folds_size
+        position = self.data.find(needle, self.folds_off, end)
+        while position != -1:
+            item_id = self.item_at_fold_offset(position - self.folds_off)
+            _, _, fold_off, fold_len, _ = self.record(item_id)
+            item_end = self.folds_off + fold_off + fold_len
+            if position + len(needle) <= item_end:
+                yield item_id
+                position = self.data.find(needle, item_end, end)
+            else:
+                position = self.data.find(needle, position + 1, end)
+
+    def search(self, text, category=None, limit=20):
+        """先按前缀、再按子串搜索，不区分大小写，返回 [(商品编号, 大类, 商品名)]"""
+        needle = text.casefold().encode('utf-8')
+        if not needle:
+            if category is None:
+                return []
+            return [(item_id, category, self.name(item_id)) for item_id in self.item_ids(category, 0, limit)]
+        category_id = self.load_categories()[category][0] if category is not None else None
+        results = []
+        seen = set()
+        for source in (self.prefix_search(needle), self.substring_search(needle)):
+            for item_id in source:
+                if item_id in seen:
+                    continue
+                seen.add(item_id)
+                record = self.record(item_id)
+                if record[4] == REMOVED or (category_id is not None and record[4] != category_id):
+                    continue
+                results.append((item_id, self.category_name(record[4]), self.name(item_id)))
+                if len(results) >= limit:
+                    return results
+        return results
+
+    def lookup(self, name, category=None):
+        """按完整商品名查找，返回 (商品编号, 大类) 或 None"""
+        for item_id, item_category, item_name in self.search(name, category, limit=50):
+            if item_name == name:
+                return item_id, item_category
+        return None
+
+    def __getitem__(self, category):
+        items = self.category_cache.get(category)
+        if items is None:
+            items = self.items(category)
+            self.category_cache[category] = items
+        return items
+
+    def __iter__(self):
+        return iter(self.load_categories())
+
+    def __len__(self):
+        return self.category_count
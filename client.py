@@ -1,111 +1,96 @@
-import socket
-import threading
+import queue
 import tkinter as tk
 from tkinter import messagebox, scrolledtext
 
+from clientcore import ClientCore, ClientThread
+from logs import get_logger, setup_logging
+import protocol
+
+log = get_logger('client')
+
 class AuctionClient:
     def __init__(self):
         self.host = '116.198.198.29'
         self.port = 5200
         self.username = None
         self.balance = 1000
-        self.won_items = []
-        self.conn = None
         self.root = None
-        self.current_item = "无"
         self.pending_bid = None
-
-    def send_message(self, message):
-        if isinstance(message, str):
-            message_bytes = message.encode()
-        elif isinstance(message, bytes):
-            message_bytes = message
-        else:
-            raise ValueError("Message must be a string or bytes")
-
-        message_length = len(message_bytes)
-        length_prefix = message_length.to_bytes(4, byteorder='big')
-        self.conn.send(length_prefix + message_bytes)
-
+        self.closing = False
+        self.reconnecting = False
+        # 网络部分在后台线程的事件循环里运行，界面只在主线程里取事件、改控件
+        self.core = None
+        self.network = None
 
     def connect(self):
-        self.conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            self.conn.connect((self.host, self.port))
-            print(f"发送消息: {self.username},{self.balance}")
-            self.send_message(f"{self.username},{self.balance}".encode())
-            self.receive_thread = threading.Thread(target=self.receive_messages)
-            self.receive_thread.start()
+            self.core = ClientCore(self.host, self.port, self.username, self.balance)
+            self.network = ClientThread(self.core)
+            self.network.connect()
             self.initial_window.destroy()
             self.start_auction_interface()
         except Exception as e:
+            if self.network is not None:
+                self.network.stop()
             messagebox.showerror("连接错误", f"无法连接到服务器: {e}")
 
-    def receive_messages(self):
+    def poll_events(self):
         while True:
             try:
-                
-                length_prefix = self.conn.recv(4)
-                if not length_prefix:
-                    break 
-
-                
-                message_length = int.from_bytes(length_prefix, byteorder='big')
-
-                
-                message = self.conn.recv(message_length).decode()
-                if message:
-                    print(f"接收到的消息: {message}")
-                    self.send_balance()
-                    if message.startswith("ITEM"):
-                        self.current_item = message.split("'")[1]
-                        self.root.after(0, self.update_current_item)
-                    elif message.startswith("WINNER"):
-                        item_won = message.split()[1]
-                        self.won_items.append(item_won)
-                        self.root.after(0, self.update_won_items_display)
-                    elif message.startswith("SUCCEED"):
-                        print(f"接收到交易成功消息: {message}")
-                        parts = message.split()
-                        if len(parts) > 1:
-                            amount = int(parts[1])
-                            self.balance -= amount
-                            self.balance_label.config(text=f"当前余额: {self.balance}")
-                            print(f"交易成功: {amount} 元已从账户中扣除，当前余额为: {self.balance} 元。")
-                        self.current_item = "无"
-                        self.root.after(0, self.update_current_item)
-                        self.pending_bid = None
-                    elif message == "END_OF_AUCTION":
-                        self.current_item = "无"
-                        self.root.after(0, self.update_current_item)
-                    else:
-                        self.root.after(0, self.update_message_area, message)
-                else:
-                    break
-            except Exception as e:
-                print(f"接收数据时发生错误：{e}")
-                messagebox.showerror("连接错误", f"接收数据时发生错误：{e}")
-                self.conn.close()
+                event = self.network.events.get_nowait()
+            except queue.Empty:
                 break
-
-    def send_balance(self):
-        self.send_message(f"BALANCE {self.balance}")
-
-    def place_bid(self):
+            self.handle_event(event)
+        self.root.after(50, self.poll_events)
+
+    def handle_event(self, event):
+        kind = event[0]
+        if kind == 'BALANCE':
+            self.update_balance()
+        elif kind in ('LOT', 'DEADLINE', 'SNAPSHOT', 'END'):
+            self.update_current_item()
+            if kind == 'LOT':
+                self.update_message_area(f"拍卖开始: '{event[2]}' 当前价 {event[3]}。")
+        elif kind == 'LEADER':
+            self.update_message_area(f"{event[2]} 是当前的最高出价者，出价 {event[3]}")
+        elif kind == 'SOLD':
+            self.update_message_area(f"赢家{event[3]} 赢得了商品 '{event[2]}'，成交价 {event[4]}")
+        elif kind == 'WON':
+            log.info("交易成功", extra={'lot_id': event[1], 'price': event[3]})
+            self.pending_bid = None
+            self.update_won_items_display()
+        elif kind == 'REJECTED':
+            self.update_message_area(protocol.REJECT_MESSAGES.get(event[1], f"ERROR: {event[1]}"))
+        elif kind == 'TEXT':
+            self.update_message_area(event[1])
+        elif kind == 'DISCONNECTED':
+            log.warning("连接断开: %s", event[1])
+            self.reconnecting = True
+            self.update_message_area("连接断开，正在重连...")
+        elif kind == 'CONNECTED' and self.reconnecting:
+            self.reconnecting = False
+            self.update_message_area("已重新连接")
+        elif kind == 'CLOSED' and not self.closing:
+            messagebox.showerror("连接错误", f"无法重新连接到服务器：{event[1]}")
+
+    def place_bid(self, command="BID"):
         bid = self.bid_entry.get()
         if bid.upper() == 'EXIT':
-            self.send_message("EXIT")
+            self.close()
             self.root.quit()
             return
         try:
             bid_amount = int(bid)
-            if bid_amount > self.balance:
-                messagebox.showwarning("无效出价", "您的出价超过当前余额。")
-            else:
-                self.send_message(f"BID {bid_amount}")
-                self.pending_bid = bid_amount
         except ValueError:
             messagebox.showerror("输入错误", "请输入有效的数字。")
+            return
+        if bid_amount > self.core.balance:
+            messagebox.showwarning("无效出价", "您的出价超过当前余额。")
+        elif not self.core.connected:
+            messagebox.showwarning("连接中断", "正在重新连接服务器，请稍后再出价。")
+        else:
+            self.network.call(self.core.max_bid if command == "MAX" else self.core.bid, bid_amount)
+            self.pending_bid = bid_amount
 
     def update_message_area(self, message):
         self.message_area.config(state=tk.NORMAL)
@@ -116,13 +101,24 @@ class AuctionClient:
     def update_won_items_display(self):
         self.won_items_area.config(state=tk.NORMAL)
         self.won_items_area.delete(1.0, tk.END)
-        for item in self.won_items:
+        for item in self.core.won_items:
             self.won_items_area.insert(tk.END, f"{item}\n")
         self.won_items_area.see(tk.END)
         self.won_items_area.config(state=tk.DISABLED)
 
+    def update_balance(self):
+        self.balance_label.config(text=f"当前余额: {self.core.balance}")
+
     def update_current_item(self):
-        self.current_item_label.config(text=f"当前拍卖商品: {self.current_item}")
+        lot = self.core.lots.get(self.core.current_lot)
+        text = f"当前拍卖商品: {lot.item if lot is not None else '无'}"
+        if lot is not None and lot.closes_at is not None:
+            text += f"  剩余时间: {int(lot.remaining())}s"
+        self.current_item_label.config(text=text)
+
+    def tick_countdown(self):
+        self.update_current_item()
+        self.root.after(1000, self.tick_countdown)
 
     def create_startup_window(self):
         self.initial_window = tk.Tk()
@@ -179,14 +175,17 @@ class AuctionClient:
         self.balance_label = tk.Label(self.root, text=f"当前余额: {self.balance}", bg="#e0e0e0", font=("Arial", 12))
         self.balance_label.grid(row=0, column=1, pady=5)
 
-        self.current_item_label = tk.Label(self.root, text=f"当前拍卖商品: {self.current_item}", bg="#e0e0e0", font=("Arial", 12))
+        self.current_item_label = tk.Label(self.root, text="当前拍卖商品: 无", bg="#e0e0e0", font=("Arial", 12))
         self.current_item_label.grid(row=1, columnspan=2, pady=5)
+        self.tick_countdown()
 
         tk.Label(self.root, text="输入您的出价:", bg="#e0e0e0", font=("Arial", 12)).grid(row=2, column=0, pady=5)
         self.bid_entry = tk.Entry(self.root, font=("Arial", 12))
         self.bid_entry.grid(row=2, column=1, pady=5)
 
         tk.Button(self.root, text="出价", command=self.place_bid, font=("Arial", 12)).grid(row=2, column=2, pady=5)
+        # 代理出价: 输入愿付的最高金额，由服务器自动跟价
+        tk.Button(self.root, text="代理出价", command=lambda: self.place_bid("MAX"), font=("Arial", 12)).grid(row=2, column=3, pady=5)
 
         self.message_area = scrolledtext.ScrolledText(self.root, width=50, height=10, state=tk.DISABLED, font=("Arial", 12))
         self.message_area.grid(row=3, columnspan=3, pady=5)
@@ -196,16 +195,25 @@ class AuctionClient:
         self.won_items_area.grid(row=5, columnspan=3, pady=5)
 
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.poll_events()
         self.root.mainloop()
 
     def on_closing(self):
         if messagebox.askokcancel("退出", "您确定要退出吗？"):
-            self.send_message("EXIT".encode())
+            self.close()
             self.root.quit()
 
+    def close(self):
+        self.closing = True
+        self.network.stop()
+
     def run(self):
         self.create_startup_window()
 
 if __name__ == "__main__":
-    client = AuctionClient()
-    client.run()
+    listener = setup_logging('client.log')
+    try:
+        client = AuctionClient()
+        client.run()
+    finally:
+        listener.stop()
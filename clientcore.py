@@ -0,0 +1,345 @@
+"""拍卖客户端的网络部分，图形界面、自动出价程序和压测工具共用。
+
+使用二进制协议并带序号登录: 断线后按指数退避加随机抖动重连，凭会话令牌接管原会话，服务器只补发错过的广播，
+会话过期时自动重新订阅。收到的消息先更新本地镜像的拍品状态(lots、current_lot、balance)，
+再以事件元组交给 on() 注册的回调和 events() 异步迭代器:
+  ('CONNECTED',) ('DISCONNECTED', 原因) ('CLOSED', 原因)  连接状态，CLOSED 之后不再重连
+  ('SNAPSHOT', 序号) ('SYNCED', 序号)                     落后太多时镜像整体重建；补发结束
+  ('BALANCE', 可用余额, 变化量)
+  ('LOT', 拍品编号, 商品名, 当前价)  ('LEADER', 拍品编号, 用户名, 金额, 序号)  ('DEADLINE', 拍品编号, 剩余秒数)
+  ('WON', 拍品编号, 商品名, 成交价)  ('SOLD', 拍品编号, 商品名, 赢家, 成交价)  ('END', 拍品编号)
+  ('REJECTED', 原因)  ('TEXT', 文本)
+出价直接写入连接，不等待回应，可以连续发出多个，需要限速时 await drain()。
+每个连接只有一个 asyncio.Protocol 对象，重连时才有协程，一个事件循环里可以运行成千上万个客户端。
+"""
+import asyncio
+import queue
+import random
+import threading
+import time
+
+from logs import get_logger
+import protocol
+
+log = get_logger('client')
+
+
+class LotView:
+    """本地镜像的一个拍品，closes_at 为自动成交的时刻(单调时钟)"""
+
+    __slots__ = ('lot_id', 'item', 'price', 'leader', 'seq', 'closes_at', 'winner')
+
+    def __init__(self, lot_id, item, price):
+        self.lot_id = lot_id
+        self.item = item
+        self.price = price
+        self.leader = None
+        self.seq = 0
+        self.closes_at = None
+        self.winner = None
+
+    def remaining(self):
+        return None if self.closes_at is None else max(0.0, self.closes_at - time.monotonic())
+
+
+class ClientCore(asyncio.Protocol):
+    def __init__(self, host, port, username, balance, lots=(), reconnect=True,
+                 reconnect_base=0.5, reconnect_max=30, reconnect_attempts=20):
+        self.host = host
+        self.port = port
+        self.username = username
+        # 新用户的起始资金，之后以服务器推送的可用余额为准
+        self.balance = balance
+        self.subscriptions = set(lots)
+        self.reconnect_enabled = reconnect
+        self.reconnect_base = reconnect_base
+        self.reconnect_max = reconnect_max
+        self.reconnect_attempts = reconnect_attempts
+        self.loop = None
+        self.transport = None
+        self.decoder = None
+        self.connected = False
+        self.closing = False
+        self.last_seq = 0
+        self.token = None
+        self.synced = False
+        self.lots = {}
+        # 最近一次收到 LOT 的拍品，没有订阅任何拍品时就是服务器的当前拍品
+        self.current_lot = None
+        self.won_items = []
+        self.handlers = {}
+        self.queues = []
+        self.waiters = []
+        self.drain_waiter = None
+
+    # 事件
+
+    def on(self, kind, callback):
+        """注册回调 callback(事件元组)；kind 为 None 时接收所有事件。回调在事件循环线程里调用"""
+        self.handlers.setdefault(kind, []).append(callback)
+
+    async def events(self, maxsize=1000):
+        """逐个产生事件，客户端关闭后结束；队列满时丢弃新事件，迭代器不会拖慢收包"""
+        events = asyncio.Queue(maxsize)
+        self.queues.append(events)
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            self.queues.remove(events)
+
+    async def wait_for(self, kind, timeout=None):
+        """等待下一个指定类型的事件并返回它"""
+        return await self.wait(self.expect(kind), timeout)
+
+    def expect(self, kind):
+        waiter = (kind, self.loop.create_future())
+        self.waiters.append(waiter)
+        return waiter
+
+    async def wait(self, waiter, timeout):
+        try:
+            return await asyncio.wait_for(waiter[1], timeout)
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+
+    def emit(self, *event):
+        for callback in self.handlers.get(event[0], ()):
+            callback(event)
+        for callback in self.handlers.get(None, ()):
+            callback(event)
+        for events in self.queues:
+            if not events.full():
+                events.put_nowait(event)
+        if self.waiters:
+            for kind, waiter in list(self.waiters):
+                if kind == event[0] and not waiter.done():
+                    waiter.set_result(event)
+
+    # 连接
+
+    async def connect(self, timeout=10):
+        """建立第一次连接并登录，等到补发结束(SYNCED)才返回；连接失败时抛出 OSError，
+        超时抛出 asyncio.TimeoutError。之后的断线由客户端自己重连"""
+        self.loop = asyncio.get_running_loop()
+        synced = self.expect('SYNCED')
+        try:
+            await self.loop.create_connection(lambda: self, self.host, self.port)
+        except OSError:
+            self.waiters.remove(synced)
+            raise
+        await self.wait(synced, timeout)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.decoder = protocol.FrameDecoder()
+        self.connected = True
+        self.synced = False
+        log.info("登录", extra={'user': self.username, 'last_seq': self.last_seq, 'resume': bool(self.token)})
+        transport.write(protocol.frame(protocol.encode_resume(self.username, self.balance, self.last_seq, self.token)))
+        self.emit('CONNECTED')
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.connected = False
+        if self.drain_waiter is not None and not self.drain_waiter.done():
+            self.drain_waiter.set_exception(ConnectionError("连接已断开"))
+        self.drain_waiter = None
+        reason = str(exc) if exc else "服务器关闭了连接"
+        if self.closing or not self.reconnect_enabled:
+            self.finish(reason)
+            return
+        self.emit('DISCONNECTED', reason)
+        self.loop.create_task(self.reconnect())
+
+    async def reconnect(self):
+        # 指数退避加随机抖动，避免大量客户端在网络恢复的同一时刻一起重连
+        delay = self.reconnect_base
+        error = None
+        for _ in range(self.reconnect_attempts):
+            await asyncio.sleep(random.uniform(0, delay))
+            if self.closing:
+                return
+            try:
+                await self.loop.create_connection(lambda: self, self.host, self.port)
+                return
+            except OSError as e:
+                log.info("重连失败: %s", e, extra={'user': self.username})
+                error = e
+                delay = min(delay * 2, self.reconnect_max)
+        self.finish(str(error) if error else "已关闭")
+
+    def finish(self, reason):
+        self.closing = True
+        self.emit('CLOSED', reason)
+        for events in self.queues:
+            if events.full():
+                events.get_nowait()
+            events.put_nowait(None)
+
+    def close(self):
+        """发送 EXIT 后断开，服务器不保留会话"""
+        if self.closing:
+            return
+        self.closing = True
+        if self.transport is not None:
+            self.transport.write(protocol.frame(protocol.encode_exit()))
+            self.transport.close()
+        else:
+            self.finish("已关闭")
+
+    def pause_writing(self):
+        self.drain_waiter = self.loop.create_future()
+
+    def resume_writing(self):
+        if self.drain_waiter is not None and not self.drain_waiter.done():
+            self.drain_waiter.set_result(None)
+        self.drain_waiter = None
+
+    async def drain(self):
+        """发送缓冲超过传输层的高水位时等待它写出"""
+        if self.drain_waiter is not None:
+            await self.drain_waiter
+
+    # 发送
+
+    def send(self, packet):
+        if self.transport is None or self.transport.is_closing():
+            raise ConnectionError("未连接到服务器")
+        self.transport.write(protocol.frame(packet))
+
+    def bid(self, amount, lot_id=None):
+        """出价，lot_id 为 None 时对服务器的当前拍品出价"""
+        self.send(protocol.encode_bid(lot_id, amount))
+
+    def max_bid(self, maximum, lot_id=None):
+        """代理出价，由服务器在 maximum 以内自动跟价"""
+        self.send(protocol.encode_max(lot_id, maximum))
+
+    def subscribe(self, lot_id):
+        self.subscriptions.add(lot_id)
+        if self.connected:
+            self.send(protocol.encode_sub(lot_id))
+
+    def unsubscribe(self, lot_id):
+        self.subscriptions.discard(lot_id)
+        self.lots.pop(lot_id, None)
+        if self.connected:
+            self.send(protocol.encode_unsub(lot_id))
+
+    # 接收
+
+    def data_received(self, data):
+        for payload in self.decoder.feed(data):
+            self.handle(protocol.decode_server_message(payload))
+
+    def handle(self, message):
+        kind = message[0]
+        if kind == 'SEQ':
+            self.last_seq = message[1]
+            message = message[2]
+            kind = message[0]
+        if kind == 'LEADER':
+            _, lot_id, username, amount, seq = message
+            lot = self.lots.get(lot_id)
+            if lot is not None:
+                lot.price = amount
+                lot.leader = username
+                lot.seq = seq
+            self.emit('LEADER', lot_id, username, amount, seq)
+        elif kind == 'LOT':
+            _, lot_id, item, price = message
+            lot = self.lots.get(lot_id)
+            if lot is None:
+                lot = self.lots[lot_id] = LotView(lot_id, item, price)
+            else:
+                lot.price = price
+            self.current_lot = lot_id
+            self.emit('LOT', lot_id, item, price)
+        elif kind == 'BALANCE':
+            self.balance = message[1]
+            self.emit('BALANCE', message[1], message[2])
+        elif kind == 'ERROR':
+            self.emit('REJECTED', message[1])
+        elif kind == 'DEADLINE':
+            _, lot_id, remaining = message
+            lot = self.lots.get(lot_id)
+            if lot is not None:
+                lot.closes_at = time.monotonic() + remaining
+            self.emit('DEADLINE', lot_id, remaining)
+        elif kind == 'WINNER':
+            _, lot_id, price = message
+            lot = self.lots.get(lot_id)
+            item = lot.item if lot is not None else f"拍品 {lot_id}"
+            self.won_items.append(item)
+            self.emit('WON', lot_id, item, price)
+        elif kind == 'SOLD':
+            _, lot_id, winner, price = message
+            lot = self.lots.get(lot_id)
+            item = f"拍品 {lot_id}"
+            if lot is not None:
+                item = lot.item
+                lot.winner = winner
+                lot.price = price
+                lot.closes_at = None
+            self.emit('SOLD', lot_id, item, winner, price)
+        elif kind == 'END':
+            lot_id = message[1]
+            if self.current_lot == lot_id:
+                self.current_lot = None
+            self.emit('END', lot_id)
+            # 回调处理完之后才从镜像里删掉，已结束的拍品不占内存
+            self.lots.pop(lot_id, None)
+        elif kind == 'TEXT':
+            self.emit('TEXT', message[1])
+        elif kind == 'SESSION':
+            token = message[1]
+            if token != self.token:
+                # 新会话(首次登录或原会话已过期)没有订阅，重新发送
+                self.token = token
+                for lot_id in self.subscriptions:
+                    self.send(protocol.encode_sub(lot_id))
+        elif kind == 'SNAPSHOT':
+            self.last_seq = message[1]
+            self.lots.clear()
+            self.current_lot = None
+            self.emit('SNAPSHOT', message[1])
+        elif kind == 'SYNC':
+            self.last_seq = message[1]
+            self.synced = True
+            self.emit('SYNCED', message[1])
+        else:
+            log.info("未知的服务器消息: %s", message, extra={'user': self.username})
+
+
+class ClientThread:
+    """在后台线程里运行客户端的事件循环，供图形界面等同步代码使用。
+
+    事件放进线程安全的队列 events，由调用方在自己的线程里取出；对客户端的操作经 call() 交给事件循环执行。
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.events = queue.Queue()
+        client.on(None, self.events.put)
+        # 客户端不再重连之后事件循环也就没有事可做了
+        client.on('CLOSED', lambda event: self.loop.stop())
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def connect(self, timeout=10):
+        asyncio.run_coroutine_threadsafe(self.client.connect(), self.loop).result(timeout)
+
+    def call(self, func, *args):
+        self.loop.call_soon_threadsafe(func, *args)
+
+    def stop(self, timeout=1):
+        """发送 EXIT 并等待连接关闭"""
+        if self.loop.is_running():
+            self.call(self.client.close)
+            self.thread.join(timeout)
@@ -0,0 +1,121 @@
+import json
+import math
+import socketserver
+import threading
+import time
+
+from logs import get_logger
+from sealed import PRICING
+
+log = get_logger('control')
+
+
+class ControlHandler(socketserver.StreamRequestHandler):
+    """按行读取控制命令，每条命令回复一行结果"""
+
+    def handle(self):
+        for line in self.rfile:
+            command = line.decode('utf-8').strip()
+            if not command:
+                continue
+            if command.upper() == 'QUIT':
+                break
+            try:
+                reply = self.server.control.execute(command)
+            except (ValueError, KeyError, IndexError) as e:
+                reply = f"ERROR {e}"
+            self.wfile.write((reply + '\n').encode('utf-8'))
+
+
+class ControlServer:
+    """无界面模式下的本机控制接口，只监听 127.0.0.1。
+
+    命令: OPEN 大类 商品 / OPEN_CATEGORY 大类 / OPEN_ALL / SETTLE [拍品编号] / SETTLE_ALL / LOTS / CLIENTS / SEARCH 关键字 /
+    SEALED first|second [秒数] / SEALED_CLOSE；SEALED 之后开拍的拍品都加入密封出价轮次，到时或 SEALED_CLOSE 时一起清算
+    """
+
+    def __init__(self, server, host='127.0.0.1', port=5201):
+        self.server = server
+        self.tcp_server = socketserver.ThreadingTCPServer((host, port), ControlHandler)
+        self.tcp_server.daemon_threads = True
+        self.tcp_server.control = self
+
+    def start(self):
+        threading.Thread(target=self.tcp_server.serve_forever, daemon=True).start()
+        log.info("控制端口已开启", extra={'address': self.tcp_server.server_address})
+
+    def execute(self, command):
+        parts = command.split(None, 2)
+        name = parts[0].upper()
+        if name == 'OPEN':
+            self.server.start_auction(parts[1], parts[2])
+        elif name == 'OPEN_CATEGORY':
+            self.server.start_catalog(parts[1])
+        elif name == 'OPEN_ALL':
+            self.server.start_catalog()
+        elif name == 'SETTLE':
+            self.server.complete_transaction(int(parts[1]) if len(parts) > 1 else None)
+        elif name == 'SETTLE_ALL':
+            self.server.settle_all()
+        elif name == 'SEALED':
+            # 序列器里才真正开始本轮，参数和轮次状态在这里先检查，出错时直接回复
+            pricing = parts[1].lower() if len(parts) > 1 else 'second'
+            window = float(parts[2]) if len(parts) > 2 else 0
+            if pricing not in PRICING:
+                return f"ERROR 未知的密封出价方式: {parts[1]}"
+            if not math.isfinite(window) or window < 0:
+                return f"ERROR 截止秒数无效: {parts[2]}"
+            if self.server.sealed is not None:
+                return "ERROR 已有进行中的密封出价轮次"
+            self.server.open_sealed(pricing, window)
+        elif name == 'SEALED_CLOSE':
+            if self.server.sealed is None:
+                return "ERROR 没有进行中的密封出价轮次"
+            self.server.close_sealed()
+        elif name == 'LOTS':
+            return json.dumps({lot_id: item for lot_id, item in list(self.server.lots.items())}, ensure_ascii=False)
+        elif name == 'SEARCH':
+            results = self.server.catalog.search(command.split(None, 1)[1])
+            return json.dumps([[item_id, category, item] for item_id, category, item in results], ensure_ascii=False)
+        elif name == 'CLIENTS':
+            return json.dumps({username: client['balance'] for username, client in list(self.server.clients.items())},
+                              ensure_ascii=False)
+        else:
+            return f"ERROR 未知命令: {name}"
+        return "OK"
+
+
+def load_schedule(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def run_schedule(server, entries):
+    """按计划开拍和结算。
+
+    计划是一个列表，每项形如 {"at": 秒, "action": "open", "category": ..., "item": ...}，
+    action 还可以是 open_category、open_all、settle(可带 lot)、settle_all、
+    sealed(可带 pricing 和 window)、sealed_close。
+    """
+    started = time.monotonic()
+    for entry in sorted(entries, key=lambda entry: entry['at']):
+        delay = entry['at'] - (time.monotonic() - started)
+        if delay > 0:
+            time.sleep(delay)
+        action = entry['action']
+        if action == 'open':
+            server.start_auction(entry['category'], entry['item'])
+        elif action == 'open_category':
+            server.start_catalog(entry['category'])
+        elif action == 'open_all':
+            server.start_catalog()
+        elif action == 'settle':
+            server.complete_transaction(entry.get('lot'))
+        elif action == 'settle_all':
+            server.settle_all()
+        elif action == 'sealed':
+            server.open_sealed(entry.get('pricing', 'second'), entry.get('window', 0))
+        elif action == 'sealed_close':
+            server.close_sealed()
+        else:
+            log.warning("拍卖计划中有未知操作: %s", action)
@@ -0,0 +1,64 @@
+import bisect
+import collections
+import queue
+import threading
+
+
+class EventBus:
+    """服务器对外的事件流。
+
+    每个订阅者拿到一个有界队列，在自己的线程里取出事件处理；发布方从不等待订阅者，
+    队列满时丢弃该订阅者的新事件，界面渲染因此不会拖慢出价路径。
+    """
+
+    def __init__(self):
+        self.subscribers = []
+        self.lock = threading.Lock()
+
+    def subscribe(self, maxsize=10000):
+        events = queue.Queue(maxsize)
+        with self.lock:
+            self.subscribers = self.subscribers + [events]
+        return events
+
+    def unsubscribe(self, events):
+        with self.lock:
+            self.subscribers = [q for q in self.subscribers if q is not events]
+
+    def publish(self, *event):
+        for events in self.subscribers:
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                pass
+
+
+class BroadcastLog:
+    """最近 capacity 条带序号的广播，供重连的客户端补发错过的部分。
+
+    每条记录为 (序号, 拍品编号, 是否为当时的当前拍品, 已编码的消息)，拍品编号为 None 表示发给所有客户端。
+    只由序列器线程读写。
+    """
+
+    def __init__(self, capacity=4096, start_seq=0):
+        self.entries = collections.deque()
+        self.seqs = collections.deque()
+        self.capacity = capacity
+        # 序号不大于 evicted_seq 的广播已经不在日志里
+        self.evicted_seq = start_seq
+
+    def append(self, seq, lot_id, current, frames):
+        if len(self.entries) >= self.capacity:
+            self.evicted_seq = self.seqs.popleft()
+            self.entries.popleft()
+        self.entries.append((seq, lot_id, current, frames))
+        self.seqs.append(seq)
+
+    def since(self, last_seq, limit):
+        """返回序号大于 last_seq 的记录；日志已不完整或超过 limit 条时返回 None"""
+        if last_seq < self.evicted_seq:
+            return None
+        start = bisect.bisect_right(self.seqs, last_seq)
+        if len(self.entries) - start > limit:
+            return None
+        return [self.entries[index] for index in range(start, len(self.entries))]
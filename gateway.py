@@ -0,0 +1,411 @@
+"""WebSocket 网关。
+
+浏览器和手机客户端通过 WebSocket 连接，每条 WebSocket 消息就是原协议的一帧负载(文本命令或二进制包)，
+登录、出价、订阅都与 TCP 客户端相同，会话直接注册到同一个 AuctionServer，不再经过一条 TCP 连接转发。
+握手和帧格式(RFC 6455)、permessage-deflate 压缩(RFC 7692)都在本模块实现，不依赖第三方库。
+
+压缩固定协商为双方都不保留上下文，每条消息单独压缩: 同一条广播只压缩一次，所有会话共用结果，连接上也不常驻 zlib 状态。
+每个连接只有一个 asyncio.Protocol 对象，没有协程和发送队列，消息直接写入传输层，积压超过上限时按慢消费者断开，
+空闲的观众连接因此只占很少的内存。网关在自己的线程和事件循环里运行，其他线程发来的消息合并后一次唤醒事件循环。
+"""
+import asyncio
+import base64
+import collections
+import hashlib
+import struct
+import threading
+import zlib
+
+from logs import get_logger
+import protocol
+
+log = get_logger('gateway')
+
+GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+MAX_HANDSHAKE = 8192
+# 短消息压缩后几乎不变小，直接发送
+COMPRESS_MIN = 128
+DEFLATE_TAIL = b'\x00\x00\xff\xff'
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_TOO_BIG = 1009
+
+
+def accept_key(key):
+    return base64.b64encode(hashlib.sha1(key.encode('ascii') + GUID).digest()).decode('ascii')
+
+
+def apply_mask(payload, mask):
+    # 整段转成大整数做一次异或，比逐字节循环快得多
+    length = len(payload)
+    if not length:
+        return b''
+    key = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(length, 'big')
+
+
+def encode_frame(opcode, payload, compressed=False, mask=None):
+    """编码一个完整的帧；mask 为 4 字节掩码时按客户端发出的格式编码"""
+    first = 0x80 | (0x40 if compressed else 0) | opcode
+    mask_bit = 0x80 if mask else 0
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('>BB', first, mask_bit | length)
+    elif length < 65536:
+        header = struct.pack('>BBH', first, mask_bit | 126, length)
+    else:
+        header = struct.pack('>BBQ', first, mask_bit | 127, length)
+    if mask:
+        return header + mask + apply_mask(payload, mask)
+    return header + payload
+
+
+def compress(payload, wbits=15):
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -wbits)
+    data = compressor.compress(payload) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return data[:-4] if data.endswith(DEFLATE_TAIL) else data
+
+
+def decompress(payload, limit):
+    """解压超过 limit 字节时返回 None，防止压缩炸弹"""
+    decompressor = zlib.decompressobj(-15)
+    data = decompressor.decompress(payload + DEFLATE_TAIL, limit + 1)
+    return None if len(data) > limit else data
+
+
+def negotiate_deflate(header):
+    """从 Sec-WebSocket-Extensions 中选第一个能接受的 permessage-deflate 提议，返回 (响应的扩展头, 服务器窗口位数)"""
+    for offer in header.split(','):
+        params = [param.strip() for param in offer.split(';')]
+        if params[0] != 'permessage-deflate':
+            continue
+        wbits = 15
+        response = ['permessage-deflate', 'server_no_context_takeover', 'client_no_context_takeover']
+        for param in params[1:]:
+            name, _, value = param.partition('=')
+            name, value = name.strip(), value.strip().strip('"')
+            if name == 'server_max_window_bits':
+                # zlib 的原始 deflate 不支持 8 位窗口，这样的提议不接受
+                if not value.isdigit() or not 9 <= int(value) <= 15:
+                    break
+                wbits = int(value)
+                response.append(f'server_max_window_bits={wbits}')
+            elif name not in ('server_no_context_takeover', 'client_no_context_takeover', 'client_max_window_bits'):
+                break
+        else:
+            return '; '.join(response), wbits
+    return None, None
+
+
+class WebSocketSession(asyncio.Protocol):
+    """一个 WebSocket 连接，同时是服务器眼中的发送通道(send/close/binary/sequenced)"""
+
+    __slots__ = ('gateway', 'transport', 'address', 'buffer', 'open', 'deflate', 'fragments', 'fragment_opcode',
+                 'fragment_compressed', 'username', 'codec', 'bucket', 'binary', 'sequenced', 'closed', 'dropped')
+
+    # 发送积压在传输层里，这里没有自己的队列
+    depth = 0
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+        self.transport = None
+        self.address = None
+        self.buffer = b''
+        self.open = False
+        self.deflate = None
+        self.fragments = None
+        self.fragment_opcode = None
+        self.fragment_compressed = False
+        self.username = None
+        self.codec = None
+        self.bucket = None
+        self.binary = False
+        self.sequenced = False
+        self.closed = False
+        self.dropped = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.address = transport.get_extra_info('peername')
+        server = self.gateway.server
+        if not server.admit_connection(self.address):
+            # 没有登记到来源地址的连接数里，断开时也不必注销
+            self.address = None
+            self.closed = True
+            transport.abort()
+            return
+        server.m_connections.inc()
+        self.gateway.sessions += 1
+
+    def connection_lost(self, exc):
+        if self.address is None:
+            return
+        server = self.gateway.server
+        self.gateway.sessions -= 1
+        server.admission.disconnect(self.address[0])
+        self.closed = True
+        if self.username is not None:
+            server.remove_client(self.username, self)
+            log.info("WebSocket 客户端断开连接", extra={'addr': str(self.address), 'user': self.username})
+
+    def data_received(self, data):
+        if self.closed:
+            return
+        self.buffer = self.buffer + data if self.buffer else data
+        if not self.open:
+            self.handshake()
+        if self.open:
+            self.read_frames()
+
+    def handshake(self):
+        end = self.buffer.find(b'\r\n\r\n')
+        if end < 0:
+            if len(self.buffer) > MAX_HANDSHAKE:
+                self.reject(b'431 Request Header Fields Too Large')
+            return
+        head, self.buffer = self.buffer[:end].decode('latin-1'), self.buffer[end + 4:]
+        lines = head.split('\r\n')
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get('sec-websocket-key')
+        if not lines[0].startswith('GET ') or 'websocket' not in headers.get('upgrade', '').lower() or not key:
+            self.reject(b'400 Bad Request')
+            return
+        if headers.get('sec-websocket-version') != '13':
+            self.reject(b'426 Upgrade Required\r\nSec-WebSocket-Version: 13')
+            return
+        response = ['HTTP/1.1 101 Switching Protocols', 'Upgrade: websocket', 'Connection: Upgrade',
+                    f'Sec-WebSocket-Accept: {accept_key(key)}']
+        extension, self.deflate = negotiate_deflate(headers.get('sec-websocket-extensions', ''))
+        if extension:
+            response.append(f'Sec-WebSocket-Extensions: {extension}')
+        self.transport.write(('\r\n'.join(response) + '\r\n\r\n').encode('latin-1'))
+        self.open = True
+        self.bucket = self.gateway.server.admission.bucket()
+        log.info("WebSocket 客户端连接", extra={'addr': str(self.address), 'deflate': self.deflate is not None})
+
+    def reject(self, status):
+        self.transport.write(b'HTTP/1.1 ' + status + b'\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+        self.closed = True
+        self.transport.close()
+
+    def read_frames(self):
+        buffer = self.buffer
+        offset = 0
+        max_frame = self.gateway.server.max_frame
+        while not self.closed:
+            size = len(buffer) - offset
+            if size < 2:
+                break
+            first, second = buffer[offset], buffer[offset + 1]
+            length = second & 0x7F
+            header = 2
+            if length == 126:
+                if size < 4:
+                    break
+                length = struct.unpack_from('>H', buffer, offset + 2)[0]
+                header = 4
+            elif length == 127:
+                if size < 10:
+                    break
+                length = struct.unpack_from('>Q', buffer, offset + 2)[0]
+                header = 10
+            if not second & 0x80 or first & 0x30:
+                self.fail(CLOSE_PROTOCOL_ERROR, "客户端帧没有掩码或使用了未协商的保留位")
+                return
+            if length > max_frame:
+                # 长度一到就检查，不等负载收完
+                self.gateway.server.m_throttled.inc(label='frame_size')
+                self.fail(CLOSE_TOO_BIG, f"帧长度 {length} 超过上限 {max_frame}")
+                return
+            end = offset + header + 4 + length
+            if end > len(buffer):
+                break
+            mask = buffer[offset + header:offset + header + 4]
+            payload = apply_mask(buffer[offset + header + 4:end], mask)
+            offset = end
+            self.handle_frame(first & 0x80, first & 0x40, first & 0x0F, payload)
+        self.buffer = buffer[offset:] if offset < len(buffer) else b''
+
+    def handle_frame(self, fin, rsv1, opcode, payload):
+        if opcode >= OP_CLOSE:
+            if not fin or len(payload) > 125:
+                self.fail(CLOSE_PROTOCOL_ERROR, "控制帧不能分片或超过 125 字节")
+            elif opcode == OP_PING:
+                self.transport.write(encode_frame(OP_PONG, payload))
+            elif opcode == OP_CLOSE:
+                self.shutdown(CLOSE_NORMAL)
+            return
+        if opcode == OP_CONTINUATION:
+            if self.fragments is None:
+                self.fail(CLOSE_PROTOCOL_ERROR, "没有待续的消息")
+                return
+            self.fragments.append(payload)
+            if sum(len(fragment) for fragment in self.fragments) > self.gateway.server.max_frame:
+                self.gateway.server.m_throttled.inc(label='frame_size')
+                self.fail(CLOSE_TOO_BIG, "分片消息超过上限")
+                return
+        elif opcode in (OP_TEXT, OP_BINARY):
+            if self.fragments is not None:
+                self.fail(CLOSE_PROTOCOL_ERROR, "上一条分片消息还没有结束")
+                return
+            if rsv1 and self.deflate is None:
+                self.fail(CLOSE_PROTOCOL_ERROR, "未协商压缩却收到压缩消息")
+                return
+            self.fragments = [payload]
+            self.fragment_opcode = opcode
+            self.fragment_compressed = bool(rsv1)
+        else:
+            self.fail(CLOSE_PROTOCOL_ERROR, f"未知的操作码 {opcode}")
+            return
+        if not fin:
+            return
+        message = b''.join(self.fragments)
+        self.fragments = None
+        if self.fragment_compressed:
+            message = decompress(message, self.gateway.server.max_frame)
+            if message is None:
+                self.gateway.server.m_throttled.inc(label='frame_size')
+                self.fail(CLOSE_TOO_BIG, "解压后的消息超过上限")
+                return
+        self.handle_message(message)
+
+    def handle_message(self, payload):
+        # 一条消息就是原协议的一帧负载，登录和命令都交给服务器原来的处理流程
+        server = self.gateway.server
+        try:
+            if self.codec is None:
+                self.username, self.codec = server.login(self, payload)
+                return
+            if not server.admit(self.username, self, self.bucket):
+                return
+            if not server.handle_frame(self.username, self, self.codec, payload):
+                self.shutdown(CLOSE_NORMAL)
+        except Exception as e:
+            log.warning("处理 WebSocket 客户端时发生错误: %s", e, extra={'addr': str(self.address),
+                                                                     'user': self.username})
+            self.shutdown(CLOSE_PROTOCOL_ERROR)
+
+    def fail(self, code, reason):
+        log.info("WebSocket 协议错误: %s", reason, extra={'addr': str(self.address)})
+        self.shutdown(code)
+
+    def shutdown(self, code):
+        if self.closed:
+            return
+        self.closed = True
+        self.transport.write(encode_frame(OP_CLOSE, struct.pack('>H', code)))
+        self.transport.close()
+
+    def send(self, data):
+        # data 为发送队列格式的一帧(长度前缀 + 负载)，可能来自序列器线程
+        if self.closed or not self.open:
+            return False
+        self.gateway.post(self, data)
+        return True
+
+    def write(self, frames):
+        # 只在网关的事件循环中调用
+        if self.closed:
+            return
+        self.transport.write(frames)
+        if self.transport.get_write_buffer_size() > self.gateway.max_bytes:
+            # 客户端读得太慢，按慢消费者断开
+            self.gateway.server.evict_channel(self)
+            self.closed = True
+            self.transport.abort()
+
+    def close(self):
+        self.gateway.call(self.shutdown, CLOSE_NORMAL)
+
+
+class WebSocketGateway:
+    def __init__(self, server, host='0.0.0.0', port=5203, compress_min=COMPRESS_MIN, cache_size=256):
+        if server.acceptors is not None:
+            raise ValueError("pool 模式的广播只经过接入进程，不支持 WebSocket 网关")
+        self.server = server
+        self.host = host
+        self.port = port
+        self.compress_min = compress_min
+        self.max_bytes = server.channel_options['max_bytes']
+        self.loop = None
+        self.thread_id = None
+        self.sessions = 0
+        # 最近编码过的帧: (队列格式的帧, 是否二进制, 压缩窗口位数) -> WebSocket 帧，同一条广播的帧对象相同
+        self.cache = collections.OrderedDict()
+        self.cache_size = cache_size
+        # 其他线程发来的 (会话, 帧)，攒成一批后只唤醒一次事件循环
+        self.outbox = collections.deque()
+        self.scheduled = False
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        server.metrics.gauge('websocket_sessions', "WebSocket 会话数", lambda: self.sessions)
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        self.ready.wait(5)
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        server = await self.loop.create_server(lambda: WebSocketSession(self), self.host, self.port, backlog=1024)
+        log.info("WebSocket 网关已开启", extra={'host': self.host, 'port': self.port})
+        self.ready.set()
+        async with server:
+            await server.serve_forever()
+
+    def call(self, func, *args):
+        if threading.get_ident() == self.thread_id:
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    def post(self, session, data):
+        with self.lock:
+            self.outbox.append((session, data))
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.call(self.deliver)
+
+    def deliver(self):
+        with self.lock:
+            self.scheduled = False
+            batch = list(self.outbox)
+            self.outbox.clear()
+        # 同一会话的多条消息合并成一次写入
+        pending = {}
+        for session, data in batch:
+            pending.setdefault(session, []).append(self.encode(data, session.binary, session.deflate))
+        for session, frames in pending.items():
+            session.write(frames[0] if len(frames) == 1 else b''.join(frames))
+
+    def encode(self, data, binary, deflate):
+        key = (data, binary, deflate)
+        frame = self.cache.get(key)
+        if frame is not None:
+            self.cache.move_to_end(key)
+            return frame
+        payload = data[protocol.LENGTH.size:]
+        opcode = OP_BINARY if binary else OP_TEXT
+        if deflate and len(payload) >= self.compress_min:
+            frame = encode_frame(opcode, compress(payload, deflate), compressed=True)
+        else:
+            frame = encode_frame(opcode, payload)
+        self.cache[key] = frame
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return frame
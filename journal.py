@@ -0,0 +1,128 @@
+import json
+import os
+import queue
+import threading
+import time
+
+
+class Journal:
+    """只追加的事件日志。
+
+    事件先进入内存队列，由后台线程按 commit_interval 批量写入并 fsync（组提交），
+    出价路径不等待磁盘。每写入 snapshot_every 条事件后可以保存一次快照并截断日志，
+    启动时先读快照，再重放快照之后的事件。
+    """
+
+    def __init__(self, path, snapshot_path=None, commit_interval=0.005, snapshot_every=10000):
+        self.path = path
+        self.snapshot_path = snapshot_path or path + '.snapshot'
+        self.commit_interval = commit_interval
+        self.snapshot_every = snapshot_every
+        self.queue = queue.SimpleQueue()
+        self.jseq = 0
+        self.since_snapshot = 0
+        self.file = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.stopped = threading.Event()
+
+    def recover(self):
+        """返回 (快照, 快照之后的事件列表)，没有快照时快照为 None"""
+        snapshot = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            self.jseq = snapshot['jseq']
+
+        events = []
+        if os.path.exists(self.path):
+            good = 0
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError("缺少换行")
+                        event = json.loads(line)
+                    except ValueError:
+                        # 崩溃时最后一行可能只写了一半
+                        break
+                    good += len(line)
+                    if event[0] > self.jseq:
+                        events.append(event)
+            if good < os.path.getsize(self.path):
+                # 截掉半行，之后追加的事件才不会接在它后面、在下次恢复时一起被丢弃
+                with open(self.path, 'r+b') as f:
+                    f.truncate(good)
+                    f.flush()
+                    os.fsync(f.fileno())
+        if events:
+            self.jseq = events[-1][0]
+        self.since_snapshot = len(events)
+        return snapshot, events
+
+    def start(self):
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.thread.start()
+
+    def append(self, *event):
+        # 只由序列器线程调用，jseq 因此天然有序
+        self.jseq += 1
+        self.since_snapshot += 1
+        self.queue.put([self.jseq, *event])
+
+    def should_snapshot(self):
+        return self.since_snapshot >= self.snapshot_every
+
+    def snapshot(self, state):
+        # state 必须是调用时刻的副本，之后由写线程在写完之前的事件后落盘
+        state['jseq'] = self.jseq
+        self.since_snapshot = 0
+        self.queue.put(state)
+
+    def run(self):
+        while not self.stopped.is_set():
+            batch = [self.queue.get()]
+            time.sleep(self.commit_interval)
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.commit(batch)
+
+    def commit(self, batch):
+        lines = []
+        for entry in batch:
+            if entry is None:
+                continue
+            if isinstance(entry, dict):
+                self.write_lines(lines)
+                lines = []
+                self.write_snapshot(entry)
+            else:
+                lines.append(json.dumps(entry, ensure_ascii=False, separators=(',', ':')))
+        self.write_lines(lines)
+
+    def write_lines(self, lines):
+        if not lines:
+            return
+        self.file.write('\n'.join(lines) + '\n')
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def write_snapshot(self, state):
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        # 快照已包含此前的所有事件，日志可以从头开始
+        self.file.close()
+        self.file = open(self.path, 'w', encoding='utf-8')
+
+    def close(self):
+        self.stopped.set()
+        self.queue.put(None)
+        self.thread.join(timeout=1)
+        if self.file:
+            self.file.close()
@@ -0,0 +1,112 @@
+"""账户资金。
+
+每个用户分配一个从 0 开始的连续账户号，可用余额和冻结金额按账户号存放在两列 array('q') 里，
+账户对象本身只保存账户号、用户名和已赢得的商品。
+出价领先时冻结对应金额，被超过时解冻，同一资金不能同时让一个用户领先多个拍品；
+成交时先解冻再从可用余额扣款。每个拍品同一时刻最多只有领先者一笔冻结。
+不加锁，只在序列器线程中使用。
+"""
+from array import array
+
+
+class Account:
+    __slots__ = ('account_id', 'username', 'won_items')
+
+    def __init__(self, account_id, username, won_items=None):
+        self.account_id = account_id
+        self.username = username
+        self.won_items = [] if won_items is None else won_items
+
+
+class Ledger:
+    def __init__(self):
+        self.ids = {}
+        self.accounts = []
+        self.available = array('q')
+        self.reserved = array('q')
+        # 拍品编号 -> (账户号, 冻结金额)
+        self.holds = {}
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def __contains__(self, username):
+        return username in self.ids
+
+    def __iter__(self):
+        return iter(self.accounts)
+
+    def get(self, username):
+        account_id = self.ids.get(username)
+        return None if account_id is None else self.accounts[account_id]
+
+    def open(self, username, balance, won_items=None):
+        """开户，已存在时直接返回原账户"""
+        account = self.get(username)
+        if account is not None:
+            return account
+        account = Account(len(self.accounts), username, won_items)
+        self.ids[username] = account.account_id
+        self.accounts.append(account)
+        self.available.append(balance)
+        self.reserved.append(0)
+        return account
+
+    def set_balance(self, username, balance):
+        # 只在恢复时使用，此时还没有任何冻结
+        self.available[self.ids[username]] = balance
+
+    def available_of(self, username):
+        account_id = self.ids.get(username)
+        return 0 if account_id is None else self.available[account_id]
+
+    def balance_of(self, username):
+        """可用余额加冻结金额"""
+        account_id = self.ids.get(username)
+        return 0 if account_id is None else self.available[account_id] + self.reserved[account_id]
+
+    def spendable(self, username, lot_id):
+        """在该拍品上最多能出多少: 可用余额加上自己在该拍品上已冻结的金额"""
+        account_id = self.ids.get(username)
+        if account_id is None:
+            return 0
+        hold = self.holds.get(lot_id)
+        own = hold[1] if hold is not None and hold[0] == account_id else 0
+        return self.available[account_id] + own
+
+    def holder(self, lot_id):
+        hold = self.holds.get(lot_id)
+        return None if hold is None else self.accounts[hold[0]].username
+
+    def balances(self):
+        return {account.username: self.available[account.account_id] for account in self.accounts}
+
+    def reserve(self, lot_id, username, amount):
+        """把该拍品的冻结换成 username 的 amount，原领先者的冻结同时解除。
+
+        资金不足时什么都不改，返回 False
+        """
+        if self.spendable(username, lot_id) < amount:
+            return False
+        self.release(lot_id)
+        account_id = self.ids[username]
+        self.available[account_id] -= amount
+        self.reserved[account_id] += amount
+        self.holds[lot_id] = (account_id, amount)
+        return True
+
+    def release(self, lot_id):
+        hold = self.holds.pop(lot_id, None)
+        if hold is not None:
+            account_id, amount = hold
+            self.reserved[account_id] -= amount
+            self.available[account_id] += amount
+
+    def settle(self, lot_id, username, price):
+        """成交: 解除该拍品的冻结后扣款，可用余额不足时不扣款并返回 False"""
+        self.release(lot_id)
+        account_id = self.ids.get(username)
+        if account_id is None or self.available[account_id] < price:
+            return False
+        self.available[account_id] -= price
+        return True
@@ -0,0 +1,282 @@
+"""拍卖服务器压测工具: 在本机模拟大量出价者，统计吞吐、广播延迟和服务器资源占用。
+
+每个出价者是一个 clientcore.ClientCore，全部运行在同一个事件循环里，使用二进制协议。
+服务器按批合并领先广播、限流时静默丢帧，客户端只能确认自己出价的领先广播和拒绝通知；
+给出 --metrics-url 时改用服务器计数器在压测前后的差值统计被接受、被拒绝和被限流丢弃的出价。
+
+示例: python loadgen.py --port 5200 --clients 2000 --duration 30 --storm-at 20 --server-pid 1234
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import time
+import urllib.request
+
+from clientcore import ClientCore
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(len(values) * fraction))
+    return values[index]
+
+
+class ProcessSampler:
+    """从 /proc 读取服务器进程的 CPU 时间和常驻内存"""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+    def cpu_seconds(self):
+        with open(f'/proc/{self.pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.ticks
+
+    def rss_kb(self):
+        with open(f'/proc/{self.pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+        return 0
+
+
+def scrape(url):
+    """读取服务器的 Prometheus 指标，返回 {带标签的指标名: 值}"""
+    with urllib.request.urlopen(url, timeout=5) as response:
+        text = response.read().decode('utf-8')
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def server_counts(before, after, prefix='auction_'):
+    # 压测期间服务器计数器的增量
+    def delta(name):
+        return int(after.get(name, 0) - before.get(name, 0))
+
+    rejected = {}
+    for name in after:
+        if name.startswith(f'{prefix}bids_rejected_total{{'):
+            count = delta(name)
+            if count:
+                rejected[name.split('"')[1]] = count
+    return {
+        'accepted': delta(f'{prefix}bids_accepted_total'),
+        'rejected': rejected,
+        # 限流按帧丢弃，每个连接只在开始丢弃时通知一次
+        'throttled': sum(delta(f'{prefix}throttled_total{{scope="{scope}"}}') for scope in ('connection', 'user')),
+    }
+
+
+class LoadGenerator:
+    def __init__(self, options):
+        self.options = options
+        self.price = options.start_price
+        self.sent = 0
+        # 原因 -> 收到的拒绝通知数，throttled 是限流通知，不对应某一个出价
+        self.rejected = collections.Counter()
+        self.connected = 0
+        # 已发出但还没收到领先广播的出价: (用户名, 金额) -> 发送时间，按发送先后排列。
+        # 同一广播会送到所有订阅者，第一次收到时移到 acked，watcher 从 acked 里取发送时间计算延迟。
+        # 两者都只保留最近 ack_window 秒内发出的出价，被拒绝或被丢弃的出价到时清掉，内存不随压测时长增长
+        self.pending = collections.OrderedDict()
+        self.acked = collections.OrderedDict()
+        self.leading = 0
+        self.latencies = []
+        self.storm_start = None
+        self.storm_end = None
+        self.started = None
+        self.stopping = False
+
+    def next_amount(self):
+        self.price += random.randint(1, self.options.increment)
+        return self.price
+
+    def think_time(self):
+        mean = self.options.think
+        now = time.monotonic()
+        if self.storm_start is not None and self.storm_start <= now < self.storm_end:
+            mean /= self.options.storm_factor
+        return random.expovariate(1.0 / mean) if mean > 0 else 0
+
+    def pick_lot(self):
+        lots = self.options.lots
+        return random.choice(lots) if lots else None
+
+    def on_rejected(self, event):
+        self.rejected[event[1]] += 1
+
+    def track(self, key, now):
+        self.pending[key] = now
+        horizon = now - self.options.ack_window
+        for entries in (self.pending, self.acked):
+            while entries and next(iter(entries.values())) < horizon:
+                entries.popitem(last=False)
+
+    def on_leader(self, event):
+        # 代理出价的成交价由服务器算出，与发出的上限对不上，只能靠服务器计数器统计
+        key = (event[2], event[3])
+        sent_at = self.pending.pop(key, None)
+        if sent_at is not None:
+            self.leading += 1
+            self.acked[key] = sent_at
+
+    def measure(self, event):
+        # 只有 watcher 统计从出价到收到领先广播的延迟
+        sent_at = self.acked.get((event[2], event[3]))
+        if sent_at is not None:
+            self.latencies.append(time.monotonic() - sent_at)
+
+    async def bidder(self, index):
+        username = f"{self.options.prefix}{index}"
+        client = ClientCore(self.options.host, self.options.port, username, self.options.balance,
+                            lots=self.options.lots, reconnect=False)
+        client.on('REJECTED', self.on_rejected)
+        client.on('LEADER', self.on_leader)
+        if index < self.options.watchers:
+            client.on('LEADER', self.measure)
+        try:
+            await client.connect()
+        except (OSError, asyncio.TimeoutError) as e:
+            print(f"{username} 连接失败: {e}")
+            return
+        self.connected += 1
+        place = client.max_bid if self.options.proxy else client.bid
+        try:
+            while not self.stopping:
+                await asyncio.sleep(self.think_time())
+                if self.stopping:
+                    break
+                amount = self.next_amount()
+                self.track((username, amount), time.monotonic())
+                place(amount, self.pick_lot())
+                self.sent += 1
+                await client.drain()
+        except ConnectionError:
+            pass
+        finally:
+            await asyncio.sleep(self.options.linger)
+            client.close()
+
+    async def run(self):
+        options = self.options
+        sampler = ProcessSampler(options.server_pid) if options.server_pid else None
+        cpu_before = sampler.cpu_seconds() if sampler else 0
+        metrics_before = scrape(options.metrics_url) if options.metrics_url else None
+        self.started = time.monotonic()
+        if options.storm_at is not None:
+            self.storm_start = self.started + options.storm_at
+            self.storm_end = self.storm_start + options.storm_duration
+
+        tasks = []
+        for index in range(options.clients):
+            tasks.append(asyncio.ensure_future(self.bidder(index)))
+            if options.connect_rate and index % options.connect_rate == options.connect_rate - 1:
+                await asyncio.sleep(1)
+        await asyncio.sleep(max(0, options.duration - (time.monotonic() - self.started)))
+        self.stopping = True
+        elapsed = time.monotonic() - self.started
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        server = server_counts(metrics_before, scrape(options.metrics_url)) if options.metrics_url else None
+        report = self.report(elapsed, server)
+        if sampler:
+            report['server_cpu_percent'] = round((sampler.cpu_seconds() - cpu_before) / elapsed * 100, 1)
+            report['server_rss_kb'] = sampler.rss_kb()
+        return report
+
+    def report(self, elapsed, server=None):
+        latencies = sorted(self.latencies)
+        reasons = dict(self.rejected)
+        notices = reasons.pop('throttled', 0)
+        rejected = sum(reasons.values())
+        # 被更高出价在同一批里超过的出价没有领先广播，客户端只能得到下限
+        accepted = self.leading if server is None else server['accepted']
+        report = {
+            'clients': self.connected,
+            'seconds': round(elapsed, 2),
+            'bids_sent': self.sent,
+            'bids_rejected': rejected,
+            'rejected_by_reason': reasons,
+            'throttle_notices': notices,
+            'bids_leading': self.leading,
+            'bids_accepted': accepted,
+            'accepted_source': 'leader' if server is None else 'server',
+            # 既没有被接受也没有收到拒绝: 被限流丢弃、断线丢失，或(只有领先广播时)在同一批里被超过
+            'bids_unconfirmed': max(0, self.sent - rejected - accepted),
+            'accepted_per_sec': round(accepted / elapsed, 1),
+            'broadcasts_measured': len(latencies),
+            'fanout_p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'fanout_p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'fanout_p999_ms': round(percentile(latencies, 0.999) * 1000, 2),
+        }
+        if server is not None:
+            report['server_rejected_by_reason'] = server['rejected']
+            report['bids_throttled'] = server['throttled']
+        return report
+
+
+def raise_fd_limit():
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="拍卖服务器压测工具")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5200)
+    parser.add_argument('--clients', type=int, default=500, help="模拟的出价者数量")
+    parser.add_argument('--duration', type=float, default=30, help="压测时长(秒)")
+    parser.add_argument('--think', type=float, default=1.0, help="两次出价之间的平均思考时间(秒)")
+    parser.add_argument('--increment', type=int, default=5, help="每次加价的最大幅度")
+    parser.add_argument('--start-price', type=int, default=10)
+    parser.add_argument('--balance', type=int, default=10 ** 12)
+    parser.add_argument('--lots', default='', help="逗号分隔的拍品编号，留空则对当前拍品出价")
+    parser.add_argument('--proxy', action='store_true', help="以代理出价(MAX)代替逐次出价")
+    parser.add_argument('--storm-at', type=float, default=None, help="开始尾盘出价风暴的时间(秒)")
+    parser.add_argument('--storm-duration', type=float, default=5)
+    parser.add_argument('--storm-factor', type=float, default=20, help="风暴期间出价频率的倍数")
+    parser.add_argument('--watchers', type=int, default=50, help="统计广播延迟的客户端数量")
+    parser.add_argument('--connect-rate', type=int, default=0, help="每秒建立的连接数，0 为不限")
+    parser.add_argument('--ack-window', type=float, default=30,
+                        help="等待领先广播的时长(秒)，超过后不再计入被接受数和延迟")
+    parser.add_argument('--linger', type=float, default=0.5, help="结束后继续接收消息的时间(秒)")
+    parser.add_argument('--prefix', default='bot')
+    parser.add_argument('--server-pid', type=int, default=None, help="服务器进程号，用于统计 CPU 和内存")
+    parser.add_argument('--metrics-url', default=None,
+                        help="服务器指标地址，例如 http://127.0.0.1:5202/metrics，用于统计被接受和被限流丢弃的出价")
+    parser.add_argument('--json', default=None, help="把结果另存为 JSON 文件")
+    options = parser.parse_args(argv)
+    options.lots = [int(lot) for lot in options.lots.split(',') if lot]
+    return options
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    raise_fd_limit()
+    report = asyncio.run(LoadGenerator(options).run())
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""结构化日志。
+
+调用线程只做级别判断、采样和入队，格式化、写 JSON 行文件和控制台输出都在后台的 QueueListener 线程里完成，
+出价路径不会因为磁盘或终端变慢而阻塞。后台线程每取空一次队列才 flush 一次，日志文件按大小轮转。
+
+用法: log = get_logger('server'); log.info("拍卖开始", extra={'lot': 1, 'item': 'x'})
+extra 中的字段原样写入 JSON 行；event 字段可用于采样，例如每 100 条 frame 事件只保留 1 条。
+"""
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+
+# LogRecord 自带的属性，其余属性都是调用方通过 extra 传入的字段
+STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+DEFAULT_SAMPLE = {'frame': 100, 'leader': 10}
+
+# 最近一次 setup_logging 的参数，fork 出的子进程据此重新安装日志
+CONFIG = {}
+
+
+def get_logger(name):
+    return logging.getLogger(f"auction.{name}")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """控制台上保持原来 print 的样子，附带的字段跟在消息后面"""
+
+    def format(self, record):
+        fields = ' '.join(f"{key}={value}" for key, value in record.__dict__.items() if key not in STANDARD_ATTRS)
+        text = time.strftime('%H:%M:%S', time.localtime(record.created)) + ' ' + record.getMessage()
+        return f"{text} {fields}" if fields else text
+
+
+class SampleFilter(logging.Filter):
+    """按 event 字段采样: rates 为 {事件名: N}，该事件每 N 条只保留 1 条，WARNING 及以上不采样"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self.counters = {event: itertools.count() for event in rates}
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        event = getattr(record, 'event', None)
+        counter = self.counters.get(event)
+        if counter is None:
+            return True
+        return next(counter) % self.rates[event] == 0
+
+
+class BatchedFileHandler(logging.handlers.RotatingFileHandler):
+    """写入时不 flush，由 BatchedListener 在队列取空时统一 flush；文件大小自己累计，不必每条都 tell()"""
+
+    def __init__(self, path, max_bytes, backups):
+        super().__init__(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+
+    def emit(self, record):
+        try:
+            data = self.format(record) + self.terminator
+            size = len(data.encode('utf-8'))
+            if self.maxBytes and self.size + size > self.maxBytes:
+                self.doRollover()
+                self.size = 0
+            self.stream.write(data)
+            self.size += size
+        except Exception:
+            self.handleError(record)
+
+
+class BatchedStreamHandler(logging.StreamHandler):
+    def emit(self, record):
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class BatchedListener(logging.handlers.QueueListener):
+    def handle(self, record):
+        super().handle(record)
+        if self.queue.empty():
+            for handler in self.handlers:
+                handler.flush()
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """标准 QueueHandler 会在调用线程里格式化消息，这里原样入队，留给后台线程处理"""
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # 队列满时丢弃日志，而不是让出价线程等待
+            pass
+
+
+def setup_logging(path='auction.log', level='INFO', console=True, max_bytes=10 << 20, backups=5,
+                  sample=None, queue_size=100000):
+    """为 auction.* 日志器安装队列处理器，返回后台的 QueueListener，退出前调用其 stop() 写完剩余日志"""
+    CONFIG.update(path=path, level=level, console=console, max_bytes=max_bytes, backups=backups,
+                  sample=sample, queue_size=queue_size)
+    handlers = []
+    if path:
+        file_handler = BatchedFileHandler(path, max_bytes, backups)
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    if console and sys.stdout is not None:
+        console_handler = BatchedStreamHandler(sys.stdout)
+        console_handler.setFormatter(ConsoleFormatter())
+        handlers.append(console_handler)
+
+    log_queue = queue.Queue(queue_size)
+    listener = BatchedListener(log_queue, *handlers, respect_handler_level=True)
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SampleFilter(DEFAULT_SAMPLE if sample is None else sample))
+
+    logger = logging.getLogger('auction')
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+    listener.start()
+    return listener
+
+
+def setup_process_logging(suffix):
+    """在 fork 出的子进程里重新安装日志: 父进程的后台线程不会随 fork 复制，日志文件加上后缀，各进程分别轮转"""
+    if not CONFIG:
+        return None
+    config = dict(CONFIG)
+    if config['path']:
+        config['path'] += suffix
+    return setup_logging(**config)
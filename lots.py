@@ -0,0 +1,184 @@
+import bisect
+import heapq
+import itertools
+import multiprocessing
+
+# 加价幅度表: 价格达到左列后，每次至少加右列的金额
+INCREMENTS = ((0, 1), (100, 5), (1000, 10), (5000, 50), (10000, 100), (100000, 1000), (1000000, 10000))
+INCREMENT_PRICES = [price for price, _ in INCREMENTS]
+
+
+def increment(price):
+    return INCREMENTS[bisect.bisect_right(INCREMENT_PRICES, price) - 1][1]
+
+
+class Lot:
+    """拍品的出价状态。
+
+    proxies 记录每个用户的代理出价上限和登记顺序，heap 按 (-上限, 顺序) 排列，
+    提高上限后旧条目不立即删除，取堆顶时跳过。order 为当前领先者取得领先的顺序，上限相同时先到者领先。
+    """
+    __slots__ = ('lot_id', 'item', 'current_bid', 'winner', 'order', 'proxies', 'heap')
+
+    def __init__(self, lot_id, item, start_bid):
+        self.lot_id = lot_id
+        self.item = item
+        self.current_bid = start_bid
+        self.winner = None
+        self.order = -1
+        self.proxies = {}
+        self.heap = []
+
+    def add_proxy(self, username, maximum, order):
+        self.proxies[username] = (maximum, order)
+        heapq.heappush(self.heap, (-maximum, order, username))
+
+    def clean(self):
+        heap = self.heap
+        while heap and self.proxies.get(heap[0][2]) != (-heap[0][0], heap[0][1]):
+            heapq.heappop(heap)
+
+    def top_two(self):
+        """返回上限最高的两个代理出价 (-上限, 顺序, 用户名)，不足两个时用 None 补齐"""
+        self.clean()
+        if not self.heap:
+            return None, None
+        first = heapq.heappop(self.heap)
+        self.clean()
+        second = self.heap[0] if self.heap else None
+        heapq.heappush(self.heap, first)
+        return first, second
+
+    def resolve(self):
+        """让代理出价互相竞价，直接算出最终的领先者和价格，返回是否有变化"""
+        first, second = self.top_two()
+        if first is None:
+            return False
+        maximum, order, username = -first[0], first[1], first[2]
+        rival = -second[0] if second is not None else None
+        if username == self.winner:
+            if rival is None or rival < self.current_bid:
+                return False
+            price = min(maximum, rival + increment(rival))
+            if price <= self.current_bid:
+                return False
+            self.current_bid = price
+            return True
+        # 与当前价持平时只有比领先者先登记才能领先；起拍价本身不算出价，没有领先者时必须高于起拍价
+        if maximum < self.current_bid or (maximum == self.current_bid and (self.winner is None or order > self.order)):
+            return False
+        rival = self.current_bid if rival is None else max(rival, self.current_bid)
+        self.current_bid = min(maximum, rival + increment(rival))
+        self.winner = username
+        self.order = order
+        return True
+
+
+class LotShard:
+    """一个分片内所有进行中拍品的出价状态，每个工作进程持有一个分片"""
+
+    def __init__(self):
+        self.lots = {}
+        self.orders = itertools.count()
+
+    def open(self, lot_id, item, start_bid):
+        self.lots[lot_id] = Lot(lot_id, item, start_bid)
+        return 'ok'
+
+    def restore(self, lot_id, item, current_bid, winner, proxies=()):
+        lot = Lot(lot_id, item, current_bid)
+        lot.winner = winner
+        lot.order = next(self.orders)
+        for username, maximum in proxies:
+            lot.add_proxy(username, maximum, next(self.orders))
+        self.lots[lot_id] = lot
+        return 'ok'
+
+    # bid 和 proxy 返回 (结果, 领先者, 价格)，价格和领先者都没变时后两项为 None。
+    # 结果为 ok 表示出价者领先，outbid 表示出价有效但被代理出价反超，raised 表示领先者提高了上限
+
+    def bid(self, lot_id, username, amount, balance):
+        lot = self.lots.get(lot_id)
+        if lot is None:
+            return ('no_lot', None, None)
+        if amount > lot.current_bid and amount <= balance:
+            lot.current_bid = amount
+            lot.winner = username
+            lot.order = next(self.orders)
+            lot.resolve()
+            return ('ok' if lot.winner == username else 'outbid', lot.winner, lot.current_bid)
+        return ('low', None, None)
+
+    def proxy(self, lot_id, username, maximum, balance):
+        lot = self.lots.get(lot_id)
+        if lot is None:
+            return ('no_lot', None, None)
+        existing = lot.proxies.get(username)
+        if maximum <= lot.current_bid or maximum > balance or (existing is not None and maximum <= existing[0]):
+            return ('low', None, None)
+        # 领先者提高上限时保留原来的顺序，不会因此输掉持平的竞争
+        lot.add_proxy(username, maximum, lot.order if username == lot.winner else next(self.orders))
+        was_leading = username == lot.winner
+        if not lot.resolve():
+            return ('raised' if was_leading else 'outbid', None, None)
+        return ('ok' if lot.winner == username else 'outbid', lot.winner, lot.current_bid)
+
+    def close(self, lot_id, sold):
+        # 结束的拍品直接删除，分片只保存进行中的拍品，之后的出价得到 no_lot
+        if self.lots.pop(lot_id, None) is None:
+            return 'no_lot'
+        return 'ok'
+
+    def execute(self, ops):
+        return [getattr(self, op[0])(*op[1:]) for op in ops]
+
+
+def shard_worker(conn):
+    shard = LotShard()
+    while True:
+        ops = conn.recv()
+        if ops is None:
+            break
+        conn.send(shard.execute(ops))
+
+
+class ShardPool:
+    """按拍品编号把拍品分配到多个工作进程，workers 为 0 时在当前进程内处理"""
+
+    def __init__(self, workers=0):
+        self.workers = workers
+        self.local = LotShard() if workers == 0 else None
+        self.pipes = []
+        self.processes = []
+        for _ in range(workers):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=shard_worker, args=(child_conn,), daemon=True)
+            process.start()
+            self.pipes.append(parent_conn)
+            self.processes.append(process)
+
+    def shard_of(self, lot_id):
+        return lot_id % self.workers
+
+    def execute(self, ops):
+        # ops 中每一项形如 (操作名, 拍品编号, ...)，返回值与 ops 一一对应
+        if self.local is not None:
+            return self.local.execute(ops)
+
+        batches = {}
+        for index, op in enumerate(ops):
+            batches.setdefault(self.shard_of(op[1]), []).append((index, op))
+        # 先把各分片的批次全部发出，再逐个收结果，各分片并行处理
+        for shard, entries in batches.items():
+            self.pipes[shard].send([op for _, op in entries])
+        results = [None] * len(ops)
+        for shard, entries in batches.items():
+            for (index, _), result in zip(entries, self.pipes[shard].recv()):
+                results[index] = result
+        return results
+
+    def close(self):
+        for conn in self.pipes:
+            conn.send(None)
+        for process in self.processes:
+            process.join(timeout=1)
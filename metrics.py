@@ -0,0 +1,173 @@
+import bisect
+import http.server
+import json
+import os
+import threading
+import time
+
+from logs import get_logger
+
+log = get_logger('metrics')
+
+
+class Counter:
+    """单调递增的计数器，label 用于区分同一指标下的不同取值，例如拒绝原因"""
+
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, label=''):
+        with self.lock:
+            self.values[label] = self.values.get(label, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        if not values and self.label is None:
+            values[''] = 0
+        for label, value in sorted(values.items()):
+            labels = f'{{{self.label}="{label}"}}' if self.label else ''
+            yield f"{self.name}{labels}", value
+
+
+class Histogram:
+    """固定分桶的耗时直方图(秒)，记录一次只做一次二分查找和几次加法"""
+
+    BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+    def __init__(self, name, help, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.bounds = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.bounds, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += seconds
+
+    def samples(self):
+        with self.lock:
+            counts = list(self.counts)
+            total = self.sum
+        cumulative = 0
+        for bound, count in zip(self.bounds, counts):
+            cumulative += count
+            yield f'{self.name}_bucket{{le="{bound}"}}', cumulative
+        cumulative += counts[-1]
+        yield f'{self.name}_bucket{{le="+Inf"}}', cumulative
+        yield f"{self.name}_sum", total
+        yield f"{self.name}_count", cumulative
+
+
+class Gauge:
+    """瞬时值，只在导出时调用 func 计算，平时没有任何开销"""
+
+    def __init__(self, name, help, func):
+        self.name = name
+        self.help = help
+        self.func = func
+
+    def samples(self):
+        yield self.name, self.func()
+
+
+class Metrics:
+    def __init__(self, prefix='auction_'):
+        self.prefix = prefix
+        self.metrics = []
+
+    def register(self, metric, kind):
+        metric.name = self.prefix + metric.name
+        metric.kind = kind
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, label=None):
+        return self.register(Counter(name, help, label), 'counter')
+
+    def histogram(self, name, help, buckets=Histogram.BUCKETS):
+        return self.register(Histogram(name, help, buckets), 'histogram')
+
+    def gauge(self, name, help, func):
+        return self.register(Gauge(name, help, func), 'gauge')
+
+    def render(self):
+        """Prometheus 文本格式"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, value in metric.samples():
+                lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        return {name: value for metric in self.metrics for name, value in metric.samples()}
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """在本机提供 http://127.0.0.1:端口/metrics，可直接由 Prometheus 抓取"""
+
+    def __init__(self, metrics, host='127.0.0.1', port=5202):
+        self.httpd = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.metrics = metrics
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        log.info("指标端口已开启", extra={'url': f"http://{self.httpd.server_address[0]}:{self.httpd.server_address[1]}/metrics"})
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class SnapshotWriter:
+    """每隔 interval 秒把全部指标以 JSON 写入文件，先写临时文件再替换，读取方不会读到半个文件"""
+
+    def __init__(self, metrics, path, interval=10):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def write(self):
+        state = {'time': time.time(), 'metrics': self.metrics.snapshot()}
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def close(self):
+        self.stopped.set()
@@ -0,0 +1,243 @@
+import asyncio
+import collections
+import socket
+import threading
+
+import capture
+import protocol
+
+
+class OutboundChannel:
+    """每个连接一个有界发送队列，由该连接自己的写线程/协程负责排空。
+
+    policy 决定慢消费者的处理方式: 'drop' 丢弃最旧的待发消息，'disconnect' 直接断开该连接。
+    """
+
+    def __init__(self, max_messages=1024, max_bytes=1 << 20, policy='drop', on_evict=None):
+        if policy not in ('drop', 'disconnect'):
+            raise ValueError(f"未知的慢消费者策略: {policy}")
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.on_evict = on_evict
+        self.queue = collections.deque()
+        self.queued_bytes = 0
+        self.dropped = 0
+        self.closed = False
+        self.binary = False
+        self.sequenced = False
+        # 抓包时由服务器设置，发出的每一帧都记一条 OUT
+        self.capture = None
+        self.conn_id = 0
+        self.lock = threading.Lock()
+
+    @property
+    def depth(self):
+        return len(self.queue)
+
+    def _admit(self, data):
+        # 调用方需持有 self.lock；返回 False 表示该连接应被断开
+        self.queue.append(data)
+        self.queued_bytes += len(data)
+        while len(self.queue) > self.max_messages or self.queued_bytes > self.max_bytes:
+            if self.policy == 'disconnect':
+                return False
+            old = self.queue.popleft()
+            self.queued_bytes -= len(old)
+            self.dropped += 1
+        return True
+
+    def _take_all(self):
+        # 一次取出全部待发消息并合并成一个缓冲区，减少系统调用次数
+        with self.lock:
+            if not self.queue:
+                return b''
+            data = b''.join(self.queue)
+            self.queue.clear()
+            self.queued_bytes = 0
+        return data
+
+    def _evict(self):
+        if self.on_evict:
+            self.on_evict(self)
+        self.close()
+
+
+class ThreadedChannel(OutboundChannel):
+    def __init__(self, conn, **kwargs):
+        super().__init__(**kwargs)
+        self.conn = conn
+        self.ready = threading.Condition(self.lock)
+        self.writer_thread = threading.Thread(target=self._drain, daemon=True)
+        self.writer_thread.start()
+
+    def send(self, data):
+        with self.lock:
+            if self.closed:
+                return False
+            if self.capture is not None:
+                self.capture.put(capture.OUT, self.conn_id, data[protocol.LENGTH.size:])
+            admitted = self._admit(data)
+            self.ready.notify()
+        if not admitted:
+            self._evict()
+        return admitted
+
+    def _drain(self):
+        while True:
+            with self.lock:
+                while not self.queue and not self.closed:
+                    self.ready.wait()
+                if self.closed:
+                    return
+            data = self._take_all()
+            if not data:
+                continue
+            try:
+                self.conn.sendall(data)
+            except OSError:
+                self.close()
+                return
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.clear()
+            self.queued_bytes = 0
+            self.ready.notify()
+        try:
+            # shutdown 能唤醒阻塞在 recv 上的读线程
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.conn.close()
+
+
+class LoopWaker:
+    """其他线程向同一事件循环里的连接发消息时，消息直接放进各连接的队列，
+    只记下需要唤醒的连接，每批只调用一次 call_soon_threadsafe，一条广播因此不会对每个连接各写一次唤醒管道"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.pending = []
+        self.scheduled = False
+        self.lock = threading.Lock()
+
+    def wake(self, channel):
+        with self.lock:
+            self.pending.append(channel)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.loop.call_soon_threadsafe(self.flush)
+
+    def flush(self):
+        with self.lock:
+            self.scheduled = False
+            channels, self.pending = self.pending, []
+        for channel in channels:
+            channel.ready.set()
+
+
+class AsyncChannel(OutboundChannel):
+    def __init__(self, writer, loop, write_buffer_limit=64 * 1024, waker=None, **kwargs):
+        super().__init__(**kwargs)
+        self.writer = writer
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()
+        # 同一事件循环的连接共用一个 waker
+        self.waker = waker if waker is not None else LoopWaker(loop)
+        self.ready = asyncio.Event()
+        # 传输层缓冲超过上限时 drain() 会阻塞，多出的消息留在本队列里受策略约束
+        writer.transport.set_write_buffer_limits(high=write_buffer_limit)
+        self.writer_task = loop.create_task(self._drain())
+
+    def send(self, data):
+        if self.closed:
+            return False
+        if self.capture is not None:
+            self.capture.put(capture.OUT, self.conn_id, data[protocol.LENGTH.size:])
+        if threading.get_ident() != self.loop_thread_id:
+            with self.lock:
+                admitted = self._admit(data)
+            if not admitted:
+                self._evict()
+                return False
+            self.waker.wake(self)
+            return True
+        return self._enqueue(data)
+
+    def _enqueue(self, data):
+        if self.closed:
+            return False
+        with self.lock:
+            admitted = self._admit(data)
+        if not admitted:
+            self._evict()
+            return False
+        self.ready.set()
+        return True
+
+    async def _drain(self):
+        try:
+            while not self.closed:
+                await self.ready.wait()
+                self.ready.clear()
+                data = self._take_all()
+                if data:
+                    self.writer.write(data)
+                    await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            self.close()
+
+    def close(self):
+        if threading.get_ident() != self.loop_thread_id:
+            self.loop.call_soon_threadsafe(self.close)
+            return
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.queued_bytes = 0
+        self.ready.set()
+        self.writer_task.cancel()
+        # abort 不等待缓冲区发送完毕，读协程会随即收到连接断开
+        self.writer.transport.abort()
+
+
+class OutgoingFrames:
+    """同一条消息的文本帧和二进制帧，按需编码且各只编码一次。
+
+    packet 为 None 时二进制客户端收到包装成 OP_TEXT 的文本，为 protocol.TEXT_ONLY 时不发给二进制客户端；
+    message 为 None 时不发给文本客户端。带 seq 的广播发给 sequenced 连接时附上序号。
+    """
+
+    def __init__(self, message, packet=None, seq=None):
+        self.message = message
+        self.packet = packet
+        self.seq = seq
+        self.frames = {}
+
+    def send(self, conn):
+        # 返回是否真的发给了该连接
+        if conn.binary and self.packet == protocol.TEXT_ONLY:
+            return False
+        if not conn.binary and self.message is None:
+            return False
+        key = (conn.binary, conn.sequenced and self.seq is not None)
+        data = self.frames.get(key)
+        if data is None:
+            data = self.frames[key] = self.encode(*key)
+        conn.send(data)
+        return True
+
+    def encode(self, binary, sequenced):
+        if binary:
+            packet = self.packet if self.packet is not None else protocol.encode_text(self.message)
+            if sequenced:
+                packet = protocol.encode_sequenced(self.seq, packet)
+            return protocol.frame(packet)
+        message = f"#{self.seq} {self.message}" if sequenced else self.message
+        return protocol.frame(message.encode('utf-8'))
@@ -0,0 +1,305 @@
+import struct
+
+# 二进制协议: 客户端的第一帧以 0x00 开头即表示使用二进制协议，否则沿用 "用户名,余额" 文本协议。
+# 每帧仍是 4 字节大端长度前缀 + 负载，负载第一个字节为操作码，整数字段用大端定长编码。
+# 拍品名称只在 LOT 消息里出现一次，之后的消息都只携带 4 字节的拍品编号。
+# 以 RESUME 登录(文本为 "用户名,余额,最后序号")的客户端收到的广播都带序号: 文本为 "#序号 消息"，
+# 二进制为 OP_SEQUENCED 包装；重连时服务器补发错过的广播，落后太多则发送快照，最后以 SYNC 结束。
+# 这类客户端登录后还会收到会话令牌(SESSION)，断线后在宽限期内带着令牌重连即可接管原会话。
+
+# 客户端 -> 服务器
+OP_HELLO = 0x00    # !Q 余额 + 用户名
+OP_BID = 0x01      # !IQ 拍品编号(0 表示当前拍品) 金额
+OP_BALANCE = 0x02  # !Q 余额，仅为兼容保留，服务器忽略
+OP_EXIT = 0x03
+OP_SUB = 0x04      # !I 拍品编号
+OP_UNSUB = 0x05    # !I 拍品编号
+OP_RESUME = 0x06   # !QQ16s 余额 最后收到的广播序号 会话令牌(首次登录全 0) + 用户名，代替 HELLO
+OP_MAX = 0x07      # !IQ 拍品编号(0 表示当前拍品) 代理出价上限，由服务器按加价幅度自动跟价
+
+# 服务器 -> 客户端
+OP_TEXT = 0x10     # UTF-8 文本，用于没有专门编码的消息
+OP_LOT = 0x11      # !IQ 拍品编号 起拍价 + 商品名
+OP_LEADER = 0x12   # !IQQ 拍品编号 金额 序号 + 用户名
+OP_WINNER = 0x13   # !IQ 拍品编号 成交价，只发给赢家
+OP_SOLD = 0x14     # !IQ 拍品编号 成交价 + 赢家用户名
+OP_END = 0x15      # !I 拍品编号，拍品结束
+OP_ERROR = 0x16    # !B 错误码
+OP_BALANCE_UPDATE = 0x17  # !qq 新余额 变化量
+OP_SEQUENCED = 0x18  # !Q 广播序号 + 被包装的消息
+OP_SNAPSHOT = 0x19   # !Q 序号，之后的 LOT/LEADER 消息是完整的拍品状态
+OP_SYNC = 0x1A       # !Q 序号，补发结束
+OP_SESSION = 0x1B    # 16 字节会话令牌
+OP_DEADLINE = 0x1C   # !II 拍品编号 距离自动成交的毫秒数，开拍和尾盘延时时发送
+
+ERROR_CODES = {'no_lot': 1, 'sold': 2, 'low': 3, 'format': 4, 'unknown': 5, 'outbid': 6, 'throttled': 7}
+
+# 错误码对应的提示，服务器回复文本客户端、二进制客户端显示错误时共用
+REJECT_MESSAGES = {
+    'no_lot': "当前没有进行中的拍卖，无法出价。",
+    'sold': "该商品已成交，无法出价。",
+    'low': "出价过低或余额不足。",
+    'format': "消息格式不正确。",
+    'unknown': "ERROR: 未知命令",
+    'outbid': "您的出价已被其他用户的代理出价超过。",
+    'throttled': "请求过于频繁，部分消息已被丢弃。",
+}
+
+# 作为 packet 传给发送函数时表示该消息只发给文本协议客户端
+TEXT_ONLY = b''
+
+LENGTH = struct.Struct('>I')
+# 服务器接受的客户端单帧上限，登录和命令都远小于此
+MAX_FRAME = 4096
+HELLO = struct.Struct('>BQ')
+RESUME = struct.Struct('>BQQ16s')
+TOKEN_BYTES = 16
+BID = struct.Struct('>BIQ')
+BALANCE = struct.Struct('>BQ')
+LOT_REF = struct.Struct('>BI')
+LOT = struct.Struct('>BIQ')
+LEADER = struct.Struct('>BIQQ')
+ERROR = struct.Struct('>BB')
+BALANCE_UPDATE = struct.Struct('>Bqq')
+SEQ = struct.Struct('>BQ')
+DEADLINE = struct.Struct('>BII')
+
+
+class FrameTooLarge(ValueError):
+    pass
+
+
+class FrameDecoder:
+    """增量帧解析器: 每次 recv 到的数据追加到缓冲区，一次取出其中所有完整的帧。
+
+    指定 max_frame 时，长度前缀一到就检查，超过上限立即抛出 FrameTooLarge，不等负载收完
+    """
+
+    def __init__(self, max_frame=None):
+        self.buffer = bytearray()
+        self.max_frame = max_frame
+
+    def feed(self, data):
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        offset = 0
+        size = len(buffer)
+        while size - offset >= 4:
+            length = LENGTH.unpack_from(buffer, offset)[0]
+            if self.max_frame is not None and length > self.max_frame:
+                raise FrameTooLarge(f"帧长度 {length} 超过上限 {self.max_frame}")
+            end = offset + 4 + length
+            if end > size:
+                break
+            frames.append(bytes(buffer[offset + 4:end]))
+            offset = end
+        if offset:
+            del buffer[:offset]
+        return frames
+
+
+def frame(payload):
+    return LENGTH.pack(len(payload)) + payload
+
+
+def is_binary_hello(payload):
+    return payload[:1] in (b'\x00', b'\x06')
+
+
+class TextCodec:
+    binary = False
+
+    def decode_login(self, payload):
+        """返回 (用户名, 余额, 最后序号, 会话令牌)，旧客户端不带序号和令牌时为 None"""
+        fields = payload.decode('utf-8').split(',')
+        last_seq = int(fields[2]) if len(fields) > 2 else None
+        token = fields[3] if len(fields) > 3 and fields[3] else None
+        return fields[0], int(fields[1]), last_seq, token
+
+    def decode(self, payload):
+        """把一帧解析成命令元组，例如 ('BID', 拍品编号或 None, 金额)"""
+        message = payload.decode('utf-8')
+        parts = message.split()
+        if message == 'EXIT':
+            return ('EXIT',)
+        if parts and parts[0] in ('BID', 'MAX'):
+            # "BID 金额" 对当前拍品出价，"BID 拍品编号 金额" 对指定拍品出价；MAX 的格式相同，金额为代理出价上限
+            try:
+                if len(parts) == 3:
+                    return (parts[0], int(parts[1]), int(parts[2]))
+                return (parts[0], None, int(parts[1]))
+            except (IndexError, ValueError):
+                return ('INVALID', 'format', "出价格式无效。")
+        if message.startswith('BALANCE'):
+            try:
+                return ('BALANCE', int(parts[1]))
+            except (IndexError, ValueError):
+                return ('INVALID', 'format', "ERROR: 余额格式不正确")
+        if parts and parts[0] in ('SUB', 'UNSUB'):
+            try:
+                return (parts[0], int(parts[1]))
+            except (IndexError, ValueError):
+                return ('INVALID', 'format', "ERROR: 拍品编号格式不正确")
+        return ('UNKNOWN', message)
+
+
+class BinaryCodec:
+    binary = True
+
+    def decode_login(self, payload):
+        if payload[0] == OP_RESUME:
+            _, balance, last_seq, token = RESUME.unpack_from(payload)
+            return payload[RESUME.size:].decode('utf-8'), balance, last_seq, token.hex() if any(token) else None
+        _, balance = HELLO.unpack_from(payload)
+        return payload[HELLO.size:].decode('utf-8'), balance, None, None
+
+    def decode(self, payload):
+        try:
+            op = payload[0]
+            if op == OP_BID:
+                _, lot_id, amount = BID.unpack(payload)
+                return ('BID', lot_id or None, amount)
+            if op == OP_MAX:
+                _, lot_id, amount = BID.unpack(payload)
+                return ('MAX', lot_id or None, amount)
+            if op == OP_BALANCE:
+                return ('BALANCE', BALANCE.unpack(payload)[1])
+            if op == OP_EXIT:
+                return ('EXIT',)
+            if op == OP_SUB:
+                return ('SUB', LOT_REF.unpack(payload)[1])
+            if op == OP_UNSUB:
+                return ('UNSUB', LOT_REF.unpack(payload)[1])
+        except (IndexError, struct.error):
+            return ('INVALID', 'format', "ERROR: 消息格式不正确")
+        return ('UNKNOWN', payload[:1].hex())
+
+
+def codec_for(payload):
+    return BinaryCodec() if is_binary_hello(payload) else TextCodec()
+
+
+def encode_hello(username, balance):
+    return HELLO.pack(OP_HELLO, balance) + username.encode('utf-8')
+
+
+def encode_resume(username, balance, last_seq, token=None):
+    raw = bytes.fromhex(token) if token else bytes(TOKEN_BYTES)
+    return RESUME.pack(OP_RESUME, balance, last_seq, raw) + username.encode('utf-8')
+
+
+def encode_bid(lot_id, amount):
+    return BID.pack(OP_BID, lot_id or 0, amount)
+
+
+def encode_max(lot_id, maximum):
+    return BID.pack(OP_MAX, lot_id or 0, maximum)
+
+
+def encode_balance(balance):
+    return BALANCE.pack(OP_BALANCE, balance)
+
+
+def encode_exit():
+    return bytes((OP_EXIT,))
+
+
+def encode_sub(lot_id):
+    return LOT_REF.pack(OP_SUB, lot_id)
+
+
+def encode_unsub(lot_id):
+    return LOT_REF.pack(OP_UNSUB, lot_id)
+
+
+def encode_text(text):
+    return bytes((OP_TEXT,)) + text.encode('utf-8')
+
+
+def encode_lot(lot_id, item, start_bid):
+    return LOT.pack(OP_LOT, lot_id, start_bid) + item.encode('utf-8')
+
+
+def encode_leader(lot_id, username, amount, seq):
+    return LEADER.pack(OP_LEADER, lot_id, amount, seq) + username.encode('utf-8')
+
+
+def encode_winner(lot_id, price):
+    return LOT.pack(OP_WINNER, lot_id, price)
+
+
+def encode_sold(lot_id, winner, price):
+    return LOT.pack(OP_SOLD, lot_id, price) + winner.encode('utf-8')
+
+
+def encode_end(lot_id):
+    return LOT_REF.pack(OP_END, lot_id)
+
+
+def encode_error(reason):
+    return ERROR.pack(OP_ERROR, ERROR_CODES[reason])
+
+
+def encode_balance_update(balance, delta):
+    return BALANCE_UPDATE.pack(OP_BALANCE_UPDATE, balance, delta)
+
+
+def encode_sequenced(seq, packet):
+    return SEQ.pack(OP_SEQUENCED, seq) + packet
+
+
+def encode_snapshot(seq):
+    return SEQ.pack(OP_SNAPSHOT, seq)
+
+
+def encode_sync(seq):
+    return SEQ.pack(OP_SYNC, seq)
+
+
+def encode_deadline(lot_id, remaining):
+    return DEADLINE.pack(OP_DEADLINE, lot_id, max(0, int(remaining * 1000)))
+
+
+def encode_session(token):
+    return bytes((OP_SESSION,)) + bytes.fromhex(token)
+
+
+def decode_server_message(payload):
+    """供二进制客户端使用: 把服务器消息解析成元组"""
+    op = payload[0]
+    if op == OP_TEXT:
+        return ('TEXT', payload[1:].decode('utf-8'))
+    if op == OP_LOT:
+        _, lot_id, start_bid = LOT.unpack_from(payload)
+        return ('LOT', lot_id, payload[LOT.size:].decode('utf-8'), start_bid)
+    if op == OP_LEADER:
+        _, lot_id, amount, seq = LEADER.unpack_from(payload)
+        return ('LEADER', lot_id, payload[LEADER.size:].decode('utf-8'), amount, seq)
+    if op == OP_WINNER:
+        _, lot_id, price = LOT.unpack(payload)
+        return ('WINNER', lot_id, price)
+    if op == OP_SOLD:
+        _, lot_id, price = LOT.unpack_from(payload)
+        return ('SOLD', lot_id, payload[LOT.size:].decode('utf-8'), price)
+    if op == OP_END:
+        return ('END', LOT_REF.unpack(payload)[1])
+    if op == OP_SEQUENCED:
+        return ('SEQ', SEQ.unpack_from(payload)[1], decode_server_message(payload[SEQ.size:]))
+    if op == OP_SNAPSHOT:
+        return ('SNAPSHOT', SEQ.unpack(payload)[1])
+    if op == OP_SYNC:
+        return ('SYNC', SEQ.unpack(payload)[1])
+    if op == OP_DEADLINE:
+        _, lot_id, remaining_ms = DEADLINE.unpack(payload)
+        return ('DEADLINE', lot_id, remaining_ms / 1000)
+    if op == OP_SESSION:
+        return ('SESSION', payload[1:].hex())
+    if op == OP_BALANCE_UPDATE:
+        _, balance, delta = BALANCE_UPDATE.unpack(payload)
+        return ('BALANCE', balance, delta)
+    if op == OP_ERROR:
+        code = ERROR.unpack(payload)[1]
+        reasons = {value: key for key, value in ERROR_CODES.items()}
+        return ('ERROR', reasons.get(code, code))
+    return ('UNKNOWN', op)
@@ -0,0 +1,288 @@
+"""抓包回放: 用 serve.py --capture 抓到的流量驱动一个全新的进程内服务器，
+比对各拍品的最终结果，并统计吞吐和延迟，抓到的会话因此可以作为性能回归的基准。
+
+示例: python replay.py storm.cap             按原速回放
+      python replay.py storm.cap --speed 10  十倍速
+      python replay.py storm.cap --speed 0   不等待，尽快发送
+倍速回放时按时间自动成交的拍品会和原来的出价错开，结果只在原速下可比。
+"""
+import argparse
+import asyncio
+import collections
+import json
+import socket
+import sys
+import threading
+import time
+
+import capture
+from loadgen import percentile
+from logs import setup_logging
+import protocol
+from serve import AuctionServer
+
+
+class ReplayConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.codec = None
+        # 已发出、还没收到任何回应的出价的发送时间
+        self.pending = collections.deque()
+
+
+class Replayer:
+    def __init__(self, server, port, speed):
+        self.server = server
+        self.port = port
+        self.speed = speed
+        self.connections = {}
+        self.tasks = []
+        self.frames_sent = 0
+        self.bids_sent = 0
+        self.frames_received = 0
+        self.latencies = []
+
+    def processed(self):
+        # 服务器已经收下的帧: 交给处理的加上被限流丢弃的
+        throttled = self.server.m_throttled.values
+        return (sum(self.server.m_frames_in.values.values()) + throttled.get('connection', 0)
+                + throttled.get('user', 0))
+
+    async def settle(self, timeout=2):
+        # 等服务器把已发出的帧都收下，控制操作和出价的先后才与抓包时一致
+        deadline = time.monotonic() + timeout
+        while self.processed() < self.frames_sent and time.monotonic() < deadline:
+            await asyncio.sleep(0.001)
+
+    async def receive(self, connection):
+        decoder = protocol.FrameDecoder()
+        while True:
+            try:
+                data = await connection.reader.read(65536)
+            except ConnectionError:
+                return
+            if not data:
+                return
+            now = time.monotonic()
+            for _ in decoder.feed(data):
+                self.frames_received += 1
+                if connection.pending:
+                    self.latencies.append(now - connection.pending.popleft())
+
+    async def open(self, conn_id):
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        connection = self.connections[conn_id] = ReplayConnection(reader, writer)
+        self.tasks.append(asyncio.ensure_future(self.receive(connection)))
+
+    async def send(self, conn_id, payload):
+        connection = self.connections.get(conn_id)
+        if connection is None or connection.writer.is_closing():
+            return
+        if connection.codec is None:
+            connection.codec = protocol.codec_for(payload)
+        elif connection.codec.decode(payload)[0] in ('BID', 'MAX'):
+            connection.pending.append(time.monotonic())
+            self.bids_sent += 1
+        connection.writer.write(protocol.frame(payload))
+        self.frames_sent += 1
+        await connection.writer.drain()
+
+    async def run(self, records):
+        first = records[0][1] if records else 0
+        started = time.monotonic()
+        for kind, stamp, conn_id, payload in records:
+            if self.speed:
+                delay = started + (stamp - first) / 1e9 / self.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            try:
+                if kind == capture.OPEN:
+                    await self.open(conn_id)
+                elif kind == capture.IN:
+                    await self.send(conn_id, payload)
+                elif kind == capture.CLOSE:
+                    connection = self.connections.get(conn_id)
+                    if connection is not None:
+                        connection.writer.close()
+                elif kind == capture.CONTROL:
+                    await self.settle()
+                    name, *args = json.loads(payload)
+                    getattr(self.server, name)(*args)
+            except (ConnectionError, OSError) as e:
+                print(f"连接 {conn_id} 回放失败: {e}", file=sys.stderr)
+        return time.monotonic() - started
+
+    async def finish(self, linger):
+        await self.settle()
+        await asyncio.sleep(linger)
+        for task in self.tasks:
+            task.cancel()
+        for connection in self.connections.values():
+            connection.writer.close()
+
+
+def load(path):
+    """拆成服务器参数、需要按时间回放的记录、原来的拍品结果 {拍品编号: (商品, 赢家, 价格, 是否成交)} 和发出的帧数"""
+    meta = {}
+    records = []
+    outcomes = {}
+    sent = 0
+    for record in capture.read_capture(path):
+        kind, _, _, payload = record
+        if kind == capture.META:
+            meta = json.loads(payload)
+        elif kind == capture.OUTCOME:
+            lot_id, item, winner, price, sold = json.loads(payload)
+            outcomes[lot_id] = (item, winner, price, sold)
+        elif kind == capture.OUT:
+            sent += 1
+        else:
+            records.append(record)
+    return meta, records, outcomes, sent
+
+
+def final_state(server, events):
+    """{拍品编号: (商品, 赢家, 价格, 是否成交)}: 已结算的取自事件流，进行中的在序列器里读取，与正在处理的出价不会交错"""
+    done = threading.Event()
+    state = {}
+
+    def read():
+        for lot_id, status in server.lot_status.items():
+            state[lot_id] = (status['item'], status['winner'], status['current_bid'], None)
+        done.set()
+
+    server.sequencer.submit(read)
+    done.wait(5)
+    while not events.empty():
+        event = events.get_nowait()
+        if event[0] == 'settled':
+            lot_id, item, winner, price, sold = event[1:]
+            state[lot_id] = (item, winner, price, sold)
+    return state
+
+
+def compare(expected, actual):
+    mismatches = []
+    for lot_id, (item, winner, price, sold) in sorted(expected.items()):
+        got = actual.get(lot_id)
+        if got is None:
+            mismatches.append((lot_id, item, (winner, price, sold), None))
+            continue
+        # 抓包结束时还没结束的拍品只比领先者和价格
+        want = (item, winner, price, sold) if sold is not None else (item, winner, price)
+        have = got if sold is not None else got[:3]
+        if want != have:
+            mismatches.append((lot_id, item, want[1:], have[1:]))
+    return mismatches
+
+
+def histogram_quantile(histogram, fraction):
+    # 取累计数达到该比例的那个桶的上界，只是估计值
+    with histogram.lock:
+        counts = list(histogram.counts)
+    total = sum(counts)
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, counts):
+        cumulative += count
+        if total and cumulative >= total * fraction:
+            return bound
+    return histogram.bounds[-1] if total else 0.0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(meta, options):
+    port = free_port()
+    if options.no_limits:
+        limits = {'conn_rate': 0, 'user_rate': 0}
+    else:
+        limits = {key: meta[key] for key in ('conn_rate', 'conn_burst', 'user_rate', 'user_burst') if key in meta}
+    # 回放的连接都来自本机，不限制来源地址的连接数
+    server = AuctionServer('127.0.0.1', port, options.mode or meta.get('mode', 'asyncio'),
+                           bid_tick=meta.get('bid_tick', 0.005),
+                           lot_workers=meta.get('lot_workers', 0) if options.workers is None else options.workers,
+                           session_grace=meta.get('session_grace', 30), lot_duration=meta.get('lot_duration', 0),
+                           soft_close=meta.get('soft_close', 10), extension=meta.get('extension', 10),
+                           timer_tick=meta.get('timer_tick', 0.1), max_frame=meta.get('max_frame', protocol.MAX_FRAME),
+                           acceptors=options.acceptors, max_conns_per_address=0, **limits)
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 5
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server, port
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="抓包回放与结果比对")
+    parser.add_argument('capture', help="serve.py --capture 生成的文件")
+    parser.add_argument('--speed', type=float, default=1, help="回放倍速，0 为不等待")
+    parser.add_argument('--mode', choices=('thread', 'asyncio', 'pool'), default=None,
+                        help="服务器模式，默认与抓包时相同")
+    parser.add_argument('--workers', type=int, default=None, help="拍品分片进程数，默认与抓包时相同")
+    parser.add_argument('--acceptors', type=int, default=0, help="pool 模式的接入进程数")
+    parser.add_argument('--no-limits', action='store_true', help="关闭限流，用于测最大吞吐")
+    parser.add_argument('--linger', type=float, default=1.0, help="发送完后继续接收消息的时间(秒)")
+    parser.add_argument('--json', default=None, help="把结果另存为 JSON 文件")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    setup_logging(None, 'WARNING')
+    meta, records, expected, captured_out = load(options.capture)
+    server, port = start_server(meta, options)
+    # 结算之后服务器不再保存拍品状态，结果从事件流里收集
+    events = server.events.subscribe(maxsize=0)
+    replayer = Replayer(server, port, options.speed)
+
+    async def drive():
+        elapsed = await replayer.run(records)
+        await replayer.finish(options.linger)
+        return elapsed
+
+    elapsed = asyncio.run(drive())
+    mismatches = compare(expected, final_state(server, events))
+    latencies = sorted(replayer.latencies)
+    report = {
+        'speed': options.speed,
+        'seconds': round(elapsed, 2),
+        'connections': len(replayer.connections),
+        'frames_sent': replayer.frames_sent,
+        'frames_per_sec': round(replayer.frames_sent / elapsed, 1) if elapsed else 0,
+        'bids_sent': replayer.bids_sent,
+        'bids_per_sec': round(replayer.bids_sent / elapsed, 1) if elapsed else 0,
+        'bids_accepted': sum(server.m_bids_accepted.values.values()),
+        'frames_received': replayer.frames_received,
+        'frames_captured_out': captured_out,
+        'response_p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'response_p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'response_p999_ms': round(percentile(latencies, 0.999) * 1000, 2),
+        # 以最快速度回放时连接往往先于回应关闭，这时以序列器处理一批出价的耗时为准
+        'bid_batch_p50_ms': round(histogram_quantile(server.m_bid_batch, 0.50) * 1000, 3),
+        'bid_batch_p99_ms': round(histogram_quantile(server.m_bid_batch, 0.99) * 1000, 3),
+        'lots_compared': len(expected),
+        'lots_mismatched': len(mismatches),
+    }
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    for lot_id, item, want, have in mismatches:
+        print(f"结果不一致: 拍品 {lot_id} '{item}' 抓包 {want} 回放 {have}")
+    if options.json:
+        report['mismatches'] = mismatches
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
 import tkinter as tk
 from tkinter import messagebox
-import json
-import random
+
+from catalog import open_catalog
 
 class AuctionApp:
     def __init__(self, root, items):
@@ -40,8 +40,7 @@ class AuctionApp:
 
     def get_random_item(self):
         """从商品分类中随机获取一个商品"""
-        category = random.choice(list(self.items.keys()))
-        return random.choice(self.items[category])
+        return self.items.random_item()[1]
 
     def increment_buttons(self):
         """创建加价快捷按钮 +1, +2, +3"""
@@ -113,11 +112,9 @@ class AuctionApp:
         self.reset_countdown()
 
 def load_items_from_json(file_path):
-    """从JSON文件中加载商品数据"""
+    """从JSON文件的目录索引中加载商品数据"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            items = json.load(file)
-        return items
+        return open_catalog(file_path)
     except Exception as e:
         messagebox.showerror("加载失败", f"无法加载商品数据: {e}")
         return {}
@@ -0,0 +1,182 @@
+"""密封出价轮次。
+
+一轮内的拍品同时开放，出价者互相看不到出价，截止后一次性清算全部拍品:
+first 为一价密封(赢家付自己的出价)，second 为维克里二价密封(赢家付次高出价，至少为起拍价)。
+出价按列存放在三个 array 中(拍品序号、出价者序号、金额)，同一出价者对同一拍品重复出价时原地覆盖。
+清算时有 NumPy 则直接在这三列上排序求每个拍品的最高价和次高价，没有则逐行扫描；之后按拍品顺序扣减赢家的余额，
+同一出价者赢得多个拍品付不起时由下一个有效出价接替，只有这些拍品才逐个重新清算。
+"""
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PRICING = ('first', 'second')
+
+
+class SealedRound:
+    def __init__(self, pricing='second', deadline=None):
+        if pricing not in PRICING:
+            raise ValueError(f"未知的密封出价方式: {pricing}")
+        self.pricing = pricing
+        self.deadline = deadline
+        # 拍品和出价者都映射成从 0 开始的连续序号，列里只存序号
+        self.lot_ids = []
+        self.lot_index = {}
+        self.reserves = []
+        self.bidders = []
+        self.bidder_index = {}
+        self.lot_col = array('I')
+        self.bidder_col = array('I')
+        self.amount_col = array('q')
+        self.rows = {}
+
+    def __len__(self):
+        return len(self.amount_col)
+
+    def __contains__(self, lot_id):
+        return lot_id in self.lot_index
+
+    def add_lot(self, lot_id, reserve):
+        self.lot_index[lot_id] = len(self.lot_ids)
+        self.lot_ids.append(lot_id)
+        self.reserves.append(reserve)
+
+    def bid(self, username, lot_id, amount):
+        """登记出价，不高于起拍价时返回 False；同一出价者的新出价替换旧出价"""
+        lot = self.lot_index[lot_id]
+        if amount <= self.reserves[lot]:
+            return False
+        bidder = self.bidder_index.get(username)
+        if bidder is None:
+            bidder = self.bidder_index[username] = len(self.bidders)
+            self.bidders.append(username)
+        row = self.rows.get((lot, bidder))
+        if row is None:
+            self.rows[(lot, bidder)] = len(self.amount_col)
+            self.lot_col.append(lot)
+            self.bidder_col.append(bidder)
+            self.amount_col.append(amount)
+        else:
+            self.amount_col[row] = amount
+        return True
+
+    def bids(self):
+        for lot, bidder, amount in zip(self.lot_col, self.bidder_col, self.amount_col):
+            yield self.lot_ids[lot], self.bidders[bidder], amount
+
+    def clear(self, balances, open_lots=None):
+        """balances 为 {用户名: 余额}，按拍品顺序清算，每个出价者已赢得的成交价从其余额里扣除，
+        超过剩余余额的出价作废，由下一个有效出价接替，清算结果因此都付得起。
+        给出 open_lots 时跳过不在其中的拍品(已经不存在)，它们的出价不占用余额。
+
+        返回 [(拍品编号, 赢家, 成交价)]，覆盖本轮其余全部拍品，无人出价的拍品赢家为 None。
+        金额相同时先出价者胜出。
+        """
+        funds = [balances.get(username, 0) for username in self.bidders]
+        if numpy is not None:
+            winners = self.clear_vectorized(funds)
+        else:
+            winners = self.clear_rows(funds)
+        # 先按开始时的余额一次求出各拍品的最高价和次高价，再按拍品顺序扣减余额；
+        # 只有赢家或定价的出价者已经付不起时，才在剩余余额下重新清算该拍品
+        remaining = funds
+        by_lot = None
+        results = []
+        for lot, lot_id in enumerate(self.lot_ids):
+            if open_lots is not None and lot_id not in open_lots:
+                continue
+            entry = winners.get(lot)
+            if entry is not None:
+                bidder, top, rival, second = entry
+                if top > remaining[bidder] or (self.pricing == 'second' and rival is not None
+                                               and second > remaining[rival]):
+                    if by_lot is None:
+                        by_lot = self.rows_by_lot()
+                    entry = self.clear_lot(lot, by_lot.get(lot, ()), remaining)
+            if entry is None:
+                results.append((lot_id, None, None))
+                continue
+            bidder, top, rival, second = entry
+            price = self.price(top, second, self.reserves[lot])
+            remaining[bidder] -= price
+            results.append((lot_id, self.bidders[bidder], price))
+        return results
+
+    def price(self, top, second, reserve):
+        return top if self.pricing == 'first' else max(second, reserve)
+
+    def rows_by_lot(self):
+        # {拍品序号: [(金额, 出价者序号)]}，按金额降序、到达顺序升序排列，只在有拍品需要重新清算时建立
+        if numpy is None:
+            by_lot = {}
+            for row, (lot, bidder, amount) in enumerate(zip(self.lot_col, self.bidder_col, self.amount_col)):
+                by_lot.setdefault(lot, []).append((-amount, row, bidder))
+            return {lot: [(-negative, bidder) for negative, _, bidder in sorted(rows)] for lot, rows in by_lot.items()}
+        lots = numpy.frombuffer(self.lot_col, dtype=numpy.uint32)
+        amounts = numpy.frombuffer(self.amount_col, dtype=numpy.int64)
+        order = numpy.lexsort((numpy.arange(len(lots)), -amounts, lots))
+        lots = lots[order]
+        amounts = amounts[order].tolist()
+        bidders = numpy.frombuffer(self.bidder_col, dtype=numpy.uint32)[order].tolist()
+        starts = numpy.flatnonzero(numpy.concatenate(([True], lots[1:] != lots[:-1]))).tolist()
+        ends = starts[1:] + [len(amounts)]
+        return {int(lots[start]): list(zip(amounts[start:end], bidders[start:end])) for start, end in zip(starts, ends)}
+
+    def clear_lot(self, lot, rows, remaining):
+        # 返回 (赢家序号, 最高价, 定价者序号, 次高价)，没有有效出价时返回 None
+        winner = None
+        for amount, bidder in rows:
+            if amount > remaining[bidder]:
+                continue
+            if winner is None:
+                winner = (bidder, amount)
+            else:
+                return (*winner, bidder, amount)
+        if winner is None:
+            return None
+        return (*winner, None, self.reserves[lot])
+
+    def clear_vectorized(self, funds):
+        # 返回 {拍品序号: (赢家序号, 最高价, 次高价的出价者序号或 None, 次高价或起拍价)}
+        if not self.amount_col:
+            return {}
+        lots = numpy.frombuffer(self.lot_col, dtype=numpy.uint32)
+        bidders = numpy.frombuffer(self.bidder_col, dtype=numpy.uint32)
+        amounts = numpy.frombuffer(self.amount_col, dtype=numpy.int64)
+        valid = amounts <= numpy.array(funds, dtype=numpy.int64)[bidders]
+        rows = numpy.flatnonzero(valid)
+        if not len(rows):
+            return {}
+        lots, bidders, amounts = lots[rows], bidders[rows], amounts[rows]
+        # 按拍品升序、金额降序、到达顺序升序排列，每个拍品的前两行就是最高价和次高价
+        order = numpy.lexsort((rows, -amounts, lots))
+        lots, bidders, amounts = lots[order], bidders[order], amounts[order]
+        count = len(lots)
+        starts = numpy.flatnonzero(numpy.concatenate(([True], lots[1:] != lots[:-1])))
+        following = numpy.minimum(starts + 1, count - 1)
+        has_second = (starts + 1 < count) & (lots[following] == lots[starts])
+        reserves = numpy.array(self.reserves, dtype=numpy.int64)[lots[starts]]
+        seconds = numpy.where(has_second, amounts[following], reserves)
+        return {int(lot): (int(bidder), int(top), int(rival) if second_exists else None, int(second))
+                for lot, bidder, top, rival, second_exists, second in zip(
+                    lots[starts].tolist(), bidders[starts].tolist(), amounts[starts].tolist(),
+                    bidders[following].tolist(), has_second.tolist(), seconds.tolist())}
+
+    def clear_rows(self, funds):
+        # 每个拍品只保留最高和次高两个出价: {拍品序号: [赢家序号, 最高价, 次高价的出价者序号, 次高价]}
+        best = {}
+        for lot, bidder, amount in zip(self.lot_col, self.bidder_col, self.amount_col):
+            if amount > funds[bidder]:
+                continue
+            entry = best.get(lot)
+            if entry is None:
+                best[lot] = [bidder, amount, None, self.reserves[lot]]
+            elif amount > entry[1]:
+                entry[2], entry[3] = entry[0], entry[1]
+                entry[0], entry[1] = bidder, amount
+            elif entry[2] is None or amount > entry[3]:
+                entry[2], entry[3] = bidder, amount
+        return {lot: tuple(entry) for lot, entry in best.items()}
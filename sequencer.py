@@ -0,0 +1,98 @@
+import queue
+import threading
+import time
+
+from logs import get_logger
+
+log = get_logger('sequencer')
+
+
+class BidSequencer:
+    """单写者出价序列器。
+
+    所有出价和开拍/成交操作都进入同一个队列，由一个线程按到达顺序逐个执行，
+    拍卖状态因此只有一个写者。同一个 tick 内到达的出价合并处理，只广播最终的领先者。
+    """
+
+    def __init__(self, server, tick=0.005):
+        self.server = server
+        self.tick = tick
+        self.queue = queue.SimpleQueue()
+        self.seq = 0
+        self.leaders = {}
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def submit_bid(self, username, lot_id, amount, proxy=False):
+        self.queue.put(('bid', username, lot_id, amount, proxy))
+
+    def submit(self, func, *args):
+        self.queue.put(('call', func, args))
+
+    def next_seq(self):
+        self.seq += 1
+        return self.seq
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.tick
+            while True:
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0:
+                        batch.append(self.queue.get(timeout=timeout))
+                    else:
+                        batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.process(batch)
+
+    def process(self, batch):
+        bids = []
+        for entry in batch:
+            if entry[0] == 'bid':
+                bids.append(entry[1:])
+                continue
+            # 开拍/成交之前先把已收集的出价处理并广播出去，保证消息顺序与执行顺序一致
+            self.apply_bids(bids)
+            bids = []
+            self.flush()
+            _, func, args = entry
+            try:
+                func(*args)
+            except Exception as e:
+                log.exception("序列器执行 %s 时发生错误: %s", func.__name__, e)
+        self.apply_bids(bids)
+        self.flush()
+        self.server.maybe_snapshot()
+
+    def apply_bids(self, bids):
+        if not bids:
+            return
+        started = time.perf_counter()
+        try:
+            results = self.server.apply_bids(bids)
+        except Exception as e:
+            log.exception("序列器处理出价时发生错误: %s", e)
+            return
+        self.server.m_bid_batch.observe(time.perf_counter() - started)
+        # 每个出价最多让拍品价格变化一次，代理出价的自动跟价已在分片里合并成最终结果
+        for (_, lot_id, _, _), change in zip(bids, results):
+            if change:
+                username, amount = change
+                seq = self.next_seq()
+                # 重新插入到末尾，flush 时各拍品的广播按序号递增
+                self.leaders.pop(lot_id, None)
+                self.leaders[lot_id] = (username, amount, seq)
+                self.server.record('bid', lot_id, username, amount, seq)
+        accepted_count = sum(1 for change in results if change)
+        self.server.m_bids_accepted.inc(accepted_count)
+        self.server.publish_bids(accepted_count, len(results) - accepted_count)
+
+    def flush(self):
+        leaders, self.leaders = self.leaders, {}
+        for lot_id, (username, amount, seq) in leaders.items():
+            self.server.announce_leader(lot_id, username, amount, seq)
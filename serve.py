@@ -1,24 +1,151 @@
-import json
+import argparse
+import asyncio
+import collections
+import logging
+import multiprocessing
 import socket
 import threading
-import tkinter as tk
-from tkinter import scrolledtext, StringVar, messagebox
-from tkinter import ttk
 import os
+import secrets
 import sys
-import struct
+import time
+
+from acceptors import AcceptorPool
+from admission import Admission
+from capture import CaptureWriter
+from catalog import open_catalog
+from control import ControlServer, load_schedule, run_schedule
+from events import BroadcastLog, EventBus
+from gateway import WebSocketGateway
+from journal import Journal
+from ledger import Ledger
+from logs import get_logger, setup_logging
+from lots import ShardPool
+from metrics import Metrics, MetricsServer, SnapshotWriter
+from outbound import AsyncChannel, LoopWaker, OutgoingFrames, ThreadedChannel
+from sealed import SealedRound
+from sequencer import BidSequencer
+from timers import TimerWheel
+import capture
+import protocol
+
+log = get_logger('server')
+
+# 密封出价轮次在时间轮里的键，拍品编号都是整数，不会冲突
+SEALED_TIMER = 'sealed'
 
 class AuctionServer:
-    def __init__(self, host='127.0.0.1', port=65432):
+    def __init__(self, host='127.0.0.1', port=65432, mode='thread',
+                 max_queue_messages=1024, max_queue_bytes=1 << 20, slow_policy='drop',
+                 bid_tick=0.005, lot_workers=0, journal_path=None, replay_log_size=4096, max_replay=512,
+                 session_grace=30, lot_duration=0, soft_close=10, extension=10, timer_tick=0.1, acceptors=0,
+                 max_frame=protocol.MAX_FRAME, conn_rate=50, conn_burst=100, user_rate=100, user_burst=200,
+                 max_conns_per_address=0, capture_path=None):
         self.host = host
         self.port = port
+        self.mode = mode
+        self.loop = None
+        self.waker = None
+        self.channel_options = {
+            'max_messages': max_queue_messages,
+            'max_bytes': max_queue_bytes,
+            'policy': slow_policy,
+        }
+        # 每个连接、每个用户每秒最多处理多少帧(可短时突发到 burst)，以及每个来源地址的并发连接上限
+        self.admission_options = {
+            'conn_rate': conn_rate,
+            'conn_burst': conn_burst,
+            'user_rate': user_rate,
+            'user_burst': user_burst,
+            'max_per_address': max_conns_per_address,
+        }
+        self.admission = Admission(**self.admission_options)
+        self.max_frame = max_frame
         self.clients = {}
-        self.auction_items = self.load_items('auction_items.json')
+        self.ledger = Ledger()
+        # 带会话令牌的用户意外断线后，会话在此保留 session_grace 秒，按断线先后排列
+        self.parked = collections.OrderedDict()
+        self.session_grace = session_grace
+        self.catalog = self.load_items('auction_items.json')
         self.current_item = None
+        self.current_lot = None
         self.current_bid = 10
-        self.current_winner = None
-        self.items_status = {}
-        self.gui = None
+        self.next_lot_id = 0
+        # 拍品编号 -> 商品名；同名商品可以同时有多个拍品，出价状态因此按拍品编号保存
+        self.lots = {}
+        self.lot_status = {}
+        self.events = EventBus()
+        # lot_duration 大于 0 时拍品到时自动成交；最后 soft_close 秒内有人出价，截止时间推迟到出价后 extension 秒
+        self.lot_duration = lot_duration
+        self.soft_close = soft_close
+        self.extension = extension
+        self.timer_tick = timer_tick
+        self.timers = TimerWheel(timer_tick, now=time.monotonic())
+        self.deadlines = {}
+        self.extended = set()
+        # 各拍品的代理出价上限 {拍品编号: {用户名: 上限}}，按登记顺序排列，仅用于写日志快照和恢复分片
+        self.proxies = {}
+        # 进行中的密封出价轮次，之后开拍的拍品都加入该轮，截止后一起清算
+        self.sealed = None
+        self.shards = ShardPool(lot_workers)
+        # pool 模式下连接由多个接入进程处理，本进程只负责序列器和拍卖状态；在启动其他线程之前 fork
+        self.acceptors = None
+        if mode == 'pool':
+            self.acceptors = AcceptorPool(acceptors or os.cpu_count() or 1, host, port, self.channel_options,
+                                          self.admission_options, max_frame)
+        self.sequencer = BidSequencer(self, tick=bid_tick)
+        self.journal = None
+        if journal_path:
+            self.journal = Journal(journal_path)
+            self.restore(*self.journal.recover())
+            self.journal.start()
+        self.capture = None
+        if capture_path:
+            if mode == 'pool':
+                raise ValueError("pool 模式的连接在接入进程中，不支持抓包")
+            # 回放时按这些参数创建同样的服务器
+            self.capture = CaptureWriter(capture_path, dict(
+                mode=mode, bid_tick=bid_tick, lot_workers=lot_workers, session_grace=session_grace,
+                lot_duration=lot_duration, soft_close=soft_close, extension=extension, timer_tick=timer_tick,
+                max_frame=max_frame, **self.admission_options))
+        self.broadcasts = BroadcastLog(replay_log_size, self.sequencer.seq)
+        self.max_replay = max_replay
+        self.snapshot_frames = {}
+        self.init_metrics()
+        self.sequencer.start()
+        threading.Thread(target=self.reap_sessions, daemon=True).start()
+        threading.Thread(target=self.tick_timers, daemon=True).start()
+
+    def init_metrics(self):
+        # 计数器和直方图在各自的路径上累加，瞬时值只在导出时计算
+        self.metrics = Metrics()
+        m = self.metrics
+        self.m_connections = m.counter('connections_total', "建立过的连接数")
+        self.m_frames_in = m.counter('frames_in_total', "收到的帧数")
+        self.m_frames_out = m.counter('frames_out_total', "投递到发送队列的帧数")
+        self.m_bids_received = m.counter('bids_received_total', "收到的出价数")
+        self.m_bids_accepted = m.counter('bids_accepted_total', "被接受的出价数")
+        self.m_bids_rejected = m.counter('bids_rejected_total', "被拒绝的出价数", label='reason')
+        self.m_settlements = m.counter('settlements_total', "结算次数", label='outcome')
+        self.m_evictions = m.counter('slow_consumer_evictions_total', "因发送队列超限断开的连接数")
+        self.m_throttled = m.counter('throttled_total', "限流丢弃的帧数和拒绝的连接数",
+                                     label='scope')
+        self.m_bid_batch = m.histogram('bid_batch_seconds', "序列器处理一批出价的耗时")
+        self.m_fanout = m.histogram('broadcast_fanout_seconds', "一次广播投递到所有接收者的耗时")
+        self.m_settle = m.histogram('settle_seconds', "一次结算的耗时")
+        self.m_sealed_clear = m.histogram('sealed_clear_seconds', "一轮密封出价求出全部赢家和成交价的耗时")
+        m.gauge('connected_clients', "在线客户端数", lambda: len(self.clients))
+        m.gauge('parked_sessions', "断线保留中的会话数", lambda: len(self.parked))
+        m.gauge('open_lots', "进行中的拍品数", lambda: len(self.lots))
+        m.gauge('sequencer_queue_depth', "序列器待处理的条目数", lambda: self.sequencer.queue.qsize())
+        m.gauge('broadcast_seq', "最新的广播序号", lambda: self.sequencer.seq)
+        m.gauge('outbound_queue_depth_total', "所有连接待发消息总数", lambda: sum(self.queue_depths()))
+        m.gauge('outbound_queue_depth_max', "单个连接待发消息数的最大值", lambda: max(self.queue_depths(), default=0))
+        m.gauge('outbound_dropped', "在线连接因队列满丢弃的消息数",
+                lambda: sum(client['conn'].dropped for client in list(self.clients.values())))
+
+    def queue_depths(self):
+        return [client['conn'].depth for client in list(self.clients.values())]
 
     def load_items(self, filename):
         if getattr(sys, 'frozen', False):
@@ -27,289 +154,963 @@ class AuctionServer:
             base_path = os.path.dirname(__file__)
         
         filepath = os.path.join(base_path, filename)
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        return open_catalog(filepath)
 
     def handle_client(self, conn, addr):
-        print(f"客户端连接: {addr}")
-        
+        log.info("客户端连接", extra={'addr': str(addr)})
+        self.m_connections.inc()
+        channel = ThreadedChannel(conn, on_evict=self.evict_channel, **self.channel_options)
+        self.capture_open(channel, addr)
+        username = None
+        bucket = self.admission.bucket()
+
         try:
-            message = self.receive_message(conn)
-            print(f"接收到的初始消息: {message}")
-            username, balance_str = message.split(',')
-            balance = int(balance_str) 
-            self.clients[username] = {'conn': conn, 'balance': balance, 'won_items': []}
-            self.update_client_list()
-            while True:
-                message = self.receive_message(conn)
-                print(f"接收到的消息: {message}")
-                if message == 'EXIT':
-                    print(f"处理退出请求: {username}")
-                    del self.clients[username]
-                    conn.close()
-                    print(f"客户端断开连接: {addr}")
-                    self.update_client_list()
+            frames = self.read_frames(conn, channel.conn_id)
+            payload = next(frames, None)
+            if payload is None:
+                return
+            username, codec = self.login(channel, payload)
+            for payload in frames:
+                if not self.admit(username, channel, bucket):
+                    continue
+                if not self.handle_frame(username, channel, codec, payload):
+                    break
+        except protocol.FrameTooLarge as e:
+            self.reject_oversized(e, addr, username)
+        except Exception as e:
+            log.warning("处理客户端时发生错误: %s", e, extra={'addr': str(addr), 'user': username})
+            self.send_message(channel, "ERROR: 处理请求时发生错误")
+        finally:
+            self.remove_client(username, channel)
+            channel.close()
+            self.admission.disconnect(addr[0])
+            if self.capture is not None:
+                self.capture.put(capture.CLOSE, channel.conn_id)
+            log.info("客户端断开连接", extra={'addr': str(addr), 'user': username})
+
+    async def handle_client_async(self, reader, writer):
+        addr = writer.get_extra_info('peername')
+        if not self.admit_connection(addr):
+            writer.close()
+            return
+        log.info("客户端连接", extra={'addr': str(addr)})
+        self.m_connections.inc()
+        channel = AsyncChannel(writer, self.loop, waker=self.waker, on_evict=self.evict_channel,
+                               **self.channel_options)
+        self.capture_open(channel, addr)
+        username = None
+        bucket = self.admission.bucket()
+
+        try:
+            frames = self.read_frames_async(reader, channel.conn_id)
+            try:
+                payload = await frames.__anext__()
+            except StopAsyncIteration:
+                return
+            username, codec = self.login(channel, payload)
+            async for payload in frames:
+                if not self.admit(username, channel, bucket):
+                    continue
+                if not self.handle_frame(username, channel, codec, payload):
                     break
-                elif message.startswith('BID'):
-                    self.process_bid(username, message)
-                elif message.startswith('BALANCE'):
-                    try:
-                        balance = int(message.split()[1])
-                        self.clients[username]['balance'] = balance
-                        self.update_client_list()
-                    except (IndexError, ValueError) as e:
-                        print(f"处理余额更新时发生错误: {e}")
-                        conn.send("ERROR: 余额格式不正确".encode())
-                else:
-                    print(f"接收到未知命令: {message}")
-                    conn.send("ERROR: 未知命令".encode())
+        except protocol.FrameTooLarge as e:
+            self.reject_oversized(e, addr, username)
         except Exception as e:
-            print(f"处理客户端 {addr} 时发生错误: {e}")
-            conn.send("ERROR: 处理请求时发生错误".encode())
+            log.warning("处理客户端时发生错误: %s", e, extra={'addr': str(addr), 'user': username})
+            self.send_message(channel, "ERROR: 处理请求时发生错误")
         finally:
-            if conn:
-                conn.close()
+            self.remove_client(username, channel)
+            channel.close()
+            self.admission.disconnect(addr[0])
+            if self.capture is not None:
+                self.capture.put(capture.CLOSE, channel.conn_id)
+            log.info("客户端断开连接", extra={'addr': str(addr), 'user': username})
+
+    def admit_connection(self, addr):
+        if self.admission.connect(addr[0]):
+            return True
+        self.m_throttled.inc(label='address')
+        log.warning("来源地址的连接数超过上限，拒绝连接", extra={'addr': str(addr)})
+        return False
+
+    def admit(self, username, channel, bucket):
+        # 在解析之前检查限流，超限的帧直接丢弃；连续丢弃时只在第一帧通知客户端
+        scope = self.admission.admit(bucket, username)
+        if scope is None:
+            return True
+        self.m_throttled.inc(label=scope)
+        if bucket.dropped == 1:
+            log.info("客户端发送过快，开始丢弃消息", extra={'user': username, 'scope': scope})
+            self.send_message(channel, protocol.REJECT_MESSAGES['throttled'], protocol.encode_error('throttled'))
+        return False
+
+    def reject_oversized(self, error, addr, username):
+        # 长度前缀超过上限时不再读取该连接，直接断开
+        self.m_throttled.inc(label='frame_size')
+        log.warning("帧长度超过上限，断开连接: %s", error, extra={'addr': str(addr), 'user': username})
+
+    def login(self, channel, payload):
+        # 第一帧决定该连接使用文本协议还是二进制协议
+        self.m_frames_in.inc()
+        codec = protocol.codec_for(payload)
+        username, balance, last_seq, token = codec.decode_login(payload)
+        self.register_client(channel, codec.binary, username, balance, last_seq, token)
+        return username, codec
+
+    def register_client(self, channel, binary, username, balance, last_seq, token):
+        # 登录帧解析之后的部分，多进程接入时由接入进程解析好再交给这里
+        log.info("客户端登录", extra={'user': username, 'balance': balance, 'last_seq': last_seq,
+                                     'binary': binary})
+        channel.binary = binary
+        channel.sequenced = last_seq is not None
+        session = self.take_session(username, token)
+        if session is not None:
+            lots = session['lots']
+        else:
+            lots = set()
+            token = secrets.token_hex(protocol.TOKEN_BYTES) if channel.sequenced else None
+        # 在序列器中完成登录之前不向该连接广播，补发的消息和之后的广播因此不会乱序
+        self.clients[username] = {'conn': channel, 'balance': balance, 'won_items': [], 'lots': lots,
+                                  'synced': False, 'token': token}
+        self.sequencer.submit(self.apply_login, username, channel, balance, last_seq, session is not None)
+
+    def take_session(self, username, token):
+        # 令牌相符时接管断线保留的会话，或者接管还没发现断线的旧连接；令牌不符时保留的会话原样留到过期
+        active = self.clients.get(username)
+        session = self.parked.get(username) or active
+        if token is None or session is None or session.get('token') != token:
+            return None
+        if session is not active:
+            del self.parked[username]
+        if active is not None and active['conn'] is not None:
+            active['conn'].close()
+        return session
+
+    def apply_login(self, username, channel, balance, last_seq=None, resumed=False):
+        # 老用户沿用服务器记录的余额和已赢得商品，只有新用户才采用客户端给出的起始资金
+        client = self.clients.get(username)
+        if client is None or client['conn'] is not channel:
+            return
+        account = self.ledger.get(username)
+        if account is None:
+            account = self.ledger.open(username, balance)
+            self.record('account', username, balance)
+        available = self.ledger.available_of(username)
+        client['balance'] = available
+        client['won_items'] = account.won_items
+        self.send_message(channel, f"BALANCE {available} 0", protocol.encode_balance_update(available, 0))
+        if client['token']:
+            self.send_message(channel, f"SESSION {client['token']}", protocol.encode_session(client['token']))
+        if last_seq is not None:
+            self.resync(client, last_seq)
+        client['synced'] = True
+        if self.acceptors is not None:
+            # 接入进程从这里开始向该连接转发广播
+            self.acceptors.synced(channel, client['lots'])
+        if not resumed:
+            # 接管原会话时界面上的那一行没有变化，不必通知
+            self.publish_client('client_added', username, available)
+
+    def resync(self, client, last_seq):
+        # 只补发该客户端错过的广播；首次登录、落后太多或序号来自服务器重启之前时改发快照
+        conn = client['conn']
+        seq = self.sequencer.seq
+        entries = self.broadcasts.since(last_seq, self.max_replay) if 0 < last_seq <= seq else None
+        if entries is None:
+            self.send_snapshot(client, seq)
+        else:
+            for _, lot_id, current, frames in entries:
+                if lot_id is None or lot_id in client['lots'] or (not client['lots'] and current):
+                    frames.send(conn)
+        self.send_message(conn, f"SYNC {seq}", protocol.encode_sync(seq))
+
+    def send_snapshot(self, client, seq):
+        conn = client['conn']
+        lots = client['lots'] or ([self.current_lot] if self.current_lot is not None else [])
+        self.send_message(conn, f"SNAPSHOT {seq}", protocol.encode_snapshot(seq))
+        for lot_id in list(lots):
+            for frames in self.lot_snapshot(lot_id):
+                frames.send(conn)
+            if lot_id in self.deadlines:
+                # 剩余时间随发送时刻变化，不进快照缓存
+                remaining = self.deadlines[lot_id] - time.time()
+                self.send_message(conn, f"CLOSES {lot_id} {remaining:.1f}", protocol.encode_deadline(lot_id, remaining))
+
+    def lot_snapshot(self, lot_id):
+        # 同一拍品的快照在状态变化前只编码一次，重连风暴时各连接共用
+        item = self.lots.get(lot_id)
+        if item is None:
+            return []
+        status = self.lot_status[lot_id]
+        version = (status['current_bid'], status['seq'])
+        cached = self.snapshot_frames.get(lot_id)
+        if cached is None or cached[0] != version:
+            frames = [OutgoingFrames(f"LOT {lot_id} '{item}' 当前价 {status['current_bid']}",
+                                     protocol.encode_lot(lot_id, item, status['current_bid']))]
+            if status['winner']:
+                frames.append(OutgoingFrames(f"{status['winner']} 是当前的最高出价者",
+                                             protocol.encode_leader(lot_id, status['winner'],
+                                                                    status['current_bid'], status['seq'])))
+            cached = self.snapshot_frames[lot_id] = (version, frames)
+        return cached[1]
+
+    def handle_frame(self, username, channel, codec, payload):
+        # 返回 False 表示客户端请求退出
+        return self.handle_request(username, channel, codec.decode(payload))
+
+    def handle_request(self, username, channel, command):
+        self.m_frames_in.inc()
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("接收到的消息", extra={'event': 'frame', 'user': username, 'command': command})
+        if command[0] == 'EXIT':
+            log.info("处理退出请求", extra={'user': username})
+            # 主动退出的会话不保留
+            if self.clients.get(username, {}).get('conn') is channel:
+                self.clients[username]['token'] = None
+            return False
+        self.handle_command(username, channel, command)
+        return True
+
+    def remove_client(self, username, channel):
+        # 同名用户重新登录后，旧连接的清理不能删掉新连接
+        client = self.clients.get(username) if username is not None else None
+        if client is None or client['conn'] is not channel:
+            return
+        del self.clients[username]
+        if client['token']:
+            client['conn'] = None
+            client['synced'] = False
+            client['parked_until'] = time.monotonic() + self.session_grace
+            # 替换掉同名的旧会话时重新排到最后，保持按断线先后排列
+            self.parked.pop(username, None)
+            self.parked[username] = client
+            log.info("客户端断线，会话保留 %s 秒", self.session_grace, extra={'user': username})
+        else:
+            self.publish_client('client_removed', username)
+
+    def reap_sessions(self):
+        while True:
+            time.sleep(1)
+            if self.parked:
+                self.sequencer.submit(self.expire_sessions)
+
+    def expire_sessions(self):
+        # 宽限期相同，最早断线的会话总在最前面
+        now = time.monotonic()
+        for username, client in list(self.parked.items()):
+            if client['parked_until'] > now:
+                break
+            # 同名用户已经用新会话登录时界面上的那一行属于新会话
+            if self.parked.pop(username, None) is client and username not in self.clients:
+                self.publish_client('client_removed', username)
+
+    def evict_channel(self, channel):
+        self.m_evictions.inc()
+        log.warning("客户端发送队列超过上限，断开慢消费者", extra={'depth': channel.depth})
+
+    def handle_command(self, username, conn, command):
+        kind = command[0]
+        if kind == 'BID' or kind == 'MAX':
+            self.process_bid(username, command[1], command[2], kind == 'MAX')
+        elif kind == 'BALANCE':
+            # 余额由服务器维护，旧客户端上报的余额直接忽略，不回复也不刷新界面
+            pass
+        elif kind == 'SUB' or kind == 'UNSUB':
+            self.sequencer.submit(self.apply_subscription, username, conn, kind, command[1])
+        elif kind == 'INVALID':
+            log.info("消息格式不正确: %s", command[2], extra={'user': username})
+            self.send_message(conn, command[2], protocol.encode_error(command[1]))
+        else:
+            log.info("接收到未知命令: %s", command[1], extra={'user': username})
+            self.send_message(conn, "ERROR: 未知命令", protocol.encode_error('unknown'))
+
+    def apply_subscription(self, username, conn, command, lot_id):
+        # 在序列器中修改订阅并回复当前价，回复因此与该拍品的 LEADER、END 保持先后顺序
+        client = self.clients.get(username)
+        if client is None or client['conn'] is not conn:
+            return
+        if command == 'SUB':
+            client['lots'].add(lot_id)
+            item = self.lots.get(lot_id)
+            if item is not None:
+                status = self.lot_status[lot_id]
+                self.send_message(client['conn'], f"LOT {lot_id} '{item}' 当前价 {status['current_bid']}",
+                                  protocol.encode_lot(lot_id, item, status['current_bid']))
+        else:
+            client['lots'].discard(lot_id)
 
     def start_auction(self, category, item):
+        self.capture_control('start_auction', category, item)
+        self.sequencer.submit(self.apply_start_auction, category, item)
+
+    def start_catalog(self, category=None):
+        categories = [category] if category else self.catalog.categories()
+        for name in categories:
+            for item in self.catalog.items(name):
+                self.start_auction(name, item)
+
+    def apply_start_auction(self, category, item):
+        self.next_lot_id += 1
+        lot_id = self.next_lot_id
+        self.shards.execute([('open', lot_id, item, self.current_bid)])
+        self.lots[lot_id] = item
+        self.lot_status[lot_id] = {'item': item, 'category': category, 'current_bid': self.current_bid,
+                                   'seq': 0, 'winner': None}
+        self.current_lot = lot_id
         self.current_item = item
-        self.current_bid = 10
-        self.current_winner = None
-        self.items_status[item] = {'item_sold': False, 'current_bid': self.current_bid}
-        self.notify_clients(f"ITEM: '{self.current_item}' 起拍价为 {self.current_bid}。")
-        self.notify_clients(f"拍卖开始: '{self.current_item}' 起拍价为 {self.current_bid}。")
-        print(f"拍卖开始: '{self.current_item}' 起拍价为 {self.current_bid}。")
-        self.update_gui()
-
-    def process_bid(self, username, message):
-        if self.current_item is None:
-            self.send_message(self.clients[username]['conn'], "当前没有进行中的拍卖，无法出价。")
+        self.record('lot', lot_id, category, item, self.current_bid)
+        self.notify_clients(f"LOT {lot_id} '{item}' 起拍价为 {self.current_bid}。",
+                            protocol.encode_lot(lot_id, item, self.current_bid))
+        self.notify_lot(lot_id, f"ITEM: '{item}' 起拍价为 {self.current_bid}。", protocol.TEXT_ONLY)
+        self.notify_lot(lot_id, f"拍卖开始: '{item}' 起拍价为 {self.current_bid}。", protocol.TEXT_ONLY)
+        log.info("拍卖开始", extra={'lot': lot_id, 'item': item, 'start_bid': self.current_bid})
+        if self.sealed is not None:
+            # 密封出价的拍品随本轮一起截止，不单独计时
+            self.sealed.add_lot(lot_id, self.current_bid)
+            self.notify_lot(lot_id, f"SEALED {lot_id} {self.sealed.pricing}")
+            if self.sealed.deadline is not None:
+                remaining = self.sealed.deadline - time.time()
+                self.notify_lot(lot_id, f"CLOSES {lot_id} {remaining:.1f}", protocol.encode_deadline(lot_id, remaining))
+        elif self.lot_duration > 0:
+            self.schedule_close(lot_id, time.time() + self.lot_duration)
+            self.announce_deadline(lot_id)
+        self.publish_auction(lot_id)
+
+    def schedule_close(self, lot_id, deadline):
+        # deadline 为墙上时间，便于写入日志后跨重启恢复；时间轮内部用单调时钟
+        self.deadlines[lot_id] = deadline
+        self.timers.schedule(lot_id, time.monotonic() + (deadline - time.time()))
+        self.record('deadline', lot_id, deadline)
+
+    def extend_deadline(self, lot_id):
+        # 尾盘防狙击: 截止前 soft_close 秒内的出价把截止时间推迟到 extension 秒之后
+        deadline = self.deadlines.get(lot_id)
+        if deadline is None:
             return
+        now = time.time()
+        if deadline - now < self.soft_close:
+            self.schedule_close(lot_id, now + self.extension)
+            self.extended.add(lot_id)
 
-        item_status = self.items_status[self.current_item]
+    def announce_deadline(self, lot_id):
+        remaining = self.deadlines[lot_id] - time.time()
+        self.notify_lot(lot_id, f"CLOSES {lot_id} {remaining:.1f}", protocol.encode_deadline(lot_id, remaining))
 
-        if item_status['item_sold']:
-            self.send_message(self.clients[username]['conn'], "该商品已成交，无法出价。")
+    def tick_timers(self):
+        # 只负责按 tick 唤醒序列器，时间轮本身只在序列器线程中读写
+        while True:
+            time.sleep(self.timer_tick)
+            if self.deadlines or self.sealed is not None:
+                self.sequencer.submit(self.advance_timers)
+
+    def advance_timers(self):
+        for lot_id in self.timers.advance(time.monotonic()):
+            if lot_id == SEALED_TIMER:
+                self.apply_close_sealed()
+            elif self.deadlines.pop(lot_id, None) is not None:
+                log.info("拍品到时自动成交", extra={'lot': lot_id})
+                self.apply_complete_transaction(lot_id)
+
+    def process_bid(self, username, lot_id, bid_amount, proxy=False):
+        self.m_bids_received.inc()
+        if lot_id is None:
+            lot_id = self.current_lot
+        if lot_id is None:
+            self.reject_bid(username, 'no_lot')
             return
+        self.sequencer.submit_bid(username, lot_id, bid_amount, proxy)
 
-        try:
-            bid_amount = int(message.split()[1])
-            if bid_amount > item_status['current_bid'] and bid_amount <= self.clients[username]['balance']:
-                item_status['current_bid'] = bid_amount
-                self.current_winner = username 
-                print(f"{username} 出价 {bid_amount}. 当前最高出价者: {self.current_winner}")
-                self.notify_clients(f"{username} 是当前的最高出价者")
-                self.update_gui() 
-            else:
-                self.send_message(self.clients[username]['conn'], "出价过低或余额不足。")
-        except ValueError:
-            self.send_message(self.clients[username]['conn'], "出价格式无效。")
-
-    def complete_transaction(self):
-        if self.current_winner:
-            winner = self.current_winner
-            item = self.current_item
-            final_price = self.items_status[item]['current_bid']
-            
-            if self.clients[winner]['balance'] >= final_price:
-                self.clients[winner]['balance'] -= final_price
-                self.clients[winner]['won_items'].append(item)
-                print(f"{winner} 赢得了商品 '{item}'")
-                self.send_message(self.clients[winner]['conn'], f"WINNER {item}")
-                self.send_message(self.clients[winner]['conn'], f"SUCCEED {final_price} ")
-                print(f"交易成功: {item}，成交价: {final_price} 元，{winner} 的新余额: {self.clients[winner]['balance']} 元。")
-                self.notify_clients(f"赢家{winner} 赢得了商品 '{item}'")
-                self.notify_clients("END_OF_AUCTION")
-                self.items_status[item]['item_sold'] = True
-                self.gui.update_transaction_info(item, final_price)
+    def reject_bid(self, username, reason):
+        self.m_bids_rejected.inc(label=reason)
+        client = self.clients.get(username)
+        if client:
+            self.send_message(client['conn'], protocol.REJECT_MESSAGES[reason], protocol.encode_error(reason))
+
+    def apply_bids(self, bids):
+        # 只在序列器线程中调用，返回与 bids 一一对应的 (领先者, 价格)，拍品价格没有变化时为 None。
+        # 代理出价由分片直接竞价到结果，中间的每一次跟价都不广播；密封出价只登记不广播。
+        # 同一批出价在分片里一起执行，同一用户在本批其他拍品上的出价先从可用资金里扣掉，
+        # 批次结束后给领先者冻结资金时因此不会超出余额
+        ops = []
+        sealed = []
+        claims = {}
+        for username, lot_id, bid_amount, proxy in bids:
+            is_sealed = self.sealed is not None and lot_id in self.sealed
+            sealed.append(is_sealed)
+            if is_sealed:
+                self.apply_sealed_bid(username, lot_id, bid_amount, self.ledger.available_of(username))
+                continue
+            claimed = claims.setdefault(username, {})
+            balance = self.ledger.spendable(username, lot_id) - sum(
+                amount for other, amount in claimed.items() if other != lot_id)
+            if bid_amount <= balance:
+                claimed[lot_id] = max(claimed.get(lot_id, 0), bid_amount)
+            ops.append(('proxy' if proxy else 'bid', lot_id, username, bid_amount, balance))
+        results = iter(self.shards.execute(ops))
+        changes = []
+        touched = set()
+        for (username, lot_id, bid_amount, proxy), is_sealed in zip(bids, sealed):
+            if is_sealed:
+                changes.append(None)
+                continue
+            result, winner, price = next(results)
+            if proxy and result in ('ok', 'outbid', 'raised'):
+                # 领先者提高上限时保留原来的顺序，与分片一致
+                leading = self.lot_status[lot_id]['winner'] == username
+                self.set_proxy(lot_id, username, bid_amount, leading)
+                self.record('proxy', lot_id, username, bid_amount, leading)
+            if result == 'raised':
+                touched.add(lot_id)
+                client = self.clients.get(username)
+                if client:
+                    self.send_message(client['conn'], f"代理出价上限已提高到 {bid_amount}")
+            elif result != 'ok':
+                self.reject_bid(username, result)
+            if winner is None:
+                changes.append(None)
+                continue
+            item_status = self.lot_status[lot_id]
+            item_status['current_bid'] = price
+            item_status['winner'] = winner
+            self.extend_deadline(lot_id)
+            touched.add(lot_id)
+            changes.append((winner, price))
+        for lot_id in touched:
+            self.hold_funds(lot_id)
+        return changes
+
+    def hold_funds(self, lot_id):
+        # 领先者冻结当前价，有代理出价时冻结代理上限，之后自动跟价不会超出余额；原领先者的冻结同时解除
+        status = self.lot_status[lot_id]
+        winner = status['winner']
+        if winner is None:
+            return
+        amount = max(status['current_bid'], self.proxies.get(lot_id, {}).get(winner, 0))
+        previous = self.ledger.holder(lot_id)
+        before = {username: self.ledger.available_of(username) for username in (previous, winner) if username}
+        if not self.ledger.reserve(lot_id, winner, amount):
+            log.error("领先者可用资金不足，无法冻结", extra={'lot': lot_id, 'user': winner, 'amount': amount})
+            return
+        for username, available in before.items():
+            self.push_balance(username, self.ledger.available_of(username) - available)
+
+    def set_proxy(self, lot_id, username, maximum, keep_order):
+        proxies = self.proxies.setdefault(lot_id, {})
+        if not keep_order:
+            proxies.pop(username, None)
+        proxies[username] = maximum
+
+    def announce_leader(self, lot_id, username, bid_amount, seq):
+        item = self.lots[lot_id]
+        self.lot_status[lot_id]['seq'] = seq
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("当前最高出价者", extra={'event': 'leader', 'lot': lot_id, 'item': item, 'user': username,
+                                             'amount': bid_amount, 'seq': seq})
+        self.notify_lot(lot_id, f"{username} 是当前的最高出价者",
+                        protocol.encode_leader(lot_id, username, bid_amount, seq), seq)
+        if lot_id in self.extended:
+            # 同一批里多次延时只通知一次
+            self.extended.discard(lot_id)
+            self.announce_deadline(lot_id)
+        self.publish_auction(lot_id)
+
+    def complete_transaction(self, lot_id=None):
+        self.capture_control('complete_transaction', lot_id)
+        self.sequencer.submit(self.apply_complete_transaction, lot_id)
+
+    def apply_complete_transaction(self, lot_id=None):
+        started = time.perf_counter()
+        if lot_id is None:
+            lot_id = self.current_lot
+        item = self.lots.get(lot_id)
+        if item is None:
+            log.warning("拍品不存在或已成交", extra={'lot': lot_id})
+            self.m_settlements.inc(label='missing')
+            return
+        if self.sealed is not None and lot_id in self.sealed:
+            # 密封出价只在本轮截止时一起清算，单独结算会丢掉已登记的出价
+            log.warning("拍品在进行中的密封出价轮次里，只能随本轮截止结算", extra={'lot': lot_id})
+            self.m_settlements.inc(label='sealed')
+            return
+
+        item_status = self.lot_status[lot_id]
+        winner = item_status['winner']
+        final_price = item_status['current_bid']
+        sold = False
+        if winner:
+            available = self.ledger.available_of(winner)
+            if self.ledger.settle(lot_id, winner, final_price):
+                self.record('balance', winner, self.ledger.balance_of(winner), -final_price)
+                self.push_balance(winner, self.ledger.available_of(winner) - available)
+                self.ledger.get(winner).won_items.append(item)
+                if winner in self.clients:
+                    self.send_message(self.clients[winner]['conn'], f"WINNER {item}",
+                                      protocol.encode_winner(lot_id, final_price))
+                    self.send_message(self.clients[winner]['conn'], f"SUCCEED {final_price} ", protocol.TEXT_ONLY)
+                log.info("交易成功", extra={'lot': lot_id, 'item': item, 'user': winner, 'price': final_price,
+                                           'balance': self.ledger.balance_of(winner)})
+                self.notify_lot(lot_id, f"赢家{winner} 赢得了商品 '{item}'",
+                                protocol.encode_sold(lot_id, winner, final_price))
+                self.notify_lot(lot_id, "END_OF_AUCTION", protocol.encode_end(lot_id))
+                sold = True
+                self.events.publish('transaction', item, final_price)
             else:
-                self.notify_clients(f"{winner} 余额不足，无法完成交易。")
-                print(f"{winner} 余额不足，当前余额为 {self.clients[winner]['balance']}")
+                # 冻结已经解除，可用余额有变化时照常通知
+                self.push_balance(winner, self.ledger.available_of(winner) - available)
+                self.notify_lot(lot_id, f"{winner} 余额不足，无法完成交易。")
+                log.info("赢家余额不足，无法完成交易", extra={'lot': lot_id, 'item': item, 'user': winner,
+                                                       'balance': self.ledger.balance_of(winner)})
         else:
-            self.notify_clients(f"商品 '{self.current_item}' 无人竞拍。")
-        
-        self.current_winner = None
-        self.current_item = None
-        self.current_bid = 10
+            self.notify_lot(lot_id, f"商品 '{item}' 无人竞拍。")
+            self.notify_lot(lot_id, None, protocol.encode_end(lot_id))
 
-    def notify_clients(self, message):
-        for client in self.clients.values():
-            self.send_message(client['conn'], message)
+        self.shards.execute([('close', lot_id, sold)])
+        self.record('settle', lot_id, winner, final_price, sold)
+        self.capture_outcome(lot_id, item, winner, final_price, sold)
+        self.events.publish('settled', lot_id, item, winner, final_price, sold)
+        # 结果只留在日志里，内存中只保存进行中的拍品
+        del self.lots[lot_id]
+        del self.lot_status[lot_id]
+        self.snapshot_frames.pop(lot_id, None)
+        self.deadlines.pop(lot_id, None)
+        self.timers.cancel(lot_id)
+        self.proxies.pop(lot_id, None)
+        if lot_id == self.current_lot:
+            self.current_lot = None
+            self.current_item = None
+        self.m_settlements.inc(label='sold' if sold else ('unpaid' if winner else 'unsold'))
+        self.m_settle.observe(time.perf_counter() - started)
 
-    def send_message(self, conn, message):
-        message_bytes = message.encode('utf-8')
-        message_length = struct.pack('>I', len(message_bytes)) 
-        conn.sendall(message_length + message_bytes)
+    def push_balance(self, username, delta):
+        # 余额只在服务器端变化，可用余额变化时把新值和变化量推送给在线的客户端
+        if not delta:
+            return
+        client = self.clients.get(username)
+        if client:
+            available = self.ledger.available_of(username)
+            client['balance'] = available
+            self.send_message(client['conn'], f"BALANCE {available} {delta}",
+                              protocol.encode_balance_update(available, delta))
+            self.publish_client('client_balance', username, available)
 
-    def receive_message(self, conn):
-        length_bytes = conn.recv(4)
-        if not length_bytes:
-            return None
-        message_length = struct.unpack('>I', length_bytes)[0]
-        message_bytes = conn.recv(message_length)
-        return message_bytes.decode('utf-8')
+    def record(self, *event):
+        # 只在序列器线程中调用
+        if self.journal:
+            self.journal.append(*event)
+
+    def maybe_snapshot(self):
+        if self.journal and self.journal.should_snapshot():
+            self.journal.snapshot(self.snapshot_state())
+
+    def snapshot_state(self):
+        return {
+            'seq': self.sequencer.seq,
+            'next_lot_id': self.next_lot_id,
+            'current_lot': self.current_lot,
+            'lots': {str(lot_id): item for lot_id, item in self.lots.items()},
+            'lot_status': {str(lot_id): dict(status) for lot_id, status in self.lot_status.items()},
+            'deadlines': {str(lot_id): deadline for lot_id, deadline in self.deadlines.items()},
+            'proxies': {str(lot_id): list(proxies.items()) for lot_id, proxies in self.proxies.items()},
+            'sealed': None if self.sealed is None else {
+                'pricing': self.sealed.pricing, 'deadline': self.sealed.deadline,
+                'lots': list(zip(self.sealed.lot_ids, self.sealed.reserves)), 'bids': list(self.sealed.bids())},
+            # 冻结由进行中拍品的领先者推算，不单独保存，余额记的是可用加冻结的总额
+            'accounts': {account.username: {'balance': self.ledger.balance_of(account.username),
+                                            'won_items': list(account.won_items)}
+                         for account in self.ledger},
+        }
+
+    def restore(self, snapshot, events):
+        # 启动时由快照和日志重建拍卖状态，尚未结束的拍品重新放回分片
+        if snapshot:
+            self.sequencer.seq = snapshot['seq']
+            self.next_lot_id = snapshot['next_lot_id']
+            self.current_lot = snapshot['current_lot']
+            self.lots = {int(lot_id): item for lot_id, item in snapshot['lots'].items()}
+            self.lot_status = {int(lot_id): status for lot_id, status in snapshot['lot_status'].items()}
+            for username, account in snapshot['accounts'].items():
+                self.ledger.open(username, account['balance'], account['won_items'])
+            self.deadlines = {int(lot_id): deadline for lot_id, deadline in snapshot.get('deadlines', {}).items()}
+            self.proxies = {int(lot_id): dict(proxies) for lot_id, proxies in snapshot.get('proxies', {}).items()}
+            sealed = snapshot.get('sealed')
+            if sealed:
+                self.sealed = SealedRound(sealed['pricing'], sealed['deadline'])
+                for lot_id, reserve in sealed['lots']:
+                    self.sealed.add_lot(lot_id, reserve)
+                for lot_id, username, amount in sealed['bids']:
+                    self.sealed.bid(username, lot_id, amount)
+        for event in events:
+            kind = event[1]
+            if kind == 'account':
+                _, _, username, balance = event
+                self.ledger.open(username, balance)
+            elif kind == 'balance':
+                _, _, username, balance, _ = event
+                self.ledger.set_balance(username, balance)
+            elif kind == 'lot':
+                _, _, lot_id, category, item, start_bid = event
+                self.next_lot_id = max(self.next_lot_id, lot_id)
+                self.lots[lot_id] = item
+                self.lot_status[lot_id] = {'item': item, 'category': category, 'current_bid': start_bid,
+                                           'seq': 0, 'winner': None}
+                self.current_lot = lot_id
+                if self.sealed is not None:
+                    self.sealed.add_lot(lot_id, start_bid)
+            elif kind == 'sealed':
+                _, _, pricing, deadline = event
+                self.sealed = SealedRound(pricing, deadline)
+            elif kind == 'sealed_bid':
+                _, _, lot_id, username, amount = event
+                self.sealed.bid(username, lot_id, amount)
+            elif kind == 'sealed_close':
+                self.sealed = None
+            elif kind == 'bid':
+                _, _, lot_id, username, amount, seq = event
+                status = self.lot_status[lot_id]
+                status['current_bid'] = amount
+                status['winner'] = username
+                status['seq'] = seq
+                self.sequencer.seq = max(self.sequencer.seq, seq)
+            elif kind == 'deadline':
+                _, _, lot_id, deadline = event
+                self.deadlines[lot_id] = deadline
+            elif kind == 'proxy':
+                _, _, lot_id, username, maximum, keep_order = event
+                self.set_proxy(lot_id, username, maximum, keep_order)
+            elif kind == 'settle':
+                _, _, lot_id, winner, price, sold = event
+                item = self.lots.pop(lot_id)
+                del self.lot_status[lot_id]
+                self.deadlines.pop(lot_id, None)
+                self.proxies.pop(lot_id, None)
+                if sold:
+                    self.ledger.get(winner).won_items.append(item)
+                if lot_id == self.current_lot:
+                    self.current_lot = None
+        self.current_item = self.lots.get(self.current_lot)
+        # 停机期间已经到期的拍品在第一个 tick 结算
+        for lot_id, deadline in self.deadlines.items():
+            self.timers.schedule(lot_id, time.monotonic() + (deadline - time.time()))
+        if self.sealed is not None and self.sealed.deadline is not None:
+            self.timers.schedule(SEALED_TIMER, time.monotonic() + (self.sealed.deadline - time.time()))
+        self.shards.execute([('restore', lot_id, item, self.lot_status[lot_id]['current_bid'],
+                              self.lot_status[lot_id]['winner'], list(self.proxies.get(lot_id, {}).items()))
+                             for lot_id, item in self.lots.items()])
+        for lot_id in self.lots:
+            self.hold_funds(lot_id)
+        if self.lots or len(self.ledger):
+            log.info("已从日志恢复: %d 个进行中的拍品, %d 个账户", len(self.lots), len(self.ledger))
+
+    def lot_for_item(self, item, category=None):
+        # 同名商品有多个进行中的拍品时取最近开拍的，给出大类时只在该类中找；界面线程调用，先复制再遍历
+        found = None
+        for lot_id, status in list(self.lot_status.items()):
+            if status['item'] == item and lot_id in self.lots and category in (None, status['category']):
+                found = lot_id if found is None else max(found, lot_id)
+        return found
+
+    def broadcast_frames(self, lot_id, message, packet, seq):
+        # 只在序列器线程中调用: 每条广播分配序号并记入补发日志
+        if seq is None:
+            seq = self.sequencer.next_seq()
+        frames = OutgoingFrames(message, packet, seq)
+        self.broadcasts.append(seq, lot_id, lot_id is not None and lot_id == self.current_lot, frames)
+        return frames
+
+    def notify_clients(self, message, packet=None, seq=None):
+        # 每种协议只编码一次，再投递到各连接自己的发送队列，不在调用线程上阻塞
+        started = time.perf_counter()
+        frames = self.broadcast_frames(None, message, packet, seq)
+        if self.acceptors is not None:
+            self.acceptors.broadcast(None, False, frames)
+            self.m_fanout.observe(time.perf_counter() - started)
+            return
+        sent = 0
+        for client in list(self.clients.values()):
+            if client['synced']:
+                sent += frames.send(client['conn'])
+        self.m_frames_out.inc(sent)
+        self.m_fanout.observe(time.perf_counter() - started)
+
+    def notify_lot(self, lot_id, message, packet=None, seq=None):
+        # 订阅了该拍品的客户端，以及没有任何订阅的旧客户端（只关注当前拍品）
+        started = time.perf_counter()
+        frames = self.broadcast_frames(lot_id, message, packet, seq)
+        if self.acceptors is not None:
+            # 每个接入进程只发一次，由接入进程按订阅投递，发出的帧数由接入进程各自统计不到这里
+            self.acceptors.broadcast(lot_id, lot_id is not None and lot_id == self.current_lot, frames)
+            self.m_fanout.observe(time.perf_counter() - started)
+            return
+        sent = 0
+        for client in list(self.clients.values()):
+            if client['synced'] and (lot_id in client['lots'] or (not client['lots'] and lot_id == self.current_lot)):
+                sent += frames.send(client['conn'])
+        self.m_frames_out.inc(sent)
+        self.m_fanout.observe(time.perf_counter() - started)
 
-    def update_gui(self):
-        if self.gui:
-            self.gui.update_auction_info(self.current_item, self.current_bid, self.current_winner)
+    def send_message(self, conn, message, packet=None):
+        if OutgoingFrames(message, packet).send(conn):
+            self.m_frames_out.inc()
 
-    def update_client_list(self):
-        if self.gui:
-            client_info = [f"{username}: {client['balance']}" for username, client in self.clients.items()]
-            self.gui.update_client_list(client_info)
+    def read_frames(self, conn, conn_id=0):
+        decoder = protocol.FrameDecoder(self.max_frame)
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                return
+            for payload in decoder.feed(data):
+                if self.capture is not None:
+                    self.capture.put(capture.IN, conn_id, payload)
+                yield payload
+
+    async def read_frames_async(self, reader, conn_id=0):
+        decoder = protocol.FrameDecoder(self.max_frame)
+        while True:
+            try:
+                data = await reader.read(65536)
+            except ConnectionError:
+                return
+            if not data:
+                return
+            for payload in decoder.feed(data):
+                if self.capture is not None:
+                    self.capture.put(capture.IN, conn_id, payload)
+                yield payload
+
+    def capture_open(self, channel, addr):
+        if self.capture is not None:
+            channel.conn_id = self.capture.open(addr)
+            channel.capture = self.capture
+
+    def capture_control(self, *call):
+        # 记下控制操作，回放时在同样的时刻调用同名方法
+        if self.capture is not None:
+            self.capture.put_json(capture.CONTROL, call)
+
+    def capture_outcome(self, lot_id, item, winner, price, sold):
+        if self.capture is not None:
+            self.capture.put_json(capture.OUTCOME, [lot_id, item, winner, price, sold])
+
+    def close_capture(self):
+        # 停止前在序列器里把未结束的拍品状态也记下，回放时一并比对
+        if self.capture is None:
+            return
+        done = threading.Event()
+        self.sequencer.submit(self.apply_close_capture, done)
+        done.wait(2)
+        self.capture.close()
+
+    def apply_close_capture(self, done):
+        for lot_id, item in self.lots.items():
+            status = self.lot_status[lot_id]
+            self.capture_outcome(lot_id, item, status['winner'], status['current_bid'], None)
+        done.set()
+
+    def publish_auction(self, lot_id=None):
+        if self.events.subscribers:
+            lot_id = self.current_lot if lot_id is None else lot_id
+            item = self.lots.get(lot_id)
+            status = self.lot_status.get(lot_id, {})
+            self.events.publish('auction', lot_id, item, status.get('current_bid', self.current_bid), status.get('winner'))
+
+    def publish_bids(self, accepted, rejected):
+        if self.events.subscribers:
+            self.events.publish('bids', accepted, rejected)
+
+    def publish_client(self, kind, username, *row):
+        # 只推送变化的那一行: client_added / client_balance / client_removed
+        if self.events.subscribers:
+            self.events.publish(kind, username, *row)
+
+    def client_rows(self):
+        return [(username, client['balance']) for username, client in list(self.clients.items())]
 
     def run(self):
+        if self.mode == 'pool':
+            log.info("服务器正在监听", extra={'host': self.host, 'port': self.port, 'mode': 'pool',
+                                           'acceptors': len(self.acceptors.links)})
+            self.acceptors.serve(self)
+        elif self.mode == 'asyncio':
+            asyncio.run(self.run_async())
+        else:
+            self.run_threaded()
+
+    def run_threaded(self):
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             s.bind((self.host, self.port))
             s.listen()
-            print("服务器正在监听...")
+            log.info("服务器正在监听", extra={'host': self.host, 'port': self.port, 'mode': 'thread'})
             while True:
                 conn, addr = s.accept()
+                if not self.admit_connection(addr):
+                    conn.close()
+                    continue
                 threading.Thread(target=self.handle_client, args=(conn, addr)).start()
 
-    def set_gui(self, gui):
-        self.gui = gui
+    async def run_async(self):
+        self.loop = asyncio.get_running_loop()
+        self.waker = LoopWaker(self.loop)
+        server = await asyncio.start_server(self.handle_client_async, self.host, self.port)
+        log.info("服务器正在监听", extra={'host': self.host, 'port': self.port, 'mode': 'asyncio'})
+        async with server:
+            await server.serve_forever()
 
+    def settle_all(self):
+        self.capture_control('settle_all')
+        self.sequencer.submit(self.apply_settle_all)
 
+    def apply_settle_all(self):
+        if self.sealed is not None:
+            self.apply_close_sealed()
+        for lot_id in list(self.lots):
+            self.apply_complete_transaction(lot_id)
 
+    def open_sealed(self, pricing='second', window=0):
+        self.capture_control('open_sealed', pricing, window)
+        self.sequencer.submit(self.apply_open_sealed, pricing, window)
 
+    def apply_open_sealed(self, pricing, window):
+        if self.sealed is not None:
+            log.warning("已有进行中的密封出价轮次")
+            return
+        deadline = time.time() + window if window else None
+        self.sealed = SealedRound(pricing, deadline)
+        self.record('sealed', pricing, deadline)
+        if deadline is not None:
+            self.timers.schedule(SEALED_TIMER, time.monotonic() + window)
+        log.info("密封出价轮次开始", extra={'pricing': pricing, 'window': window})
 
-class AuctionServerGUI(tk.Tk):
-    def __init__(self, server):
-        super().__init__()
-        self.server = server
-        self.title("拍卖服务器")
-        self.geometry("800x600") 
-        self.configure(bg="#eaeaea")
+    def apply_sealed_bid(self, username, lot_id, amount, balance):
+        if lot_id not in self.lots:
+            self.reject_bid(username, 'no_lot')
+        elif amount > balance or not self.sealed.bid(username, lot_id, amount):
+            self.reject_bid(username, 'low')
+        else:
+            self.record('sealed_bid', lot_id, username, amount)
+            client = self.clients.get(username)
+            if client:
+                self.send_message(client['conn'], f"密封出价已登记: 拍品 {lot_id} 金额 {amount}")
 
-        self.category_var = StringVar(self)
-        self.item_var = StringVar(self)
+    def close_sealed(self):
+        self.capture_control('close_sealed')
+        self.sequencer.submit(self.apply_close_sealed)
 
-        self.category_label = tk.Label(self, text="选择商品大类", bg="#eaeaea", font=("Arial", 12))
-        self.category_label.grid(row=0, column=0, padx=10, pady=10)
-        
-        self.category_menu = ttk.Combobox(self, textvariable=self.category_var, state="readonly", font=("Arial", 12))
-        self.category_menu.grid(row=0, column=1, padx=10, pady=10)
-        self.category_menu.bind("<<ComboboxSelected>>", self.load_items)
+    def apply_close_sealed(self):
+        # 一次求出本轮全部拍品的赢家和成交价，再逐个走普通的结算流程
+        sealed, self.sealed = self.sealed, None
+        if sealed is None:
+            log.warning("没有进行中的密封出价轮次")
+            return
+        self.timers.cancel(SEALED_TIMER)
+        started = time.perf_counter()
+        results = sealed.clear(self.ledger.balances(), self.lots)
+        self.m_sealed_clear.observe(time.perf_counter() - started)
+        log.info("密封出价轮次截止", extra={'pricing': sealed.pricing, 'lots': len(results), 'bids': len(sealed),
+                                          'seconds': round(time.perf_counter() - started, 6)})
+        self.record('sealed_close')
+        for lot_id, winner, price in results:
+            item = self.lots.get(lot_id)
+            if item is None:
+                continue
+            if winner is not None:
+                status = self.lot_status[lot_id]
+                status['current_bid'] = price
+                status['winner'] = winner
+            self.apply_complete_transaction(lot_id)
 
-        self.item_label = tk.Label(self, text="选择商品", bg="#eaeaea", font=("Arial", 12))
-        self.item_label.grid(row=1, column=0, padx=10, pady=10)
-        
-        self.item_menu = ttk.Combobox(self, textvariable=self.item_var, state="readonly", font=("Arial", 12))
-        self.item_menu.grid(row=1, column=1, padx=10, pady=10)
 
-        self.auction_info = scrolledtext.ScrolledText(self, state='disabled', width=50, height=15, font=("Arial", 10))
-        self.auction_info.grid(row=2, column=0, columnspan=2, padx=10, pady=10)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="拍卖服务器")
+    parser.add_argument('--headless', action='store_true', help="不启动图形界面")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5200)
+    parser.add_argument('--mode', choices=('thread', 'asyncio', 'pool'), default='asyncio',
+                        help="pool 为多个接入进程共用端口，出价仍由本进程统一排序")
+    parser.add_argument('--acceptors', type=int, default=0, help="pool 模式的接入进程数，0 为 CPU 核数")
+    parser.add_argument('--workers', type=int, default=0, help="拍品分片进程数")
+    parser.add_argument('--journal', default='auction.journal', help="事件日志路径，留空则不记录")
+    parser.add_argument('--control-port', type=int, default=0, help="本机控制端口，0 为不开启")
+    parser.add_argument('--ws-port', type=int, default=0, help="WebSocket 网关端口，0 为不开启")
+    parser.add_argument('--schedule', default=None, help="拍卖计划 JSON 文件")
+    parser.add_argument('--session-grace', type=float, default=30, help="断线后保留会话的秒数")
+    parser.add_argument('--lot-duration', type=float, default=0, help="拍品自动成交的时长(秒)，0 为手动成交")
+    parser.add_argument('--soft-close', type=float, default=10, help="截止前多少秒内出价会触发延时")
+    parser.add_argument('--extension', type=float, default=10, help="尾盘出价后截止时间推迟到多少秒之后")
+    parser.add_argument('--max-queue-messages', type=int, default=1024, help="每个连接发送队列的消息数上限")
+    parser.add_argument('--max-queue-bytes', type=int, default=1 << 20, help="每个连接发送队列的字节数上限")
+    parser.add_argument('--slow-policy', choices=('drop', 'disconnect'), default='drop',
+                        help="发送队列超限时 drop 丢弃最旧的待发消息，disconnect 断开该连接")
+    parser.add_argument('--max-frame', type=int, default=protocol.MAX_FRAME, help="客户端单帧的最大字节数，超过即断开")
+    parser.add_argument('--conn-rate', type=float, default=50, help="每个连接每秒最多处理的帧数，0 为不限")
+    parser.add_argument('--conn-burst', type=float, default=100, help="每个连接允许的突发帧数")
+    parser.add_argument('--user-rate', type=float, default=100, help="每个用户每秒最多处理的帧数，0 为不限")
+    parser.add_argument('--user-burst', type=float, default=200, help="每个用户允许的突发帧数")
+    parser.add_argument('--max-conns-per-ip', type=int, default=0, help="每个来源地址的并发连接上限，0 为不限")
+    parser.add_argument('--capture', default=None, help="把收发的每一帧和控制操作抓包到该文件，供 replay.py 回放")
+    parser.add_argument('--metrics-port', type=int, default=0, help="本机 Prometheus 指标端口，0 为不开启")
+    parser.add_argument('--metrics-file', default=None, help="定期写入指标快照的 JSON 文件")
+    parser.add_argument('--metrics-interval', type=float, default=10, help="指标快照间隔(秒)")
+    parser.add_argument('--log-file', default='auction.log', help="JSON 行日志文件，留空则不写文件")
+    parser.add_argument('--log-level', default='INFO', help="日志级别，DEBUG 时按采样记录每一帧和每次领先")
+    parser.add_argument('--quiet', action='store_true', help="不在控制台输出日志")
+    options = parser.parse_args(argv)
+    if not options.headless and options.mode == 'pool':
+        parser.error("图形界面不支持 pool 模式，请加上 --headless")
+    return options
 
-        self.transaction_info = scrolledtext.ScrolledText(self, state='disabled', width=30, height=10, font=("Arial", 10))
-        self.transaction_info.grid(row=2, column=2, padx=10, pady=10)
 
-        self.completed_transactions_info = scrolledtext.ScrolledText(self, state='disabled', width=30, height=10, font=("Arial", 10))
-        self.completed_transactions_info.grid(row=3, column=2, padx=10, pady=10)
+def build_server(options, host=None, port=None, mode=None, workers=None):
+    # 图形界面在启动窗口里可以改地址、端口、模式和分片数，其余选项都以命令行为准
+    return AuctionServer(options.host if host is None else host, options.port if port is None else port,
+                         options.mode if mode is None else mode,
+                         max_queue_messages=options.max_queue_messages, max_queue_bytes=options.max_queue_bytes,
+                         slow_policy=options.slow_policy, lot_workers=options.workers if workers is None else workers,
+                         journal_path=options.journal or None,
+                         session_grace=options.session_grace, lot_duration=options.lot_duration,
+                         soft_close=options.soft_close, extension=options.extension, acceptors=options.acceptors,
+                         max_frame=options.max_frame, conn_rate=options.conn_rate, conn_burst=options.conn_burst,
+                         user_rate=options.user_rate, user_burst=options.user_burst,
+                         max_conns_per_address=options.max_conns_per_ip, capture_path=options.capture)
 
-        self.client_label = tk.Label(self, text="在线客户:", bg="#eaeaea", font=("Arial", 12))
-        self.client_label.grid(row=0, column=2, padx=10, pady=10)
-        
-        self.client_list = tk.Listbox(self, width=30, height=15, font=("Arial", 12))
-        self.client_list.grid(row=1, column=2, rowspan=2, padx=10, pady=10)
-
-        self.start_button = tk.Button(self, text="开始拍卖", command=self.start_auction, font=("Arial", 12), bg="#4CAF50", fg="white")
-        self.start_button.grid(row=3, column=0, padx=10, pady=10)
-
-        self.transaction_button = tk.Button(self, text="交易", command=self.complete_transaction, font=("Arial", 12), bg="#008CBA", fg="white")
-        self.transaction_button.grid(row=3, column=1, padx=10, pady=10)
-
-        self.server.set_gui(self)
-        self.load_categories()
-
-    def load_categories(self):
-        categories = list(self.server.auction_items.keys())
-        self.category_menu['values'] = categories
-        self.category_var.set("")
-        self.item_var.set("")
-        self.item_menu['values'] = []
-
-    def load_items(self, event=None):
-        category = self.category_var.get()
-        if category:
-            items = self.server.auction_items[category]
-            self.item_var.set("")
-            self.item_menu['values'] = items
-            if items:
-                self.item_menu.current(0)
-
-    def start_auction(self):
-        category = self.category_var.get()
-        item = self.item_var.get()
-        if category and item:
-            self.server.start_auction(category, item)
-
-    def complete_transaction(self):
-        self.server.complete_transaction()
-
-    def update_auction_info(self, item, bid, winner):
-        self.auction_info.configure(state='normal')
-        self.auction_info.insert(tk.END, f"拍卖商品: '{item}'，起拍价: {bid}。当前最高出价者: {winner}\n")
-        self.auction_info.configure(state='disabled')
-        self.auction_info.yview(tk.END)
-
-    def update_client_list(self, clients):
-        self.client_list.delete(0, tk.END)
-        for client in clients:
-            self.client_list.insert(tk.END, client)
-
-    def update_transaction_info(self, item, price):
-        self.transaction_info.configure(state='normal')
-        self.transaction_info.insert(tk.END, f"成交商品: '{item}'，成交价格: {price} 元\n")
-        self.transaction_info.configure(state='disabled')
-        self.transaction_info.yview(tk.END)
-
-        self.completed_transactions_info.configure(state='normal')
-        self.completed_transactions_info.insert(tk.END, f"已成交商品: '{item}'，成交价格: {price} 元\n")
-        self.completed_transactions_info.configure(state='disabled')
-        self.completed_transactions_info.yview(tk.END)
-
-
-class StartupWindow(tk.Tk):
-    def __init__(self, on_submit):
-        super().__init__()
-        self.title("启动设置")
-        self.geometry("300x200")
-        self.configure(bg="#f0f0f0")
-        self.resizable(False, False)
-
-        self.host_var = StringVar(self)
-        self.port_var = StringVar(self)
-
-        tk.Label(self, text="服务器 IP 地址", bg="#f0f0f0").pack(pady=5)
-        tk.Entry(self, textvariable=self.host_var, width=30).pack(pady=5)
-
-        tk.Label(self, text="服务器 端口", bg="#f0f0f0").pack(pady=5)
-        port_entry = tk.Entry(self, textvariable=self.port_var, width=30)
-        port_entry.pack(pady=5)
-
-        self.host_var.set('172.16.0.3')
-        self.port_var.set('5200')
-
-        tk.Button(self, text="启动服务器", command=self.submit).pack(pady=20)
-
-        self.on_submit = on_submit
-
-    def submit(self):
-        host = self.host_var.get() or '172.16.0.3'
-        port = self.port_var.get() or '5200'
-        if port.isdigit():
-            port = int(port)
-            self.destroy()
-            self.on_submit(host, port)
-        else:
-            messagebox.showerror("错误", "端口号必须为数字！")
+
+def start_services(server, options):
+    # 控制端口、WebSocket 网关、指标和拍卖计划，无界面和图形界面两种运行方式共用
+    if options.control_port:
+        ControlServer(server, port=options.control_port).start()
+    if options.ws_port:
+        WebSocketGateway(server, server.host, options.ws_port).start()
+    if options.metrics_port:
+        MetricsServer(server.metrics, port=options.metrics_port).start()
+    if options.metrics_file:
+        SnapshotWriter(server.metrics, options.metrics_file, options.metrics_interval).start()
+    if options.schedule:
+        threading.Thread(target=run_schedule, args=(server, load_schedule(options.schedule)), daemon=True).start()
+
+
+def run_headless(options):
+    server = build_server(options)
+    start_services(server, options)
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        log.info("服务器已停止")
+    finally:
+        server.close_capture()
+        if server.journal:
+            server.journal.close()
 
 
 if __name__ == "__main__":
-    def start_server(host, port):
-        server = AuctionServer(host, port)
-        auction_gui = AuctionServerGUI(server)
-        threading.Thread(target=server.run, daemon=True).start()
-        auction_gui.mainloop()
+    multiprocessing.freeze_support()
 
-    StartupWindow(start_server).mainloop()
+    options = parse_args()
+    listener = setup_logging(options.log_file or None, options.log_level, console=not options.quiet)
+    try:
+        if options.headless:
+            run_headless(options)
+        else:
+            # 图形界面只在需要时导入，无显示器的机器上不会加载 tkinter
+            from server_gui import run_gui
+            run_gui(options)
+    finally:
+        listener.stop()
@@ -0,0 +1,351 @@
+import bisect
+import collections
+import queue
+import threading
+import time
+import tkinter as tk
+from tkinter import scrolledtext, StringVar, messagebox
+from tkinter import ttk
+
+from serve import build_server, start_services
+
+
+class LogPane(scrolledtext.ScrolledText):
+    """只保留最近 max_lines 行的只读日志框，一次追加一批行"""
+
+    def __init__(self, master, max_lines=1000, **kwargs):
+        super().__init__(master, state='disabled', **kwargs)
+        self.max_lines = max_lines
+
+    def append_lines(self, lines):
+        if not lines:
+            return
+        lines = lines[-self.max_lines:]
+        self.configure(state='normal')
+        self.insert(tk.END, ''.join(line + '\n' for line in lines))
+        excess = int(self.index('end-1c').split('.')[0]) - 1 - self.max_lines
+        if excess > 0:
+            self.delete('1.0', f'{excess + 1}.0')
+        self.configure(state='disabled')
+        self.yview(tk.END)
+
+
+class ClientTable:
+    """在线客户表: 按用户名排序的索引，只为当前页生成显示行。
+
+    余额变化只有在该行位于当前页时才需要重绘；增删行会改变分页，总是标记为需要重绘。
+    """
+
+    def __init__(self, page_size=15):
+        self.page_size = page_size
+        self.balances = {}
+        self.names = []
+        self.filter_text = ''
+        self.filtered = None
+        self.page = 0
+        self.visible = set()
+        self.dirty = True
+
+    def upsert(self, username, balance):
+        if username not in self.balances:
+            bisect.insort(self.names, username)
+            self.filtered = None
+            self.dirty = True
+        elif username in self.visible:
+            self.dirty = True
+        self.balances[username] = balance
+
+    def remove(self, username):
+        if self.balances.pop(username, None) is None:
+            return
+        index = bisect.bisect_left(self.names, username)
+        del self.names[index]
+        self.filtered = None
+        self.dirty = True
+
+    def set_filter(self, text):
+        self.filter_text = text.strip()
+        self.filtered = None
+        self.page = 0
+        self.dirty = True
+
+    def matching(self):
+        if not self.filter_text:
+            return self.names
+        if self.filtered is None:
+            self.filtered = [name for name in self.names if self.filter_text in name]
+        return self.filtered
+
+    def page_count(self):
+        return max(1, -(-len(self.matching()) // self.page_size))
+
+    def turn_page(self, step):
+        page = min(max(self.page + step, 0), self.page_count() - 1)
+        if page != self.page:
+            self.page = page
+            self.dirty = True
+
+    def visible_rows(self):
+        self.page = min(self.page, self.page_count() - 1)
+        start = self.page * self.page_size
+        names = self.matching()[start:start + self.page_size]
+        self.visible = set(names)
+        self.dirty = False
+        return [f"{name}: {self.balances[name]}" for name in names]
+
+
+class AuctionServerGUI(tk.Tk):
+    def __init__(self, server, max_lines=1000, frame_rate=10):
+        super().__init__()
+        self.server = server
+        self.frame_interval = int(1000 / frame_rate)
+        self.bid_counts = collections.deque()
+        self.last_leader = None
+        self.title("拍卖服务器")
+        self.geometry("800x650") 
+        self.configure(bg="#eaeaea")
+
+        self.category_var = StringVar(self)
+        self.item_var = StringVar(self)
+
+        self.category_label = tk.Label(self, text="选择商品大类", bg="#eaeaea", font=("Arial", 12))
+        self.category_label.grid(row=0, column=0, padx=10, pady=10)
+        
+        self.category_menu = ttk.Combobox(self, textvariable=self.category_var, state="readonly", font=("Arial", 12))
+        self.category_menu.grid(row=0, column=1, padx=10, pady=10)
+        self.category_menu.bind("<<ComboboxSelected>>", self.load_items)
+
+        self.item_label = tk.Label(self, text="搜索商品", bg="#eaeaea", font=("Arial", 12))
+        self.item_label.grid(row=1, column=0, padx=10, pady=10)
+
+        # 商品名可直接输入，下拉框只显示搜索结果的前 search_limit 项，{商品名: 大类}
+        self.search_limit = 20
+        self.search_results = {}
+        self.search_job = None
+        self.item_menu = ttk.Combobox(self, textvariable=self.item_var, font=("Arial", 12))
+        self.item_menu.grid(row=1, column=1, padx=10, pady=10)
+        self.item_menu.bind("<KeyRelease>", self.schedule_search)
+
+        self.auction_info = LogPane(self, max_lines, width=50, height=15, font=("Arial", 10))
+        self.auction_info.grid(row=2, column=0, columnspan=2, padx=10, pady=10)
+
+        self.transaction_info = LogPane(self, max_lines, width=30, height=10, font=("Arial", 10))
+        self.transaction_info.grid(row=2, column=2, padx=10, pady=10)
+
+        self.completed_transactions_info = LogPane(self, max_lines, width=30, height=10, font=("Arial", 10))
+        self.completed_transactions_info.grid(row=3, column=2, padx=10, pady=10)
+
+        self.client_label = tk.Label(self, text="在线客户:", bg="#eaeaea", font=("Arial", 12))
+        self.client_label.grid(row=0, column=2, padx=10, pady=10)
+
+        # 列表框只保存当前页的行，服务器推送的是逐行变化
+        self.client_table = ClientTable(page_size=10)
+        self.shown_rows = []
+        self.client_frame = tk.Frame(self, bg="#eaeaea")
+        self.client_frame.grid(row=1, column=2, padx=10, pady=10)
+
+        self.client_filter_var = StringVar(self)
+        self.client_filter_var.trace_add('write', lambda *args: self.client_table.set_filter(self.client_filter_var.get()))
+        tk.Entry(self.client_frame, textvariable=self.client_filter_var, width=30).pack()
+
+        self.client_list = tk.Listbox(self.client_frame, width=30, height=self.client_table.page_size, font=("Arial", 12))
+        self.client_list.pack()
+
+        self.page_frame = tk.Frame(self.client_frame, bg="#eaeaea")
+        self.page_frame.pack()
+        tk.Button(self.page_frame, text="上一页", command=lambda: self.client_table.turn_page(-1)).pack(side=tk.LEFT)
+        self.page_label = tk.Label(self.page_frame, text="1/1", bg="#eaeaea")
+        self.page_label.pack(side=tk.LEFT, padx=10)
+        tk.Button(self.page_frame, text="下一页", command=lambda: self.client_table.turn_page(1)).pack(side=tk.LEFT)
+
+        self.start_button = tk.Button(self, text="开始拍卖", command=self.start_auction, font=("Arial", 12), bg="#4CAF50", fg="white")
+        self.start_button.grid(row=3, column=0, padx=10, pady=10)
+
+        self.transaction_button = tk.Button(self, text="交易", command=self.complete_transaction, font=("Arial", 12), bg="#008CBA", fg="white")
+        self.transaction_button.grid(row=3, column=1, padx=10, pady=10)
+
+        self.start_category_button = tk.Button(self, text="整类开拍", command=self.start_category, font=("Arial", 12), bg="#4CAF50", fg="white")
+        self.start_category_button.grid(row=4, column=0, padx=10, pady=10)
+
+        self.summary_label = tk.Label(self, text="出价: 0.0 次/秒", bg="#eaeaea", font=("Arial", 12), anchor='w')
+        self.summary_label.grid(row=4, column=1, columnspan=2, padx=10, pady=10, sticky='w')
+
+        # 服务器通过事件流通知界面，界面按固定帧率在 Tk 主线程中批量取出并重绘一次
+        self.events = self.server.events.subscribe(maxsize=100000)
+        for username, balance in self.server.client_rows():
+            self.client_table.upsert(username, balance)
+        self.load_categories()
+        self.after(self.frame_interval, self.poll_events)
+
+    def poll_events(self):
+        leaders = {}
+        transactions = []
+        now = time.monotonic()
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+            kind = event[0]
+            if kind == 'auction':
+                leaders[event[1]] = event[2:]
+            elif kind == 'client_added' or kind == 'client_balance':
+                self.client_table.upsert(event[1], event[2])
+            elif kind == 'client_removed':
+                self.client_table.remove(event[1])
+            elif kind == 'transaction':
+                transactions.append(event[1:])
+            elif kind == 'bids':
+                self.bid_counts.append((now, event[1]))
+        self.update_auction_info(leaders)
+        if self.client_table.dirty:
+            self.update_client_list()
+        self.update_transaction_info(transactions)
+        self.update_summary(now)
+        self.after(self.frame_interval, self.poll_events)
+
+    def load_categories(self):
+        self.category_menu['values'] = self.server.catalog.categories()
+        self.category_var.set("")
+        self.item_var.set("")
+        self.item_menu['values'] = []
+
+    def load_items(self, event=None):
+        self.item_var.set("")
+        self.search_items()
+        if self.item_menu['values']:
+            self.item_menu.current(0)
+
+    def schedule_search(self, event=None):
+        # 连续输入时只在停顿后搜索一次
+        if event is not None and event.keysym in ('Up', 'Down', 'Return', 'Escape'):
+            return
+        if self.search_job is not None:
+            self.after_cancel(self.search_job)
+        self.search_job = self.after(150, self.search_items)
+
+    def search_items(self):
+        self.search_job = None
+        results = self.server.catalog.search(self.item_var.get(), self.category_var.get() or None, self.search_limit)
+        self.search_results = {item: category for _, category, item in results}
+        self.item_menu['values'] = list(self.search_results)
+
+    def start_auction(self):
+        item = self.item_var.get()
+        if not item:
+            return
+        category = self.search_results.get(item)
+        if category is None:
+            found = self.server.catalog.lookup(item, self.category_var.get() or None)
+            category = found[1] if found else None
+        if category is None:
+            messagebox.showwarning("提示", f"目录中没有商品 '{item}'")
+            return
+        self.server.start_auction(category, item)
+
+    def start_category(self):
+        category = self.category_var.get()
+        if category:
+            self.server.start_catalog(category)
+
+    def complete_transaction(self):
+        # 选中的商品正在拍卖时结算该拍品，否则结算最近开拍的拍品
+        item = self.item_var.get()
+        category = self.search_results.get(item) or self.category_var.get() or None
+        self.server.complete_transaction(self.server.lot_for_item(item, category))
+
+    def update_auction_info(self, leaders):
+        # 每帧每个拍品最多一行
+        lines = []
+        for lot_id, (item, bid, winner) in leaders.items():
+            lines.append(f"[{lot_id}] 拍卖商品: '{item}'，当前价: {bid}。当前最高出价者: {winner}")
+            self.last_leader = (item, bid, winner)
+        self.auction_info.append_lines(lines)
+
+    def update_summary(self, now):
+        while self.bid_counts and self.bid_counts[0][0] < now - 1:
+            self.bid_counts.popleft()
+        rate = sum(count for _, count in self.bid_counts)
+        text = f"出价: {rate} 次/秒  进行中拍品: {len(self.server.lots)}"
+        if self.last_leader:
+            item, bid, winner = self.last_leader
+            text += f"  当前领先: '{item}' {winner} {bid}"
+        self.summary_label.config(text=text)
+
+    def update_client_list(self):
+        rows = self.client_table.visible_rows()
+        for index, row in enumerate(rows):
+            if index < len(self.shown_rows):
+                if self.shown_rows[index] == row:
+                    continue
+                self.client_list.delete(index)
+            self.client_list.insert(index, row)
+        if len(rows) < len(self.shown_rows):
+            self.client_list.delete(len(rows), tk.END)
+        self.shown_rows = rows
+        self.page_label.config(text=f"{self.client_table.page + 1}/{self.client_table.page_count()}")
+
+    def update_transaction_info(self, transactions):
+        self.transaction_info.append_lines([f"成交商品: '{item}'，成交价格: {price} 元" for item, price in transactions])
+        self.completed_transactions_info.append_lines([f"已成交商品: '{item}'，成交价格: {price} 元" for item, price in transactions])
+
+
+class StartupWindow(tk.Tk):
+    def __init__(self, on_submit, host='172.16.0.3', port=5200, mode='thread', workers=0):
+        super().__init__()
+        self.title("启动设置")
+        self.geometry("300x320")
+        self.configure(bg="#f0f0f0")
+        self.resizable(False, False)
+
+        self.host_var = StringVar(self)
+        self.port_var = StringVar(self)
+        self.mode_var = StringVar(self)
+        self.workers_var = StringVar(self)
+
+        tk.Label(self, text="服务器 IP 地址", bg="#f0f0f0").pack(pady=5)
+        tk.Entry(self, textvariable=self.host_var, width=30).pack(pady=5)
+
+        tk.Label(self, text="服务器 端口", bg="#f0f0f0").pack(pady=5)
+        port_entry = tk.Entry(self, textvariable=self.port_var, width=30)
+        port_entry.pack(pady=5)
+
+        tk.Label(self, text="服务器 模式", bg="#f0f0f0").pack(pady=5)
+        ttk.Combobox(self, textvariable=self.mode_var, values=('thread', 'asyncio'), state="readonly", width=27).pack(pady=5)
+
+        tk.Label(self, text="拍品分片进程数 (0 为单进程)", bg="#f0f0f0").pack(pady=5)
+        tk.Entry(self, textvariable=self.workers_var, width=30).pack(pady=5)
+
+        self.host_var.set(host)
+        self.port_var.set(str(port))
+        self.mode_var.set(mode)
+        self.workers_var.set(str(workers))
+        self.defaults = (host, str(port), str(workers))
+
+        tk.Button(self, text="启动服务器", command=self.submit).pack(pady=20)
+
+        self.on_submit = on_submit
+
+    def submit(self):
+        host = self.host_var.get() or self.defaults[0]
+        port = self.port_var.get() or self.defaults[1]
+        workers = self.workers_var.get() or self.defaults[2]
+        if port.isdigit() and workers.isdigit():
+            port = int(port)
+            mode = self.mode_var.get() or 'thread'
+            self.destroy()
+            self.on_submit(host, port, mode, int(workers))
+        else:
+            messagebox.showerror("错误", "端口号和分片进程数必须为数字！")
+
+
+def run_gui(options):
+    """options 为 serve.parse_args() 的结果，启动窗口以其中的地址、端口、模式和分片数为初始值"""
+    def start_server(host, port, mode, workers):
+        server = build_server(options, host, port, mode, workers)
+        start_services(server, options)
+        auction_gui = AuctionServerGUI(server)
+        threading.Thread(target=server.run, daemon=True).start()
+        auction_gui.mainloop()
+
+    StartupWindow(start_server, options.host, options.port, options.mode, options.workers).mainloop()
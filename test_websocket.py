@@ -1,15 +1,86 @@
+"""WebSocket 网关连通性检查: 握手(请求压缩)、以文本协议登录、发送一条命令，打印收到的消息。
+
+用法: python test_websocket.py [主机] [端口] [用户名] [命令]
+例如: python test_websocket.py 127.0.0.1 5203 guest "SUB 1"
+"""
+import base64
+import os
 import socket
+import sys
+import zlib
+
+from gateway import DEFLATE_TAIL, OP_CLOSE, OP_TEXT, accept_key, encode_frame
+
+HOST = '127.0.0.1'  # 服务器 IP
+PORT = 5203         # WebSocket 网关端口
+
+
+def receive_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("服务器关闭了连接")
+        data += chunk
+    return data
+
+
+def handshake(sock, host, port):
+    key = base64.b64encode(os.urandom(16)).decode('ascii')
+    request = (f"GET / HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+               f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n"
+               f"Sec-WebSocket-Extensions: permessage-deflate; client_max_window_bits\r\n\r\n")
+    sock.sendall(request.encode('latin-1'))
+    response = b''
+    while b'\r\n\r\n' not in response:
+        response += receive_exactly(sock, 1)
+    head = response.decode('latin-1')
+    if ' 101 ' not in head.split('\r\n')[0] or accept_key(key) not in head:
+        raise ConnectionError(f"握手失败: {head.splitlines()[0]}")
+    return 'permessage-deflate' in head
 
-HOST = '14.145.48.186'  # 服务器 IP
-PORT = 5003              # 服务器端口
 
-with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+def read_message(sock):
+    first, second = receive_exactly(sock, 2)
+    length = second & 0x7F
+    if length == 126:
+        length = int.from_bytes(receive_exactly(sock, 2), 'big')
+    elif length == 127:
+        length = int.from_bytes(receive_exactly(sock, 8), 'big')
+    payload = receive_exactly(sock, length)
+    if first & 0x40:
+        payload = zlib.decompressobj(-15).decompress(payload + DEFLATE_TAIL)
+    return first & 0x0F, payload
+
+
+def send_text(sock, text):
+    sock.sendall(encode_frame(OP_TEXT, text.encode('utf-8'), mask=os.urandom(4)))
+
+
+def main(argv):
+    host = argv[1] if len(argv) > 1 else HOST
+    port = int(argv[2]) if len(argv) > 2 else PORT
+    username = argv[3] if len(argv) > 3 else 'guest'
+    command = argv[4] if len(argv) > 4 else None
     try:
-        s.connect((HOST, PORT))
-        s.sendall(b"Test connection")  # 只使用 ASCII 字符
-        response = s.recv(1024)
-        print("收到响应:", response.decode())
+        with socket.create_connection((host, port), timeout=5) as sock:
+            print("压缩:", "已协商" if handshake(sock, host, port) else "未协商")
+            send_text(sock, f"{username},0")
+            if command:
+                send_text(sock, command)
+            while True:
+                opcode, payload = read_message(sock)
+                if opcode == OP_CLOSE:
+                    print("服务器关闭了连接")
+                    break
+                print("收到消息:", payload.decode('utf-8', errors='replace'))
+    except socket.timeout:
+        pass
     except ConnectionRefusedError:
         print("连接失败: 服务器未启动或端口未开放")
     except Exception as e:
         print(f"发生错误: {e}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
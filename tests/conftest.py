@@ -0,0 +1,28 @@
+import os
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def wait_sequencer(server):
+    """等序列器处理完此前提交的所有操作"""
+    done = threading.Event()
+    server.sequencer.submit(done.set)
+    assert done.wait(5)
+
+
+@pytest.fixture
+def make_server(monkeypatch):
+    """在仓库目录下创建不监听端口的服务器，商品目录从 auction_items.json 读取"""
+    from serve import AuctionServer
+    monkeypatch.chdir(ROOT)
+    return lambda **options: AuctionServer('127.0.0.1', 0, 'thread', bid_tick=0.001, **options)
+
+
+@pytest.fixture
+def server(make_server):
+    return make_server()
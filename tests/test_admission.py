@@ -0,0 +1,59 @@
+from admission import Admission, TokenBucket
+
+
+def test_bucket_allows_a_burst_then_refills_at_rate():
+    bucket = TokenBucket(rate=10, burst=3, now=0.0)
+    assert [bucket.take(0.0) for _ in range(4)] == [True, True, True, False]
+    # 0.1 秒补回一个令牌
+    assert not bucket.take(0.05)
+    assert bucket.take(0.1)
+    assert not bucket.take(0.1)
+    # 空闲再久也只回满到 burst
+    assert [bucket.take(100.0) for _ in range(4)] == [True, True, True, False]
+
+
+def test_zero_rate_means_unlimited():
+    bucket = TokenBucket(rate=0, burst=0, now=0.0)
+    assert all(bucket.take(0.0) for _ in range(1000))
+
+
+def test_user_limit_is_shared_across_connections():
+    admission = Admission(conn_rate=0, user_rate=0.001, user_burst=3)
+    first, second = admission.bucket(), admission.bucket()
+    assert admission.admit(first, 'alice') is None
+    assert admission.admit(second, 'alice') is None
+    assert admission.admit(first, 'alice') is None
+    assert admission.admit(second, 'alice') == 'user'
+    assert admission.admit(first, 'alice') == 'user'
+    # 其他用户不受影响
+    assert admission.admit(second, 'bob') is None
+
+
+def test_connection_limit_counts_consecutive_drops():
+    admission = Admission(conn_rate=0.001, conn_burst=2, user_rate=0)
+    bucket = admission.bucket()
+    assert admission.admit(bucket, 'alice') is None
+    assert admission.admit(bucket, 'alice') is None
+    assert admission.admit(bucket, 'alice') == 'connection'
+    assert admission.admit(bucket, 'alice') == 'connection'
+    assert bucket.dropped == 2
+    # 另一个连接有自己的桶
+    assert admission.admit(admission.bucket(), 'alice') is None
+
+
+def test_connections_per_address_are_capped():
+    admission = Admission(max_per_address=2)
+    assert admission.connect('10.0.0.1')
+    assert admission.connect('10.0.0.1')
+    assert not admission.connect('10.0.0.1')
+    assert admission.connect('10.0.0.2')
+    admission.disconnect('10.0.0.1')
+    assert admission.connect('10.0.0.1')
+    assert not admission.connect('10.0.0.1')
+
+
+def test_server_rejects_connections_over_the_address_cap(make_server):
+    server = make_server(max_conns_per_address=1)
+    assert server.admit_connection(('10.0.0.1', 5000))
+    assert not server.admit_connection(('10.0.0.1', 5001))
+    assert server.m_throttled.values == {'address': 1}
@@ -0,0 +1,42 @@
+import socket
+
+import pytest
+
+from conftest import wait_sequencer
+from control import ControlServer
+
+
+@pytest.fixture
+def control(server):
+    control = ControlServer(server, port=0)
+    yield control
+    control.tcp_server.server_close()
+
+
+def test_sealed_arguments_are_checked_before_replying(control, server):
+    assert control.execute('SEALED third').startswith('ERROR')
+    assert control.execute('SEALED first -5').startswith('ERROR')
+    assert control.execute('SEALED first nan').startswith('ERROR')
+    assert control.execute('SEALED_CLOSE').startswith('ERROR')
+    wait_sequencer(server)
+    assert server.sealed is None
+
+    assert control.execute('SEALED first 30') == 'OK'
+    wait_sequencer(server)
+    assert server.sealed.pricing == 'first'
+    assert control.execute('SEALED second').startswith('ERROR')
+    assert control.execute('SEALED_CLOSE') == 'OK'
+    wait_sequencer(server)
+    assert server.sealed is None
+
+
+def test_error_replies_over_the_control_port(control):
+    control.start()
+    try:
+        with socket.create_connection(control.tcp_server.server_address, timeout=5) as conn:
+            conn.sendall('SEALED first soon\nSEALED vickrey\nQUIT\n'.encode('utf-8'))
+            replies = conn.makefile(encoding='utf-8').read().splitlines()
+    finally:
+        control.tcp_server.shutdown()
+    assert len(replies) == 2
+    assert all(reply.startswith('ERROR') for reply in replies)
@@ -0,0 +1,152 @@
+import struct
+
+import pytest
+
+import gateway
+from conftest import wait_sequencer
+from gateway import WebSocketSession, apply_mask, compress, decompress, encode_frame, negotiate_deflate
+
+MASK = b'\x37\xfa\x21\x3d'
+
+
+class FakeTransport:
+    def __init__(self):
+        self.written = []
+        self.closed = False
+
+    def get_extra_info(self, name):
+        return ('127.0.0.1', 40000)
+
+    def write(self, data):
+        self.written.append(bytes(data))
+
+    def get_write_buffer_size(self):
+        return 0
+
+    def close(self):
+        self.closed = True
+
+    abort = close
+
+
+class FakeGateway:
+    """只保留会话用到的部分，发给会话的消息直接收集起来"""
+
+    def __init__(self, server):
+        self.server = server
+        self.max_bytes = 1 << 20
+        self.sessions = 0
+        self.posted = []
+
+    def post(self, session, data):
+        self.posted.append(data)
+
+    def call(self, func, *args):
+        func(*args)
+
+
+def parse_frame(data):
+    first, second = data[0], data[1]
+    length, offset = second & 0x7F, 2
+    if length == 126:
+        length, offset = struct.unpack_from('>H', data, 2)[0], 4
+    elif length == 127:
+        length, offset = struct.unpack_from('>Q', data, 2)[0], 10
+    return first, data[offset:offset + length]
+
+
+def test_accept_key_matches_rfc_example():
+    assert gateway.accept_key('dGhlIHNhbXBsZSBub25jZQ==') == 's3pPLMBiTxaQ9kYGzzhZRbK+xOo='
+
+
+def test_masking_matches_rfc_example_and_round_trips():
+    assert encode_frame(gateway.OP_TEXT, b'Hello', mask=MASK) == bytes.fromhex('818537fa213d7f9f4d5158')
+    payload = bytes(range(256)) * 3
+    assert apply_mask(apply_mask(payload, MASK), MASK) == payload
+    assert apply_mask(b'', MASK) == b''
+
+
+@pytest.mark.parametrize('length, header', [(125, 2), (126, 4), (65535, 4), (65536, 10)])
+def test_frame_length_encodings(length, header):
+    data = encode_frame(gateway.OP_BINARY, b'x' * length)
+    assert len(data) == header + length
+    assert parse_frame(data) == (0x80 | gateway.OP_BINARY, b'x' * length)
+
+
+def test_deflate_round_trip_and_limit():
+    payload = "拍卖开始: 华工陈奕迅 起拍价为 10。".encode('utf-8') * 20
+    compressed = compress(payload)
+    assert not compressed.endswith(gateway.DEFLATE_TAIL)
+    assert decompress(compressed, len(payload)) == payload
+    assert decompress(compressed, len(payload) - 1) is None
+    assert decompress(compress(payload, 9), len(payload)) == payload
+
+
+def test_negotiate_deflate():
+    assert negotiate_deflate('') == (None, None)
+    assert negotiate_deflate('permessage-deflate; client_max_window_bits') == (
+        'permessage-deflate; server_no_context_takeover; client_no_context_takeover', 15)
+    # 第一个提议的窗口位数不支持，退回第二个
+    response, wbits = negotiate_deflate('permessage-deflate; server_max_window_bits=8, '
+                                        'permessage-deflate; server_max_window_bits=10')
+    assert wbits == 10 and response.endswith('server_max_window_bits=10')
+    assert negotiate_deflate('permessage-deflate; unknown=1') == (None, None)
+
+
+def open_session(server):
+    session = WebSocketSession(FakeGateway(server))
+    transport = FakeTransport()
+    session.connection_made(transport)
+    session.data_received(b'GET / HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                          b'Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\nSec-WebSocket-Version: 13\r\n'
+                          b'Sec-WebSocket-Extensions: permessage-deflate; client_max_window_bits\r\n\r\n')
+    return session, transport
+
+
+def client_frame(opcode, payload, fin=True, compressed=False):
+    data = encode_frame(opcode, payload, compressed, MASK)
+    return data if fin else bytes((data[0] & 0x7F,)) + data[1:]
+
+
+def test_handshake_then_fragmented_and_deflated_frames(server):
+    session, transport = open_session(server)
+    response = transport.written[0].decode('latin-1')
+    assert response.startswith('HTTP/1.1 101 ')
+    assert 'Sec-WebSocket-Accept: s3pPLMBiTxaQ9kYGzzhZRbK+xOo=' in response
+    assert 'Sec-WebSocket-Extensions: permessage-deflate' in response
+    assert session.open and session.deflate == 15
+
+    server.start_auction('top', 'A')
+    wait_sequencer(server)
+    lot_id = server.current_lot
+    # 登录消息分成两片，第二片拆在两次读里
+    login = client_frame(gateway.OP_TEXT, b'alice,', fin=False) + client_frame(gateway.OP_CONTINUATION, b'1000')
+    session.data_received(login[:9])
+    session.data_received(login[9:])
+    assert session.username == 'alice'
+    wait_sequencer(server)
+
+    bid = f'BID {lot_id} 20'.encode('utf-8')
+    session.data_received(client_frame(gateway.OP_TEXT, compress(bid), compressed=True))
+    wait_sequencer(server)
+    assert server.lot_status[lot_id]['winner'] == 'alice'
+    assert session.gateway.posted
+
+    session.data_received(client_frame(gateway.OP_PING, b'hi'))
+    assert parse_frame(transport.written[-1]) == (0x80 | gateway.OP_PONG, b'hi')
+    assert not transport.closed
+
+
+def test_unmasked_frame_closes_with_protocol_error(server):
+    session, transport = open_session(server)
+    session.data_received(encode_frame(gateway.OP_TEXT, b'alice,1000'))
+    assert transport.closed
+    assert parse_frame(transport.written[-1]) == (0x80 | gateway.OP_CLOSE, struct.pack('>H', 1002))
+
+
+def test_oversized_frame_is_rejected_from_its_header(server):
+    session, transport = open_session(server)
+    header = encode_frame(gateway.OP_BINARY, b'x' * (server.max_frame + 1), mask=MASK)[:8]
+    session.data_received(header)
+    assert transport.closed
+    assert parse_frame(transport.written[-1])[1] == struct.pack('>H', gateway.CLOSE_TOO_BIG)
@@ -0,0 +1,38 @@
+from journal import Journal
+
+
+def write_events(path, *names):
+    journal = Journal(path, commit_interval=0)
+    snapshot, events = journal.recover()
+    journal.start()
+    for name in names:
+        journal.append('note', name)
+    journal.close()
+    return events
+
+
+def test_torn_line_is_truncated_before_appending(tmp_path):
+    path = str(tmp_path / 'journal')
+    write_events(path, 'a', 'b')
+    # 崩溃: 最后一行只写了一半
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('[3,"note","c')
+
+    recovered = write_events(path, 'd', 'e')
+    assert [event[2] for event in recovered] == ['a', 'b']
+
+    recovered = write_events(path)
+    assert recovered == [[1, 'note', 'a'], [2, 'note', 'b'], [3, 'note', 'd'], [4, 'note', 'e']]
+
+    recovered = write_events(path)
+    assert [event[0] for event in recovered] == [1, 2, 3, 4]
+
+
+def test_line_without_newline_is_treated_as_torn(tmp_path):
+    path = str(tmp_path / 'journal')
+    write_events(path, 'a')
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('[2,"note","b"]')
+
+    write_events(path, 'c')
+    assert write_events(path) == [[1, 'note', 'a'], [2, 'note', 'c']]
@@ -0,0 +1,90 @@
+from conftest import wait_sequencer
+from ledger import Ledger
+
+
+def make_ledger(**balances):
+    ledger = Ledger()
+    for username, balance in balances.items():
+        ledger.open(username, balance)
+    return ledger
+
+
+def test_leading_bid_holds_funds_until_outbid():
+    ledger = make_ledger(alice=1000, bob=1000)
+    assert ledger.reserve(1, 'alice', 300)
+    assert ledger.available_of('alice') == 700
+    assert ledger.balance_of('alice') == 1000
+    assert ledger.holder(1) == 'alice'
+
+    # 被超过时原领先者的冻结同时解除
+    assert ledger.reserve(1, 'bob', 400)
+    assert ledger.available_of('alice') == 1000
+    assert ledger.available_of('bob') == 600
+    assert ledger.holder(1) == 'bob'
+
+    # 领先者自己加价只冻结差额
+    assert ledger.spendable('bob', 1) == 1000
+    assert ledger.reserve(1, 'bob', 900)
+    assert ledger.available_of('bob') == 100
+
+
+def test_funds_cannot_be_committed_to_several_lots():
+    ledger = make_ledger(alice=500)
+    assert ledger.reserve(1, 'alice', 300)
+    assert ledger.spendable('alice', 2) == 200
+    assert not ledger.reserve(2, 'alice', 300)
+    assert ledger.holder(2) is None
+    assert ledger.available_of('alice') == 200
+    assert ledger.reserve(2, 'alice', 200)
+    assert ledger.available_of('alice') == 0
+
+
+def test_settle_releases_the_hold_before_charging():
+    ledger = make_ledger(alice=500)
+    ledger.reserve(1, 'alice', 300)
+    assert ledger.settle(1, 'alice', 300)
+    assert ledger.available_of('alice') == 200
+    assert ledger.balance_of('alice') == 200
+    assert ledger.holder(1) is None
+    assert not ledger.settle(2, 'alice', 300)
+    assert not ledger.settle(2, 'nobody', 1)
+
+
+def test_server_rejects_over_commitment_across_lots(server):
+    server.start_auction('top', 'A')
+    server.start_auction('top', 'B')
+    server.sequencer.submit(server.ledger.open, 'alice', 500)
+    wait_sequencer(server)
+    first, second = sorted(server.lots)
+    server.process_bid('alice', first, 300)
+    server.process_bid('alice', second, 300)
+    wait_sequencer(server)
+    assert server.lot_status[first]['winner'] == 'alice'
+    assert server.lot_status[second]['winner'] is None
+    assert server.m_bids_rejected.values == {'low': 1}
+    assert server.ledger.available_of('alice') == 200
+
+
+def test_journal_replay_restores_holds(make_server, tmp_path):
+    path = str(tmp_path / 'journal')
+    first_server = make_server(journal_path=path)
+    first_server.start_auction('top', 'A')
+    first_server.start_auction('top', 'B')
+    for username in ('alice', 'bob'):
+        first_server.sequencer.submit(first_server.ledger.open, username, 1000)
+        first_server.sequencer.submit(first_server.record, 'account', username, 1000)
+    wait_sequencer(first_server)
+    first, second = sorted(first_server.lots)
+    first_server.process_bid('alice', first, 300)
+    first_server.process_bid('alice', second, 200)
+    first_server.process_bid('bob', second, 400)
+    wait_sequencer(first_server)
+    first_server.journal.close()
+
+    restored = make_server(journal_path=path)
+    assert restored.ledger.holder(first) == 'alice'
+    assert restored.ledger.holder(second) == 'bob'
+    assert restored.ledger.available_of('alice') == 700
+    assert restored.ledger.balance_of('alice') == 1000
+    assert restored.ledger.available_of('bob') == 600
+    restored.journal.close()
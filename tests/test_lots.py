@@ -0,0 +1,128 @@
+from lots import LotShard, increment
+from conftest import wait_sequencer
+
+
+def open_account(server, username, balance):
+    server.sequencer.submit(server.ledger.open, username, balance)
+
+
+def test_same_item_in_two_lots_keeps_separate_state(server):
+    server.start_auction('top', '华工陈奕迅')
+    server.start_auction('jug', '华工陈奕迅')
+    open_account(server, 'alice', 1000)
+    open_account(server, 'bob', 1000)
+    wait_sequencer(server)
+    first, second = sorted(server.lots)
+
+    server.process_bid('alice', first, 100)
+    server.process_bid('bob', second, 50)
+    wait_sequencer(server)
+    assert server.lot_status[first]['winner'] == 'alice'
+    assert server.lot_status[second]['winner'] == 'bob'
+    assert server.lot_for_item('华工陈奕迅', 'top') == first
+    assert server.lot_for_item('华工陈奕迅') == second
+
+    server.complete_transaction(first)
+    server.complete_transaction(second)
+    wait_sequencer(server)
+    assert not server.lots
+    assert server.ledger.balance_of('alice') == 900
+    assert server.ledger.balance_of('bob') == 950
+    assert server.ledger.available_of('bob') == 950
+    assert server.ledger.get('alice').won_items == ['华工陈奕迅']
+    assert server.ledger.get('bob').won_items == ['华工陈奕迅']
+
+
+def test_same_item_lots_survive_snapshot_and_journal(make_server, tmp_path):
+    path = str(tmp_path / 'journal')
+    first_server = make_server(journal_path=path)
+    first_server.start_auction('top', '华工陈奕迅')
+    first_server.start_auction('jug', '华工陈奕迅')
+    open_account(first_server, 'alice', 1000)
+    open_account(first_server, 'bob', 1000)
+    first_server.sequencer.submit(first_server.record, 'account', 'alice', 1000)
+    first_server.sequencer.submit(first_server.record, 'account', 'bob', 1000)
+    wait_sequencer(first_server)
+    first, second = sorted(first_server.lots)
+    first_server.process_bid('alice', first, 100)
+    wait_sequencer(first_server)
+    first_server.sequencer.submit(lambda: first_server.journal.snapshot(first_server.snapshot_state()))
+    first_server.process_bid('bob', second, 50)
+    wait_sequencer(first_server)
+    first_server.journal.close()
+
+    restored = make_server(journal_path=path)
+    assert restored.lots == {first: '华工陈奕迅', second: '华工陈奕迅'}
+    assert restored.lot_status[first]['winner'] == 'alice'
+    assert restored.lot_status[second]['winner'] == 'bob'
+    assert restored.ledger.available_of('alice') == 900
+    assert restored.ledger.available_of('bob') == 950
+    restored.journal.close()
+
+
+def test_settled_lot_is_dropped_from_live_state(server):
+    server.start_auction('top', '别惊讶')
+    open_account(server, 'alice', 1000)
+    wait_sequencer(server)
+    lot_id = server.current_lot
+    server.process_bid('alice', lot_id, 20)
+    server.complete_transaction(lot_id)
+    wait_sequencer(server)
+    assert lot_id not in server.lot_status
+    assert lot_id not in server.shards.local.lots
+    assert str(lot_id) not in server.snapshot_state()['lot_status']
+
+    server.process_bid('alice', lot_id, 30)
+    wait_sequencer(server)
+    assert server.m_bids_rejected.values.get('no_lot') == 1
+    assert server.ledger.available_of('alice') == 980
+
+
+def open_shard(start_bid=10):
+    shard = LotShard()
+    shard.open(1, '华工陈奕迅', start_bid)
+    return shard
+
+
+def test_two_proxies_fight_up_to_the_lower_maximum():
+    shard = open_shard()
+    assert shard.proxy(1, 'alice', 200, 1000) == ('ok', 'alice', 11)
+    # bob 的上限更高，只需比 alice 的上限多一个加价幅度
+    assert shard.proxy(1, 'bob', 300, 1000) == ('ok', 'bob', 205)
+    assert shard.proxy(1, 'alice', 250, 1000) == ('outbid', 'bob', 255)
+
+
+def test_equal_proxy_maximums_go_to_the_earlier_bidder():
+    shard = open_shard()
+    shard.proxy(1, 'alice', 200, 1000)
+    assert shard.proxy(1, 'bob', 200, 1000) == ('outbid', 'alice', 200)
+    # 领先者提高上限保留原来的顺序，价格随 bob 的上限跟到 205
+    assert shard.proxy(1, 'alice', 300, 1000) == ('ok', 'alice', 205)
+    assert shard.proxy(1, 'carol', 300, 1000) == ('outbid', 'alice', 300)
+
+
+def test_manual_bid_below_a_proxy_is_outbid_automatically():
+    shard = open_shard()
+    shard.proxy(1, 'alice', 200, 1000)
+    assert shard.bid(1, 'bob', 50, 1000) == ('outbid', 'alice', 51)
+    # 与代理上限持平时先登记的代理领先
+    assert shard.bid(1, 'bob', 200, 1000) == ('outbid', 'alice', 200)
+
+
+def test_manual_bid_above_a_proxy_leads():
+    shard = open_shard()
+    shard.proxy(1, 'alice', 200, 1000)
+    assert shard.bid(1, 'bob', 250, 1000) == ('ok', 'bob', 250)
+    assert shard.bid(1, 'carol', 250, 1000) == ('low', None, None)
+    assert shard.bid(1, 'carol', 300, 299) == ('low', None, None)
+
+
+def test_increment_table_boundaries():
+    for price, step in ((0, 1), (99, 1), (100, 5), (999, 5), (1000, 10), (4999, 10), (5000, 50), (9999, 50),
+                        (10000, 100), (99999, 100), (100000, 1000), (999999, 1000), (1000000, 10000), (10 ** 9, 10000)):
+        assert increment(price) == step
+    shard = open_shard(start_bid=990)
+    shard.proxy(1, 'alice', 2000, 10000)
+    # 价格跨过 1000 之后按新的幅度加价
+    assert shard.proxy(1, 'bob', 999, 10000) == ('outbid', 'alice', 1004)
+    assert shard.proxy(1, 'bob', 1500, 10000) == ('outbid', 'alice', 1510)
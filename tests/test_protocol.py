@@ -0,0 +1,90 @@
+import pytest
+
+import protocol
+from protocol import FrameDecoder, FrameTooLarge, frame
+
+
+def test_frame_split_across_reads():
+    data = frame(protocol.encode_bid(7, 120))
+    decoder = FrameDecoder()
+    # 长度前缀和负载都可能被拆开
+    assert decoder.feed(data[:2]) == []
+    assert decoder.feed(data[2:6]) == []
+    assert decoder.feed(data[6:]) == [protocol.encode_bid(7, 120)]
+    assert decoder.feed(b'') == []
+
+
+def test_several_frames_in_one_read():
+    payloads = [b'alice,100', b'BID 120', b'', b'EXIT']
+    data = b''.join(frame(payload) for payload in payloads)
+    decoder = FrameDecoder()
+    assert decoder.feed(data + frame(b'tail')[:3]) == payloads
+    assert decoder.feed(frame(b'tail')[3:]) == [b'tail']
+
+
+def test_frame_over_max_is_rejected_from_its_length_prefix():
+    decoder = FrameDecoder(max_frame=16)
+    assert decoder.feed(frame(b'x' * 16)) == [b'x' * 16]
+    with pytest.raises(FrameTooLarge):
+        # 只收到长度前缀就拒绝，不等负载
+        decoder.feed(protocol.LENGTH.pack(17))
+
+
+def test_codec_is_chosen_from_the_first_frame():
+    assert protocol.codec_for(protocol.encode_hello('alice', 100)).binary
+    assert protocol.codec_for(protocol.encode_resume('alice', 100, 0)).binary
+    assert not protocol.codec_for(b'alice,100').binary
+    assert not protocol.codec_for(b'alice,100,5,' + b'ab' * 16).binary
+
+
+def test_text_codec():
+    codec = protocol.TextCodec()
+    assert codec.decode_login(b'alice,100') == ('alice', 100, None, None)
+    assert codec.decode_login(b'alice,100,5,abcd') == ('alice', 100, 5, 'abcd')
+    assert codec.decode(b'BID 120') == ('BID', None, 120)
+    assert codec.decode(b'BID 3 120') == ('BID', 3, 120)
+    assert codec.decode(b'MAX 3 500') == ('MAX', 3, 500)
+    assert codec.decode(b'BALANCE 50') == ('BALANCE', 50)
+    assert codec.decode(b'SUB 3') == ('SUB', 3)
+    assert codec.decode(b'UNSUB 3') == ('UNSUB', 3)
+    assert codec.decode(b'EXIT') == ('EXIT',)
+    assert codec.decode(b'BID x')[:2] == ('INVALID', 'format')
+    assert codec.decode(b'SUB')[:2] == ('INVALID', 'format')
+    assert codec.decode(b'HELLO') == ('UNKNOWN', 'HELLO')
+
+
+def test_client_messages_round_trip():
+    codec = protocol.BinaryCodec()
+    token = 'ab' * protocol.TOKEN_BYTES
+    assert codec.decode_login(protocol.encode_hello('张三', 100)) == ('张三', 100, None, None)
+    assert codec.decode_login(protocol.encode_resume('张三', 100, 42)) == ('张三', 100, 42, None)
+    assert codec.decode_login(protocol.encode_resume('张三', 100, 42, token)) == ('张三', 100, 42, token)
+    assert codec.decode(protocol.encode_bid(7, 120)) == ('BID', 7, 120)
+    assert codec.decode(protocol.encode_bid(None, 120)) == ('BID', None, 120)
+    assert codec.decode(protocol.encode_max(7, 500)) == ('MAX', 7, 500)
+    assert codec.decode(protocol.encode_balance(50)) == ('BALANCE', 50)
+    assert codec.decode(protocol.encode_exit()) == ('EXIT',)
+    assert codec.decode(protocol.encode_sub(7)) == ('SUB', 7)
+    assert codec.decode(protocol.encode_unsub(7)) == ('UNSUB', 7)
+    assert codec.decode(protocol.encode_bid(7, 120)[:-1])[:2] == ('INVALID', 'format')
+    assert codec.decode(b'\x7f') == ('UNKNOWN', '7f')
+
+
+def test_server_messages_round_trip():
+    decode = protocol.decode_server_message
+    token = 'cd' * protocol.TOKEN_BYTES
+    assert decode(protocol.encode_text("你好")) == ('TEXT', "你好")
+    assert decode(protocol.encode_lot(7, '华工陈奕迅', 10)) == ('LOT', 7, '华工陈奕迅', 10)
+    assert decode(protocol.encode_leader(7, 'alice', 120, 9)) == ('LEADER', 7, 'alice', 120, 9)
+    assert decode(protocol.encode_winner(7, 120)) == ('WINNER', 7, 120)
+    assert decode(protocol.encode_sold(7, 'alice', 120)) == ('SOLD', 7, 'alice', 120)
+    assert decode(protocol.encode_end(7)) == ('END', 7)
+    assert decode(protocol.encode_balance_update(80, -20)) == ('BALANCE', 80, -20)
+    assert decode(protocol.encode_snapshot(9)) == ('SNAPSHOT', 9)
+    assert decode(protocol.encode_sync(9)) == ('SYNC', 9)
+    assert decode(protocol.encode_deadline(7, 1.5)) == ('DEADLINE', 7, 1.5)
+    assert decode(protocol.encode_deadline(7, -1)) == ('DEADLINE', 7, 0)
+    assert decode(protocol.encode_session(token)) == ('SESSION', token)
+    assert decode(protocol.encode_sequenced(9, protocol.encode_end(7))) == ('SEQ', 9, ('END', 7))
+    for reason in protocol.ERROR_CODES:
+        assert decode(protocol.encode_error(reason)) == ('ERROR', reason)
@@ -0,0 +1,98 @@
+import pytest
+
+import sealed
+from conftest import wait_sequencer
+from sealed import SealedRound
+
+
+@pytest.fixture(params=['numpy', 'rows'])
+def clearing(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(sealed, 'numpy', None)
+
+
+def two_lot_round(pricing):
+    round_ = SealedRound(pricing)
+    round_.add_lot(1, 10)
+    round_.add_lot(2, 10)
+    round_.bid('alice', 1, 100)
+    round_.bid('alice', 2, 100)
+    round_.bid('bob', 1, 50)
+    round_.bid('bob', 2, 50)
+    return round_
+
+
+def test_first_price_falls_back_when_budget_is_spent(clearing):
+    results = two_lot_round('first').clear({'alice': 100, 'bob': 100})
+    assert results == [(1, 'alice', 100), (2, 'bob', 50)]
+
+
+def test_second_price_uses_remaining_budget(clearing):
+    # alice 付 50 之后还剩 50，付不起第二个拍品上的 100，bob 成了唯一的有效出价
+    results = two_lot_round('second').clear({'alice': 100, 'bob': 100})
+    assert results == [(1, 'alice', 50), (2, 'bob', 10)]
+
+
+def test_second_price_ignores_rival_who_can_no_longer_pay(clearing):
+    round_ = SealedRound('second')
+    round_.add_lot(1, 10)
+    round_.add_lot(2, 10)
+    round_.bid('bob', 1, 80)
+    round_.bid('carol', 1, 60)
+    round_.bid('alice', 2, 90)
+    round_.bid('bob', 2, 70)
+    assert round_.clear({'alice': 100, 'bob': 100, 'carol': 100}) == [(1, 'bob', 60), (2, 'alice', 10)]
+
+
+def test_sealed_round_settles_every_payable_lot(server):
+    server.open_sealed('first')
+    server.start_auction('top', 'A')
+    server.start_auction('top', 'B')
+    for username in ('alice', 'bob'):
+        server.sequencer.submit(server.ledger.open, username, 100)
+    wait_sequencer(server)
+    first, second = sorted(server.lots)
+    for lot_id in (first, second):
+        server.process_bid('alice', lot_id, 100)
+        server.process_bid('bob', lot_id, 50)
+    wait_sequencer(server)
+
+    server.close_sealed()
+    wait_sequencer(server)
+    assert not server.lots
+    assert server.ledger.balance_of('alice') == 0
+    assert server.ledger.balance_of('bob') == 50
+    assert server.ledger.get('alice').won_items == ['A']
+    assert server.ledger.get('bob').won_items == ['B']
+    assert server.m_settlements.values == {'sold': 2}
+
+
+def test_clear_skips_lots_that_are_gone(clearing):
+    # 拍品 1 已经不存在，alice 在它上面的出价不占用余额
+    results = two_lot_round('first').clear({'alice': 100, 'bob': 100}, open_lots={2})
+    assert results == [(2, 'alice', 100)]
+
+
+def test_sealed_lot_cannot_be_settled_directly(server):
+    server.open_sealed('second')
+    server.start_auction('top', 'A')
+    for username in ('alice', 'bob'):
+        server.sequencer.submit(server.ledger.open, username, 100)
+    wait_sequencer(server)
+    lot_id, = server.lots
+    server.process_bid('alice', lot_id, 80)
+    server.process_bid('bob', lot_id, 60)
+    wait_sequencer(server)
+
+    server.complete_transaction(lot_id)
+    wait_sequencer(server)
+    assert lot_id in server.lots
+    assert server.m_settlements.values == {'sealed': 1}
+
+    server.close_sealed()
+    wait_sequencer(server)
+    assert not server.lots
+    assert server.ledger.balance_of('alice') == 40
+    assert server.ledger.get('alice').won_items == ['A']
@@ -0,0 +1,115 @@
+import protocol
+from conftest import wait_sequencer
+
+
+class RecordingChannel:
+    def __init__(self):
+        self.frames = []
+        self.closed = False
+
+    def send(self, data):
+        self.frames.extend(protocol.FrameDecoder().feed(data))
+        return True
+
+    def close(self):
+        self.closed = True
+
+    def messages(self):
+        return [protocol.decode_server_message(frame) for frame in self.frames]
+
+
+def login(server, username):
+    channel = RecordingChannel()
+    _, codec = server.login(channel, protocol.encode_hello(username, 1000))
+    wait_sequencer(server)
+    return channel, codec
+
+
+def test_sub_reply_is_sequenced_after_earlier_lot_updates(server):
+    server.start_auction('top', 'A')
+    channel, codec = login(server, 'alice')
+    lot_id = server.current_lot
+    server.process_bid('alice', lot_id, 20)
+    assert server.handle_frame('alice', channel, codec, protocol.encode_sub(lot_id))
+    wait_sequencer(server)
+    assert server.clients['alice']['lots'] == {lot_id}
+    # 订阅在出价之后处理，回复的当前价已经包含这次出价
+    assert ('LOT', lot_id, 'A', 20) in channel.messages()
+
+
+def test_sub_racing_a_settlement_does_not_disconnect(server):
+    server.start_auction('top', 'A')
+    channel, codec = login(server, 'alice')
+    lot_id = server.current_lot
+    sent = len(channel.frames)
+    server.complete_transaction(lot_id)
+    assert server.handle_frame('alice', channel, codec, protocol.encode_sub(lot_id))
+    wait_sequencer(server)
+    assert lot_id not in server.lots
+    assert server.clients['alice']['conn'] is channel
+    # 结算的通知之后不再回复已经结束的拍品
+    assert all(message[0] != 'LOT' for message in channel.messages()[sent:])
+
+    assert server.handle_frame('alice', channel, codec, protocol.encode_unsub(lot_id))
+    wait_sequencer(server)
+    assert server.clients['alice']['lots'] == set()
+
+
+def test_sub_from_a_replaced_connection_is_ignored(server):
+    server.start_auction('top', 'A')
+    old, codec = login(server, 'alice')
+    login(server, 'alice')
+    server.handle_frame('alice', old, codec, protocol.encode_sub(server.current_lot))
+    wait_sequencer(server)
+    assert server.clients['alice']['lots'] == set()
+
+
+def resume(server, username, token=None):
+    channel = RecordingChannel()
+    _, codec = server.login(channel, protocol.encode_resume(username, 1000, 0, token))
+    wait_sequencer(server)
+    return channel, codec
+
+
+def test_parked_session_survives_a_login_with_the_wrong_token(server):
+    events = server.events.subscribe(maxsize=0)
+    server.start_auction('top', 'A')
+    channel, codec = resume(server, 'alice')
+    token = server.clients['alice']['token']
+    server.handle_frame('alice', channel, codec, protocol.encode_sub(server.current_lot))
+    wait_sequencer(server)
+    server.remove_client('alice', channel)
+    assert 'alice' in server.parked
+
+    intruder, _ = resume(server, 'alice', 'ff' * protocol.TOKEN_BYTES)
+    assert 'alice' in server.parked
+    assert server.clients['alice']['conn'] is intruder
+    assert server.clients['alice']['lots'] == set()
+
+    # 带着原令牌重连仍能接管保留的会话，并挤掉用错误令牌登录的连接
+    owner, _ = resume(server, 'alice', token)
+    assert 'alice' not in server.parked
+    assert intruder.closed
+    assert server.clients['alice']['conn'] is owner
+    assert server.clients['alice']['lots'] == {server.current_lot}
+    server.expire_sessions()
+    kinds = []
+    while not events.empty():
+        kinds.append(events.get_nowait()[0])
+    assert 'client_removed' not in kinds
+
+
+def test_expiring_a_parked_session_keeps_the_active_login(server):
+    events = server.events.subscribe(maxsize=0)
+    channel, _ = resume(server, 'alice')
+    server.remove_client('alice', channel)
+    active, _ = resume(server, 'alice')
+    server.parked['alice']['parked_until'] = 0
+    server.sequencer.submit(server.expire_sessions)
+    wait_sequencer(server)
+    assert not server.parked
+    assert server.clients['alice']['conn'] is active
+    kinds = []
+    while not events.empty():
+        kinds.append(events.get_nowait()[0])
+    assert 'client_removed' not in kinds
@@ -0,0 +1,75 @@
+import time
+
+from conftest import wait_sequencer
+from timers import TimerWheel
+
+
+def test_timer_fires_at_or_after_its_deadline():
+    # 到期时刻向上取整到 tick，最多晚一个 tick，从不提前
+    wheel = TimerWheel(tick=0.1, slots=8)
+    wheel.schedule('a', 0.25)
+    wheel.schedule('b', 0.45)
+    assert wheel.advance(0.24) == []
+    assert wheel.advance(0.35) == ['a']
+    assert wheel.advance(0.44) == []
+    assert wheel.advance(0.55) == ['b']
+    assert len(wheel) == 0
+
+
+def test_deadline_in_the_past_fires_on_the_next_tick():
+    wheel = TimerWheel(tick=0.1, slots=8, now=5.0)
+    wheel.advance(5.55)
+    wheel.schedule('late', 4.0)
+    assert 'late' in wheel
+    assert wheel.advance(5.58) == []
+    assert wheel.advance(5.65) == ['late']
+
+
+def test_cancel():
+    wheel = TimerWheel(tick=0.1, slots=8)
+    wheel.schedule('a', 0.2)
+    wheel.cancel('a')
+    wheel.cancel('missing')
+    assert 'a' not in wheel
+    assert wheel.advance(1.0) == []
+
+
+def test_reschedule_replaces_the_deadline():
+    wheel = TimerWheel(tick=0.1, slots=8)
+    wheel.schedule('a', 0.25)
+    wheel.schedule('a', 0.55)
+    assert len(wheel) == 1
+    assert wheel.advance(0.45) == []
+    assert wheel.advance(0.65) == ['a']
+
+
+def test_long_stall_catches_up_in_deadline_order():
+    # 超过一圈的定时器要等转到对应的圈数
+    wheel = TimerWheel(tick=0.1, slots=4)
+    wheel.schedule('later', 2.05)
+    wheel.schedule('first', 0.15)
+    wheel.schedule('lap', 0.55)
+    assert wheel.advance(0.5) == ['first']
+    assert wheel.advance(10.0) == ['lap', 'later']
+
+
+def test_bid_in_soft_close_extends_the_deadline(make_server):
+    server = make_server(lot_duration=0.3, soft_close=0.3, extension=0.8, timer_tick=0.02)
+    server.sequencer.submit(server.ledger.open, 'alice', 1000)
+    server.start_auction('top', 'A')
+    wait_sequencer(server)
+    lot_id = server.current_lot
+    started = time.time()
+    server.process_bid('alice', lot_id, 20)
+    wait_sequencer(server)
+    assert server.deadlines[lot_id] >= started + 0.8
+
+    # 原来的截止时间已过，拍品仍在进行
+    time.sleep(0.5)
+    wait_sequencer(server)
+    assert lot_id in server.lots
+    while lot_id in server.lots and time.time() < started + 5:
+        time.sleep(0.05)
+    assert lot_id not in server.lots
+    assert time.time() >= started + 0.8
+    assert server.ledger.get('alice').won_items == ['A']
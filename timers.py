@@ -0,0 +1,54 @@
+import math
+
+
+class TimerWheel:
+    """哈希时间轮。
+
+    时间按 tick 切成格子，slots 个格子首尾相连；到期时刻落在第 n 个 tick 的定时器放进 n % slots 号格子，
+    超过一圈的定时器留在格子里等转到对应的圈数。登记、取消、改期都是 O(1)，
+    每推进一个 tick 只检查一个格子，与定时器总数无关。不加锁，只能在同一个线程里使用。
+    """
+
+    def __init__(self, tick=0.1, slots=1024, now=0.0):
+        self.tick = tick
+        self.slots = slots
+        self.origin = now
+        self.current = 0
+        self.wheel = [{} for _ in range(slots)]
+        # key -> 所在格子
+        self.timers = {}
+
+    def __len__(self):
+        return len(self.timers)
+
+    def __contains__(self, key):
+        return key in self.timers
+
+    def schedule(self, key, deadline):
+        """登记或改期: key 在 deadline 时刻到期，已存在的同名定时器被替换"""
+        self.cancel(key)
+        expire_tick = max(self.current + 1, math.ceil((deadline - self.origin) / self.tick))
+        slot = expire_tick % self.slots
+        self.wheel[slot][key] = expire_tick
+        self.timers[key] = slot
+
+    def cancel(self, key):
+        slot = self.timers.pop(key, None)
+        if slot is not None:
+            del self.wheel[slot][key]
+
+    def advance(self, now):
+        """推进到 now，返回这期间到期的 key，按到期先后排列"""
+        target = int((now - self.origin) / self.tick)
+        expired = []
+        while self.current < target:
+            self.current += 1
+            bucket = self.wheel[self.current % self.slots]
+            if not bucket:
+                continue
+            due = [key for key, expire_tick in bucket.items() if expire_tick <= self.current]
+            for key in due:
+                del bucket[key]
+                del self.timers[key]
+            expired.extend(due)
+        return expired